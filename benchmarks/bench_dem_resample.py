@@ -0,0 +1,104 @@
+# benchmark: resampleElevation / demToElevationImage, the DEM -> elevation image step of topo
+# compares the old scipy RegularGridInterpolator version (kept below as legacyResampleElevation)
+# with the separable float32 version in hyformulas.py: checks that both give the same elevations
+# (within a tolerance, inside the grid and extrapolated past its edges, and the same NaNs with
+# extrapolation off), then times both on a 3000-pixel hole
+#
+# run from the main project folder: python3 benchmarks/bench_dem_resample.py
+
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import hyformulas
+from hyformulas import ElevationGrid, LocalProjection, demToElevationImage, getHoleFrame, resampleElevation
+
+
+# the resampling as it was before it was made separable (a full grid of points through scipy)
+
+def legacyResampleElevation(grid, out_lats, out_lons, extrapolate=True):
+
+    interpolator = RegularGridInterpolator(
+        (grid.lats, grid.lons), grid.values,
+        method='linear', bounds_error=False, fill_value=None if extrapolate else np.nan
+    )
+
+    lat_grid, lon_grid = np.meshgrid(out_lats, out_lons, indexing='ij')
+
+    points = np.stack([lat_grid.ravel(), lon_grid.ravel()], axis=-1)
+
+    return interpolator(points).reshape(len(out_lats), len(out_lons)).astype(np.float32)
+
+
+# rolling ground around (30.2, -97.73) at roughly 1 m spacing - irregular lat spacing if asked for
+
+def makeGrid(rng, irregular=False):
+
+    if irregular:
+        lats = 30.2 + np.cumsum(rng.uniform(0.5, 1.5, 400)) * 1e-5
+        lons = -97.73 + np.arange(500) * 1e-5
+    else:
+        lats = np.arange(30.19, 30.23, 1e-5)
+        lons = np.arange(-97.76, -97.71, 1e-5)
+
+    values = 200 + 30 * np.sin(3000 * lats[:, None]) + 20 * np.cos(2500 * lons[None, :]) + rng.normal(0, 0.05, (len(lats), len(lons)))
+
+    return ElevationGrid(lats, lons, values.astype(np.float32))
+
+
+def timed(func, *args):
+
+    func(*args)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return result, elapsed, peak
+
+
+def main():
+
+    rng = np.random.default_rng(5)
+    tolerance = 1e-3  # meters
+
+    # correctness: inside the grid, past its edges, and exactly on its samples
+    grid = makeGrid(rng, irregular=True)
+    out_lats = np.concatenate([np.linspace(grid.lats[0] - 3e-5, grid.lats[-1] + 3e-5, 1160), grid.lats[:5]])
+    out_lons = np.concatenate([np.linspace(grid.lons[0] - 3e-5, grid.lons[-1] + 3e-5, 3000), grid.lons[-5:]])
+
+    for extrapolate in (True, False):
+        old = legacyResampleElevation(grid, out_lats, out_lons, extrapolate)
+        new = resampleElevation(grid, out_lats, out_lons, extrapolate)
+        assert (np.isnan(old) == np.isnan(new)).all(), extrapolate
+        diff = float(np.nanmax(np.abs(old - new)))
+        assert diff < tolerance, (extrapolate, diff)
+        print("extrapolate=%-5s max difference %.2g m over %d points" % (extrapolate, diff, new.size))
+
+    # timing: the elevation image for a 3000-pixel hole, cut out of a course-sized DEM
+    dem = makeGrid(rng)
+    projection = LocalProjection(30.21, -97.735)
+    frame = getHoleFrame(projection, [(30.200, -97.740), (30.204, -97.738), (30.208, -97.735)])
+
+    results = []
+    for name, func in [("legacy", legacyResampleElevation), ("separable", resampleElevation)]:
+        hyformulas.resampleElevation = func
+        image, elapsed, peak = timed(demToElevationImage, dem, frame)
+        results.append(image)
+        print("%-9s %s image %8.1f ms %7.1f MB peak" % (name, image.shape, elapsed * 1000, peak / 1e6))
+    hyformulas.resampleElevation = resampleElevation
+
+    print("max difference on the hole: %.2g m" % float(np.abs(results[0] - results[1]).max()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+# benchmark: filterArrayList, the per-hole feature filter
+# compares the old one-feature-at-a-time version (kept below as legacyFilterArrayList) with the
+# batched numpy version in hyformulas.py on random holes and features, and checks that both pick
+# exactly the same features
+#
+# run from the main project folder: python3 benchmarks/bench_filter.py
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hyformulas import filterArrayList, createHoleBoundingBox, getMidpoint, distToLine
+
+
+# the filter as it was before it was batched (one feature at a time, same rules)
+
+def legacyFilterArrayList(rotated_hole_array, feature_list, ypp, par, tee_box=0, fairway=0, filter_yards=50, small_filter=1, med_filter=1, draw_all_fairways=False):
+
+    if filter_yards == None:
+        return feature_list
+
+    bb_xmin, bb_ymin, bb_xmax, bb_ymax = createHoleBoundingBox(rotated_hole_array, ypp)
+
+    hole_node_list = rotated_hole_array.tolist()
+
+    green_center = hole_node_list[-1]
+    hole_origin = hole_node_list[0]
+
+    if len(hole_node_list) == 2:
+        midpoint = getMidpoint(green_center, hole_origin)
+    else:
+        midpoint = hole_node_list[1]
+
+    filtered_list = []
+
+    par4plus = 0 if par == 3 else 1
+
+    tee_box_filter = tee_box * (90/ypp + par4plus * (140/ypp))
+
+    small = filter_yards * small_filter
+    med = filter_yards * med_filter
+
+    for array in feature_list:
+
+        centroid = array.mean(axis=0)
+
+        x = float(centroid[0])
+        y = float(centroid[1])
+
+        nearest_tee = ((bb_ymax - y)*ypp < 75)
+        short_range = ((bb_ymax - y)*ypp < 150)
+
+        if par == 3:
+            nearest_tee = False
+            short_range = False
+
+        if x < bb_xmin or x > bb_xmax:
+            continue
+
+        if not (fairway and draw_all_fairways):
+            if y > bb_ymax or y < (bb_ymin + tee_box_filter):
+                continue
+
+        if fairway == 1:
+
+            pointlist = array.tolist()
+            maxpoint = minpoint = pointlist[0]
+
+            for point in pointlist:
+                if point[1] > maxpoint[1]:
+                    maxpoint = point
+                if point[1] < minpoint[1]:
+                    minpoint = point
+
+            if draw_all_fairways:
+                if maxpoint[1] < bb_ymin or minpoint[1] > bb_ymax:
+                    continue
+            else:
+                if maxpoint[1] > bb_ymax or minpoint[1] < bb_ymin:
+                    continue
+
+        if y < midpoint[1]:
+            dist_to_way = distToLine(centroid,midpoint,green_center,ypp)
+        else:
+            dist_to_way = distToLine(centroid,midpoint,hole_origin,ypp)
+
+        if nearest_tee:
+            if dist_to_way < small:
+                filtered_list.append(array)
+        elif short_range:
+            if dist_to_way < med:
+                filtered_list.append(array)
+        else:
+            if dist_to_way < filter_yards:
+                filtered_list.append(array)
+
+    return filtered_list
+
+
+# a rotated hole (tee at the bottom, green at the top) with features scattered around it
+
+def makeHole(rng, n_features, ypp=0.15):
+
+    length = rng.uniform(1000, 3000)
+    bend = rng.uniform(-300, 300)
+    hole = np.array([[1500.0, 3200.0], [1500.0 + bend, 3200.0 - length / 2], [1500.0, 3200.0 - length]])
+    if rng.random() < 0.3:
+        hole = hole[[0, 2]]
+
+    features = []
+    for i in range(n_features):
+        center = rng.uniform([0, 0], [3000, 3400])
+        n = int(rng.integers(1, 40))
+        angles = np.sort(rng.uniform(0, 2 * math.pi, n))
+        radius = rng.uniform(5, 300)
+        features.append(np.stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)], axis=1))
+
+    return hole, features, ypp
+
+
+def main():
+
+    rng = np.random.default_rng(7)
+
+    configs = [dict(filter_yards=50), dict(fairway=1, filter_yards=50), dict(fairway=1, filter_yards=50, draw_all_fairways=True),
+               dict(tee_box=1, filter_yards=50), dict(filter_yards=25), dict(filter_yards=50, small_filter=0.5, med_filter=0.75)]
+
+    # correctness: same features, in the same order, for every filter setting and par
+    checked = 0
+    for trial in range(200):
+        hole, features, ypp = makeHole(rng, 60)
+        for par in (3, 4, 5):
+            for kw in configs:
+                old = legacyFilterArrayList(hole, features, ypp, par, **kw)
+                new = filterArrayList(hole, features, ypp, par, **kw)
+                assert len(old) == len(new) and all(a is b for a, b in zip(old, new)), (trial, par, kw)
+                checked += 1
+    print("identical selections on", checked, "hole/filter combinations")
+
+    # timing: the eleven filter calls a hole makes, with a busy course's worth of features
+    hole, features, ypp = makeHole(rng, 2000)
+    for name, func in [("legacy", legacyFilterArrayList), ("batched", filterArrayList)]:
+        start = time.perf_counter()
+        for i in range(11):
+            func(hole, features, ypp, 4, fairway=i % 2, filter_yards=50)
+        print("%-8s %7.1f ms per hole (2000 features)" % (name, (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    main()
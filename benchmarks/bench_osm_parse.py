@@ -0,0 +1,157 @@
+# benchmark: parse time and peak memory of the Overpass response parsers
+# compares the old path (overpy parsing `out body;>;out skel qt;` XML) with the
+# `out geom` XML and JSON parsers in hyformulas.py, on a synthetic course next to a big
+# forest and a stretch of coastline
+#
+# run from the main project folder: python3 benchmarks/bench_osm_parse.py
+
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import overpy
+from hyformulas import parseOverpassGeomXml, parseOverpassGeomJson
+
+
+# build a fake course: (tags, [(lat, lon), ...]) for each way, plus some tree nodes
+
+def makeCourse(seed=1):
+
+    rng = random.Random(seed)
+    ways = []
+
+    def ring(lat, lon, radius, n):
+        pts = [(lat + radius * math.sin(2 * math.pi * i / n), lon + radius * math.cos(2 * math.pi * i / n)) for i in range(n)]
+        return pts + [pts[0]]
+
+    for i in range(18):
+        ways.append(({"golf": "hole", "ref": str(i + 1), "par": "4"}, [(30.0 + i * 0.001, -97.0), (30.0 + i * 0.001, -96.996)]))
+
+    for kind, count, size in [("bunker", 120, 40), ("fairway", 25, 150), ("green", 18, 60), ("tee", 60, 12)]:
+        for i in range(count):
+            ways.append(({"golf": kind}, ring(30.0 + rng.random() * 0.02, -97.0 + rng.random() * 0.01, 0.0002, size)))
+
+    # big forest polygons and a long coastline are what make the old path slow
+    for i in range(40):
+        ways.append(({"natural": "wood"}, ring(30.0 + rng.random() * 0.02, -97.0 + rng.random() * 0.01, 0.002, 2000)))
+
+    for i in range(20):
+        ways.append(({"natural": "coastline"}, [(30.02 + j * 1e-6, -97.0 + i * 0.0005 + j * 1e-7) for j in range(3000)]))
+
+    trees = [(30.0 + rng.random() * 0.02, -97.0 + rng.random() * 0.01) for i in range(3000)]
+
+    return ways, trees
+
+
+def tagsXml(tags):
+    return "".join('<tag k="%s" v="%s"/>' % (k, v) for k, v in tags.items())
+
+
+# the response to the old query: tagged elements first, then a separate skeleton node table
+
+def legacyXml(ways, trees):
+
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="Overpass API">']
+    node_id = 1
+    skeleton = []
+
+    for lat, lon in trees:
+        out.append('<node id="%d" lat="%.7f" lon="%.7f"><tag k="natural" v="tree"/></node>' % (node_id, lat, lon))
+        node_id += 1
+
+    for way_id, (tags, pts) in enumerate(ways, 1):
+        refs = []
+        for lat, lon in pts:
+            skeleton.append('<node id="%d" lat="%.7f" lon="%.7f"/>' % (node_id, lat, lon))
+            refs.append(node_id)
+            node_id += 1
+        out.append('<way id="%d">%s%s</way>' % (way_id, "".join('<nd ref="%d"/>' % r for r in refs), tagsXml(tags)))
+
+    out.extend(skeleton)
+    out.append("</osm>")
+    return "\n".join(out).encode("utf-8")
+
+
+def geomXml(ways, trees):
+
+    out = ['<?xml version="1.0" encoding="UTF-8"?>\n<osm version="0.6" generator="Overpass API">']
+    node_id = 1
+
+    for lat, lon in trees:
+        out.append('<node id="%d" lat="%.7f" lon="%.7f"><tag k="natural" v="tree"/></node>' % (node_id, lat, lon))
+        node_id += 1
+
+    for way_id, (tags, pts) in enumerate(ways, 1):
+        nds = []
+        for lat, lon in pts:
+            nds.append('<nd ref="%d" lat="%.7f" lon="%.7f"/>' % (node_id, lat, lon))
+            node_id += 1
+        out.append('<way id="%d">%s%s</way>' % (way_id, "".join(nds), tagsXml(tags)))
+
+    out.append("</osm>")
+    return "\n".join(out).encode("utf-8")
+
+
+def geomJson(ways, trees):
+
+    elements = []
+    node_id = 1
+
+    for lat, lon in trees:
+        elements.append({"type": "node", "id": node_id, "lat": round(lat, 7), "lon": round(lon, 7), "tags": {"natural": "tree"}})
+        node_id += 1
+
+    for way_id, (tags, pts) in enumerate(ways, 1):
+        elements.append({"type": "way", "id": way_id, "nodes": list(range(node_id, node_id + len(pts))),
+                         "geometry": [{"lat": round(lat, 7), "lon": round(lon, 7)} for lat, lon in pts], "tags": tags})
+        node_id += len(pts)
+
+    return json.dumps({"version": 0.6, "elements": elements}).encode("utf-8")
+
+
+# the old path also had to walk every way's nodes to get coordinates out of overpy
+
+def parseLegacy(data):
+
+    result = overpy.Overpass().parse_xml(data)
+    for way in result.ways:
+        [(float(node.lat), float(node.lon)) for node in way.nodes]
+    return result
+
+
+def measure(fn, data, repeats=3):
+
+    best = float("inf")
+    for i in range(repeats):
+        start = time.perf_counter()
+        result = fn(data)
+        best = min(best, time.perf_counter() - start)
+        del result
+
+    tracemalloc.start()
+    result = fn(data)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return best, peak
+
+
+if __name__ == "__main__":
+
+    ways, trees = makeCourse()
+    print("synthetic course:", len(ways), "ways,", sum(len(pts) for tags, pts in ways), "way nodes,", len(trees), "trees")
+
+    cases = [("overpy, out body;>;out skel qt; (old)", parseLegacy, legacyXml(ways, trees)),
+             ("out geom XML", parseOverpassGeomXml, geomXml(ways, trees)),
+             ("out geom JSON", parseOverpassGeomJson, geomJson(ways, trees))]
+
+    print("%-40s %12s %12s %14s" % ("parser", "response MB", "parse s", "peak mem MB"))
+    for name, fn, data in cases:
+        seconds, peak = measure(fn, data)
+        print("%-40s %12.1f %12.3f %14.1f" % (name, len(data) / 1e6, seconds, peak / 1e6))
@@ -0,0 +1,85 @@
+# benchmark: drawTrees, the tree symbols on a hole image
+# compares the old version (a circle and four lines drawn with cv2 for every tree, kept below as
+# legacyDrawTrees) with the sprite stamping in hyformulas.py on a 3000 x 3000 image, checks that
+# both draw the same pixels, and reports time and peak memory for each
+#
+# run from the main project folder: python3 benchmarks/bench_trees.py
+
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from hyformulas import drawTrees
+
+
+# the tree drawing as it was before the sprite (one tree at a time, same symbol)
+
+def legacyDrawTrees(image, feature_list, color):
+
+    for feature_nodes in feature_list:
+
+        x, y = np.int32(np.floor(feature_nodes)).reshape(2).tolist()
+
+        cv2.circle(image, (x, y), 50, color, thickness=6)
+
+        cv2.line(image, (x, y - 50), (x, y + 50), color, thickness=6)
+        cv2.line(image, (x - 50, y), (x + 50, y), color, thickness=6)
+
+        tr = (x + int(50 * math.cos(math.pi/4)), y + int(50 * math.sin(math.pi/4)))
+        bl = (x + int(50 * math.cos(5*math.pi/4)), y + int(50 * math.sin(5*math.pi/4)))
+        cv2.line(image, tr, bl, color, thickness=6)
+
+        tl = (x + int(50 * math.cos(3*math.pi/4)), y + int(50 * math.sin(3*math.pi/4)))
+        br = (x + int(50 * math.cos(7*math.pi/4)), y + int(50 * math.sin(7*math.pi/4)))
+        cv2.line(image, tl, br, color, thickness=6)
+
+
+# n trees scattered over (and a little past the edges of) the image, as drawTrees gets them
+
+def makeTrees(rng, n, size=3000):
+
+    return [rng.uniform(-40, size + 40, (1, 2)) for i in range(n)]
+
+
+def run(func, image, trees, color):
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(image, trees, color)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+
+    rng = np.random.default_rng(3)
+    color = (0, 130, 23)
+    background = np.full((3000, 3000, 3), (62, 187, 24), np.uint8)
+
+    for n in (500, 3000, 10000):
+
+        trees = makeTrees(rng, n)
+        results = []
+
+        for name, func in [("legacy", legacyDrawTrees), ("sprite", drawTrees)]:
+            image = background.copy()
+            elapsed, peak = run(func, image, trees, color)
+            results.append(image)
+            print("%-7s %6d trees %8.1f ms %7.1f MB peak" % (name, n, elapsed * 1000, peak / 1e6))
+
+        different = int(np.count_nonzero((results[0] != results[1]).any(axis=2)))
+        print("        %d pixels differ" % different)
+
+
+if __name__ == "__main__":
+    main()
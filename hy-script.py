@@ -32,6 +32,44 @@ lonmax = -97.7018   # maximum longitude (east)
 replace_existing = False
 
 
+# to read course data from a local OpenStreetMap extract instead of downloading it,
+# enter the path to a .osm or .osm.pbf file here (e.g. a regional extract from download.geofabrik.de)
+# .osm.pbf files need pyosmium (pip install osmium)
+
+osm_file = None
+
+
+# format to download OpenStreetMap data in: 'xml' (default) or 'json'
+# 'json' is faster to read on courses with lots of woods or coastline, but needs a bit more memory
+
+overpass_format = 'xml'
+
+
+# OpenStreetMap data is cached in the cache folder so re-running a course doesn't need the network
+# set refresh_osm_cache to True to download fresh data (e.g. after editing the course in OSM)
+
+refresh_osm_cache = False
+
+# how long cached OSM data stays valid (in hours), and how large the cache can grow (in MB)
+
+osm_cache_ttl_hours = 168
+osm_cache_max_mb = 200
+
+# elevation data (for topo) is cached in the cache folder too, as tiles shared between courses -
+# once a course's tiles are cached, topo works without the network
+# how large the elevation cache can grow (in MB)
+
+dem_cache_max_mb = 500
+
+# to read elevation data from a local DEM file instead of downloading it from USGS 3DEP (e.g. a
+# national LiDAR DEM, for courses outside the US), enter the path to the file here:
+# a GeoTIFF (.tif) in any projection, or a .npy grid of elevations in meters on a regular lat/lon
+# grid with a .json file of the same name giving its "origin": [lat, lon] and "step": [lat, lon]
+# in degrees (and optionally "nodata") - only the part of the file around the course is read
+
+dem_file = None
+
+
 # colors for each feature can be customized here
 
 fairway_color = '#34E884'
@@ -89,6 +127,42 @@ med_filter = (short_filter + 1) / 2
 include_trees = True
 
 
+# draw clusters of overlapping trees as one shaded canopy instead of stacked symbols
+# (useful for heavily treed courses where the individual symbols turn into noise)
+
+tree_canopy = False
+
+
+# toggle for a quick preview: holes are drawn at a quarter of the resolution (into the preview folder)
+# from a coarse DEM and without the green close-ups, but with the same features and distances as the
+# full render - handy for tuning hole_width, short_filter and the topo settings across a whole course
+
+preview = False
+
+
+# draw every hole at this many yards (or meters) per pixel instead of fitting each hole into a
+# 3000-pixel image - short holes get smaller images, and text and symbols are the same size on every
+# hole (e.g. 0.2; None keeps the default sizing)
+
+yards_per_pixel = None
+
+
+# file format for the hole and green images: "png", or "svg" / "pdf" for vector files that stay
+# sharp at any print size (and are much smaller)
+
+output_format = "png"
+
+
+# draw PNG holes a band at a time instead of as one whole image, so memory use stays small even for
+# very large images (e.g. a small yards_per_pixel) - the result looks the same, though lines along
+# the edges of shapes can land a pixel differently where they cross from one band to the next
+# this only bounds the drawing: with include_topo on, each hole's elevation and contours are still
+# worked out for the whole hole at once, so memory grows with the image size anyway - for a very
+# small yards_per_pixel, turn topo off (or expect topo to need several GB)
+
+tiled = False
+
+
 # toggle for showing distances in meters instead of yards
 
 in_meters = False
@@ -96,7 +170,7 @@ in_meters = False
 
 # toggle for topography/elevation contour lines
 # requires py3dep (pip install py3dep) - data is from free USGS 3DEP, no API key needed
-# note: 3DEP data covers the US only; contours will be silently skipped for international courses
+# note: 3DEP data covers the US only; for international courses, set dem_file above
 
 include_topo = True
 
@@ -139,4 +213,4 @@ green_topo_scale_m = 5.0
 
 if __name__ == "__main__":
     print('start: ', datetime.now().time())
-    book = generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filter_width=hole_width,short_factor=short_filter,med_factor=med_filter,include_trees=include_trees,in_meters=in_meters,include_topo=include_topo,topo_interval=topo_interval,include_topo_labels=include_topo_labels,topo_index_every=topo_index_every,green_topo_interval=green_topo_interval,green_topo_style=green_topo_style,green_topo_scale_m=green_topo_scale_m,draw_all_fairways=draw_all_fairways)
+    book = generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filter_width=hole_width,short_factor=short_filter,med_factor=med_filter,include_trees=include_trees,tree_canopy=tree_canopy,preview=preview,yards_per_pixel=yards_per_pixel,output_format=output_format,tiled=tiled,in_meters=in_meters,include_topo=include_topo,topo_interval=topo_interval,include_topo_labels=include_topo_labels,topo_index_every=topo_index_every,green_topo_interval=green_topo_interval,green_topo_style=green_topo_style,green_topo_scale_m=green_topo_scale_m,draw_all_fairways=draw_all_fairways,refresh_osm_cache=refresh_osm_cache,osm_cache_ttl_hours=osm_cache_ttl_hours,osm_cache_max_mb=osm_cache_max_mb,osm_file=osm_file,overpass_format=overpass_format,dem_cache_max_mb=dem_cache_max_mb,dem_file=dem_file)
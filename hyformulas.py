@@ -2,12 +2,26 @@ import overpy
 import numpy as np
 import cv2
 import math
-import statistics
 import imutils
 from scipy.spatial import distance as dist
-from scipy.interpolate import RegularGridInterpolator
 import os
+import hashlib
+import json
+import time
+import threading
+import queue
+import gzip
+import zlib
+import struct
+import base64
+import bz2
+import io
+import re
+import xml.etree.ElementTree as ET
+from urllib.request import urlopen
+from urllib.error import HTTPError
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 # convert hex to bgr format for numpy
 
@@ -23,393 +37,982 @@ def hexToBGR(hex):
 
 
 
-# given a list of coordinates, calculate the min and max longitude and latitude
+# raw Overpass responses are cached on disk, so re-rendering a course (e.g. after changing
+# colors or hole width) doesn't need to go back to the network
+# entries expire after a TTL, and the least recently used entries are evicted once the cache
+# grows past its size limit
 
-def getBoundingBoxLatLon(nodes):
+OSM_CACHE_DIR = os.path.join("cache", "osm")
+OSM_CACHE_TTL_HOURS = 24 * 7
+OSM_CACHE_MAX_MB = 200
 
-    minlat = 100
-    maxlat = -100
-    minlon = 360
-    maxlon = -360
+# Overpass servers we can download from, in our default order of preference
+# (overpy's default server is overpass-api.de)
 
-    for node in nodes:
-        minlat = float(min(minlat, node.lat))
-        maxlat = float(max(maxlat, node.lat))
-        minlon = float(min(minlon, node.lon))
-        maxlon = float(max(maxlon, node.lon))
+OVERPASS_URLS = ["https://overpass-api.de/api/interpreter", "https://overpass.kumi.systems/api/interpreter", "https://overpass.openstreetmap.ru/api/interpreter"]
 
-    return minlat, minlon, maxlat, maxlon
+# requests are hedged: if the best-ranked server hasn't answered within OVERPASS_HEDGE_DELAY seconds
+# (or an answer fails), the same query goes to the next server as well, and the first good response wins
+# each server's latency and failure rate are remembered across runs and used to rank the servers
 
+OVERPASS_TIMEOUT = 180
+OVERPASS_HEDGE_DELAY = 5
+OVERPASS_STATS_PATH = os.path.join("cache", "overpass_mirrors.json")
 
+_OVERPASS_REMARK = re.compile(rb"<remark>([^<>]*)</remark>")
 
-# function to get the golf holes contained within a given bounding box
 
-def getOSMGolfWays(bottom_lat, left_lon, top_lat, right_lon, printf=print):
+# every cache directory keeps a small json index of its entries (size, creation and last use times)
 
-    # create the coordinate string for our request - order is South, West, North, East
-    coord_string = str(bottom_lat) + "," + str(left_lon) + "," + str(top_lat) + "," + str(right_lon)
+def _loadCacheIndex(cache_dir):
+
+    try:
+        with open(os.path.join(cache_dir, "index.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _saveCacheIndex(cache_dir, index):
+
+    tmp_path = os.path.join(cache_dir, "index.json.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp_path, os.path.join(cache_dir, "index.json"))
+
+
+def _removeCacheEntry(cache_dir, index, name):
+
+    index.pop(name, None)
+    try:
+        os.remove(os.path.join(cache_dir, name))
+    except OSError:
+        pass
+
+
+# look up a file in a cache directory - returns its path, or None if it is missing or older than the TTL
+# (a hit counts as a use for LRU eviction)
+
+def lookupCacheEntry(cache_dir, name, ttl_hours=None):
+
+    index = _loadCacheIndex(cache_dir)
+    entry = index.get(name)
+    path = os.path.join(cache_dir, name)
+
+    if entry is None or not os.path.exists(path):
+        return None
+
+    now = time.time()
+
+    if ttl_hours is not None and now - entry["created"] > ttl_hours * 3600:
+        _removeCacheEntry(cache_dir, index, name)
+        _saveCacheIndex(cache_dir, index)
+        return None
+
+    entry["last_used"] = now
+    _saveCacheIndex(cache_dir, index)
+
+    return path
+
+
+# remove an entry from a cache directory (e.g. a file that turned out to be unreadable)
+
+def dropCacheEntry(cache_dir, name):
+
+    index = _loadCacheIndex(cache_dir)
+    _removeCacheEntry(cache_dir, index, name)
+    _saveCacheIndex(cache_dir, index)
+
+
+# record a file that has just been written to a cache directory, then evict the least
+# recently used entries until the whole cache fits within max_mb
+
+def registerCacheEntry(cache_dir, name, max_mb=None):
+
+    index = _loadCacheIndex(cache_dir)
+    now = time.time()
+
+    index[name] = {"created": now, "last_used": now, "size": os.path.getsize(os.path.join(cache_dir, name))}
+
+    if max_mb is not None:
+        total = sum(entry["size"] for entry in index.values())
+
+        for old_name in sorted(index, key=lambda n: index[n]["last_used"]):
+            if total <= max_mb * 1024 * 1024:
+                break
+            if old_name == name:
+                continue
+            total -= index[old_name]["size"]
+            _removeCacheEntry(cache_dir, index, old_name)
+
+    _saveCacheIndex(cache_dir, index)
+
+
+# send a query to a single Overpass server and return the raw response body
+# (raises the same overpy exceptions that overpy.Overpass.query would)
+
+def _fetchOverpassResponse(url, query, timeout=OVERPASS_TIMEOUT):
+
+    try:
+        f = urlopen(url, query.encode("utf-8"), timeout=timeout)
+    except HTTPError as e:
+        f = e
+
+    response = f.read()
+    f.close()
+
+    if f.code == 200:
+        return response
+    if f.code == 429:
+        raise overpy.exception.OverpassTooManyRequests()
+    if f.code == 504:
+        raise overpy.exception.OverpassGatewayTimeout()
+    if f.code == 400:
+        raise overpy.exception.OverpassBadRequest(query)
+
+    raise overpy.exception.OverpassUnknownHTTPStatusCode(f.code)
+
+
+# load the latency/failure history we keep for each Overpass server
+
+def _loadMirrorStats(stats_path):
+
+    try:
+        with open(stats_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _saveMirrorStats(stats_path, stats):
+
+    try:
+        os.makedirs(os.path.dirname(stats_path), exist_ok=True)
+        with open(stats_path, "w") as f:
+            json.dump(stats, f)
+    except OSError:
+        pass
+
+
+# fold one request into a server's history (exponentially weighted, so old runs fade out)
+# a request that was abandoned because another server answered first only tells us the server
+# is at least this slow, so it can only push the latency estimate up
+
+def _updateMirrorStats(stats, url, elapsed, failed, abandoned=False):
+
+    weight = 0.3
+    entry = stats.setdefault(url, {"latency": elapsed, "failure_rate": 0.0, "requests": 0})
+
+    if abandoned:
+        entry["latency"] = max(entry["latency"], (1 - weight) * entry["latency"] + weight * elapsed)
+        return
+
+    entry["failure_rate"] = (1 - weight) * entry["failure_rate"] + weight * (1.0 if failed else 0.0)
+    if not failed:
+        entry["latency"] = (1 - weight) * entry["latency"] + weight * elapsed
+    entry["requests"] += 1
+
+
+# rank servers by expected time to a good answer: a failure costs us roughly a full timeout
+# servers we have never used keep their default order, just ahead of any known-bad ones
+
+def rankOverpassMirrors(stats, urls=OVERPASS_URLS):
+
+    def score(url):
+        entry = stats.get(url)
+        if entry is None:
+            return OVERPASS_HEDGE_DELAY
+        return entry["latency"] + entry["failure_rate"] * OVERPASS_TIMEOUT
 
-    query = "(way['golf'='hole'](" + coord_string + "););out body;>;out skel qt;"
+    return sorted(urls, key=score)
+
+
+# send a query to the Overpass servers with staggered (hedged) requests and return the raw
+# response and parsed result from the first server that gives a good answer
+
+def fetchOverpassHedged(query, parse, stats_path=OVERPASS_STATS_PATH, urls=OVERPASS_URLS):
+
+    stats = _loadMirrorStats(stats_path)
+    mirrors = rankOverpassMirrors(stats, urls)
+
+    # wait a bit longer than the best server usually takes before hedging to the next one
+    best = stats.get(mirrors[0])
+    hedge_delay = OVERPASS_HEDGE_DELAY if best is None else max(2.0, 1.5 * best["latency"])
+
+    finished = queue.Queue()
+
+    # any error counts as a failed server (e.g. http.client.IncompleteRead isn't an OSError) -
+    # every thread has to report back, or we'd wait for it forever
+    def worker(url):
+        start = time.time()
+        try:
+            finished.put((url, _fetchOverpassResponse(url, query), None, time.time() - start))
+        except Exception as e:
+            finished.put((url, None, e, time.time() - start))
+
+    in_flight = {}
+    next_mirror = 0
+    last_launch = 0
+    answer = None
+
+    while next_mirror < len(mirrors) or in_flight:
+
+        if next_mirror < len(mirrors) and (not in_flight or time.time() - last_launch >= hedge_delay):
+            url = mirrors[next_mirror]
+            next_mirror += 1
+            last_launch = time.time()
+            in_flight[url] = last_launch
+            # daemon threads, so a slow loser doesn't hold up the program once we have an answer
+            threading.Thread(target=worker, args=(url,), daemon=True).start()
+
+        wait = None if next_mirror >= len(mirrors) else max(0, last_launch + hedge_delay - time.time())
 
-    # try the primary Overpass server first, then fall back to the mirror
-    for url in [None, "https://overpass.kumi.systems/api/interpreter", "https://overpass.openstreetmap.ru/api/interpreter", "https://overpass-api.de/api/interpreter"]:
         try:
-            op = overpy.Overpass() if url is None else overpy.Overpass(url=url)
-            return op.query(query)
-        except (overpy.exception.OverPyException, overpy.exception.OverpassGatewayTimeout):
+            url, response, error, elapsed = finished.get(timeout=wait)
+        except queue.Empty:
             continue
 
-    printf("An error occurred. Check whether your coordinates are correct, or try running this tool later.")
-    return None
+        del in_flight[url]
+
+        # a response that doesn't parse (e.g. an HTML error page, a truncated body, or anything that
+        # isn't JSON when we asked for JSON) is a failed server too, so we move on to the next one
+        if error is None:
+            try:
+                answer = (response, parse(response))
+            except (overpy.exception.OverPyException, ET.ParseError, ValueError) as e:
+                error = e
+
+        _updateMirrorStats(stats, url, elapsed, error is not None)
+
+        if answer is not None:
+            break
+
+        # a failed server shouldn't cost us the rest of the hedge delay - move on straight away
+        last_launch = 0
+
+    now = time.time()
+    for url, start in in_flight.items():
+        _updateMirrorStats(stats, url, now - start, False, abandoned=True)
+
+    _saveMirrorStats(stats_path, stats)
+
+    return answer
+
+
+# lightweight stand-ins for overpy's Node, Way, Relation and Result, built from Overpass `out geom`
+# output (or a local extract): every way carries its own coordinates as a float64 (N, 2) array of
+# (lat, lon), so nothing ever has to be looked up - or downloaded - node by node later on
+
+class GeomNode:
+
+    def __init__(self, node_id, lat, lon, tags=None):
+        self.id = node_id
+        self.lat = lat
+        self.lon = lon
+        self.tags = tags if tags is not None else {}
+
+
+class GeomWay:
+
+    def __init__(self, way_id, tags, node_ids, coords):
+        self.id = way_id
+        self.tags = tags
+        self.node_ids = node_ids
+        self.coords = coords
+
+    # node objects, for code written against overpy ways
+
+    @property
+    def nodes(self):
+        return [GeomNode(node_id, lat, lon) for node_id, (lat, lon) in zip(self.node_ids, self.coords.tolist())]
+
+    def get_nodes(self, resolve_missing=False):
+        return self.nodes
+
+
+class GeomMember:
+
+    def __init__(self, member_type, ref, role, coords=None):
+        self.type = member_type
+        self.ref = ref
+        self.role = role
+        self.coords = coords
+
+
+class GeomRelation:
+
+    def __init__(self, rel_id, tags, members):
+        self.id = rel_id
+        self.tags = tags
+        self.members = members
+
+
+class GeomResult:
+
+    def __init__(self, nodes=None, ways=None, relations=None):
+        self.nodes = nodes if nodes is not None else []
+        self.ways = ways if ways is not None else []
+        self.relations = relations if relations is not None else []
+        self._ways_by_id = {way.id: way for way in self.ways}
+
+    def get_way(self, way_id, resolve_missing=False):
+        try:
+            return self._ways_by_id[way_id]
+        except KeyError:
+            raise overpy.exception.DataIncomplete("Way " + str(way_id) + " is not part of this result")
+
+
+# get a way's coordinates as a float64 (N, 2) array of (lat, lon), for either kind of way
+
+def wayLatLons(way):
+
+    if hasattr(way, "coords"):
+        return way.coords
+
+    try:
+        node_list = way.nodes
+    except overpy.exception.DataIncomplete:
+        node_list = way.get_nodes(resolve_missing=True)
+
+    return np.array([(float(node.lat), float(node.lon)) for node in node_list], dtype=np.float64)
+
+
+def wayNodeIds(way):
+
+    if hasattr(way, "node_ids"):
+        return way.node_ids
+
+    try:
+        return [node.id for node in way.nodes]
+    except overpy.exception.DataIncomplete:
+        return [node.id for node in way.get_nodes(resolve_missing=True)]
+
+
+# the coordinates of a relation member way - inline geometry if we have it, otherwise look the way up
+
+def memberLatLons(member, result):
+
+    if getattr(member, "coords", None) is not None:
+        return member.coords
+
+    return wayLatLons(result.get_way(int(member.ref), resolve_missing=True))
+
+
+# an Overpass response with a remark in it (e.g. a query timeout) didn't finish - raise the matching
+# overpy error, so it counts as a failed server
+
+def _raiseOverpassRemark(msg):
+
+    msg = msg.strip()
+
+    if msg.startswith("runtime error:"):
+        raise overpy.exception.OverpassRuntimeError(msg=msg)
+    if msg.startswith("runtime remark:"):
+        raise overpy.exception.OverpassRuntimeRemark(msg=msg)
+
+    raise overpy.exception.OverpassUnknownError(msg=msg)
+
+
+# parse an Overpass XML response produced with `out geom` into a GeomResult
+
+def parseOverpassGeomXml(data):
+
+    m = _OVERPASS_REMARK.search(data)
+    if m:
+        _raiseOverpassRemark(m.group(1).decode("utf-8", "replace"))
+
+    nodes = []
+    ways = []
+    relations = []
+
+    context = ET.iterparse(io.BytesIO(data), events=("start", "end"))
+    _, root = next(context)
+
+    # anything else that happens to be well-formed XML (e.g. an HTML error page sent with status 200)
+    # isn't an Overpass answer
+    if root.tag != "osm":
+        raise ValueError("not an Overpass XML response (root element <%s>)" % root.tag)
+
+    for event, elem in context:
+
+        if event != "end" or elem.tag not in ("node", "way", "relation"):
+            continue
+
+        tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
+
+        if elem.tag == "node":
+            nodes.append(GeomNode(int(elem.get("id")), float(elem.get("lat")), float(elem.get("lon")), tags))
+
+        elif elem.tag == "way":
+            nds = elem.findall("nd")
+            coords = np.array([(float(nd.get("lat")), float(nd.get("lon"))) for nd in nds], dtype=np.float64).reshape(-1, 2)
+            ways.append(GeomWay(int(elem.get("id")), tags, [int(nd.get("ref")) for nd in nds], coords))
+
+        else:
+            members = []
+            for member in elem.iter("member"):
+                nds = member.findall("nd")
+                coords = None
+                if nds:
+                    coords = np.array([(float(nd.get("lat")), float(nd.get("lon"))) for nd in nds], dtype=np.float64)
+                members.append(GeomMember(member.get("type"), int(member.get("ref")), member.get("role"), coords))
+            relations.append(GeomRelation(int(elem.get("id")), tags, members))
+
+        root.clear()
+
+    return GeomResult(nodes, ways, relations)
+
+
+# parse an Overpass JSON response produced with `[out:json]` and `out geom` into a GeomResult
+# this skips building an element tree altogether; orjson is used if it's installed (pip install orjson)
+
+def parseOverpassGeomJson(data):
+
+    try:
+        import orjson
+        data_parsed = orjson.loads(data)
+    except ImportError:
+        data_parsed = json.loads(data)
+
+    # (a body that isn't JSON raises a JSONDecodeError, which is a ValueError, from either decoder -
+    # anything else that isn't an Overpass answer, like an error or status object, is treated the same way)
+    if not isinstance(data_parsed, dict):
+        raise ValueError("not an Overpass JSON response")
+
+    if "remark" in data_parsed:
+        _raiseOverpassRemark(data_parsed["remark"])
+
+    if "elements" not in data_parsed:
+        raise ValueError("not an Overpass JSON response (no elements)")
+
+    nodes = []
+    ways = []
+    relations = []
+
+    def geometryToCoords(geometry):
+        return np.array([(point["lat"], point["lon"]) for point in geometry], dtype=np.float64).reshape(-1, 2)
+
+    for element in data_parsed["elements"]:
+
+        element_type = element.get("type")
+        tags = element.get("tags", {})
+
+        if element_type == "node":
+            nodes.append(GeomNode(element["id"], element["lat"], element["lon"], tags))
+
+        elif element_type == "way":
+            ways.append(GeomWay(element["id"], tags, element.get("nodes", []), geometryToCoords(element.get("geometry", []))))
+
+        elif element_type == "relation":
+            members = []
+            for member in element.get("members", []):
+                geometry = member.get("geometry")
+                coords = geometryToCoords(geometry) if geometry else None
+                members.append(GeomMember(member["type"], member["ref"], member.get("role"), coords))
+            relations.append(GeomRelation(element["id"], tags, members))
+
+    return GeomResult(nodes, ways, relations)
+
+
+# run an Overpass query, reading from the on-disk cache when we can
+# the cache key covers both the query string and the bounding box it was run for
+# set refresh=True to ignore any cached copy and download the data again
+# overpass_format picks the response format: "xml" (the default) or "json", which parses several times
+# faster but holds the whole decoded response in memory while it does (see benchmarks/bench_osm_parse.py)
+
+def queryOverpass(query, coord_string, refresh=False, cache_dir=OSM_CACHE_DIR, cache_ttl_hours=OSM_CACHE_TTL_HOURS, cache_max_mb=OSM_CACHE_MAX_MB, overpass_format="xml"):
+
+    # Overpass answers in XML unless we ask for JSON
+    if overpass_format == "json":
+        query = "[out:json];" + query
+        parse = parseOverpassGeomJson
+    else:
+        parse = parseOverpassGeomXml
+
+    # (named for the format the response is in)
+    cache_name = hashlib.sha256((coord_string + "|" + query).encode("utf-8")).hexdigest() + (".json" if overpass_format == "json" else ".osm")
+
+    if cache_dir is not None and not refresh:
+        cached_path = lookupCacheEntry(cache_dir, cache_name, cache_ttl_hours)
+
+        # (a cached file that doesn't parse is dropped and downloaded again)
+        if cached_path is not None:
+            try:
+                with open(cached_path, "rb") as f:
+                    return parse(f.read())
+            except (OSError, ET.ParseError, ValueError, overpy.exception.OverPyException) as e:
+                print("Warning: cached OSM data is unreadable, downloading it again:", e)
+                dropCacheEntry(cache_dir, cache_name)
+
+    answer = fetchOverpassHedged(query, parse)
+
+    if answer is None:
+        return None
+
+    response, result = answer
+
+    # an empty answer isn't cached - if it came from a misbehaving server (or the course hasn't been
+    # mapped yet), caching it would hide the course for the whole TTL
+    if cache_dir is not None and (result.nodes or result.ways or result.relations):
+        try:
+            # written to a temporary file first, so a crash or a full disk can't leave half a file behind
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(os.path.join(cache_dir, cache_name + ".tmp"), "wb") as f:
+                f.write(response)
+            os.replace(os.path.join(cache_dir, cache_name + ".tmp"), os.path.join(cache_dir, cache_name))
+            registerCacheEntry(cache_dir, cache_name, cache_max_mb)
+        except OSError as e:
+            print("Warning: could not write OSM cache:", e)
+
+    return result
+
 
-    
-    
 # function to get all golf data contained within a given bounding box (e.g. fairways, greens, sand traps, etc)
 
-def getOSMGolfData(bottom_lat, left_lon, top_lat, right_lon, printf=print):
+def getOSMGolfData(bottom_lat, left_lon, top_lat, right_lon, printf=print, refresh=False, cache_dir=OSM_CACHE_DIR, cache_ttl_hours=OSM_CACHE_TTL_HOURS, cache_max_mb=OSM_CACHE_MAX_MB, overpass_format="xml"):
 
     # create the coordinate string for our request - order is South, West, North, East
     coord_string = str(bottom_lat) + "," + str(left_lon) + "," + str(top_lat) + "," + str(right_lon)
 
     # use the coordinate string to pull the data through Overpass
     # we want all golf ways, with some additions for woods, trees, water hazards, riverbanks, and coastlines
-    query = "(way['golf'](" + coord_string + ");way['natural'='wood'](" + coord_string + ");node['natural'='tree'](" + coord_string + ");way['landuse'='forest'](" + coord_string + ");way['natural'='water'](" + coord_string + ");way['waterway'='riverbank'](" + coord_string + ");way['natural'='coastline'](" + coord_string + ");relation['golf'='fairway'](" + coord_string + "););out body;>;out skel qt;"
+    # (`out geom` gives us the coordinates of every way and fairway relation member inline)
+    query = "(way['golf'](" + coord_string + ");way['natural'='wood'](" + coord_string + ");node['natural'='tree'](" + coord_string + ");way['landuse'='forest'](" + coord_string + ");way['natural'='water'](" + coord_string + ");way['waterway'='riverbank'](" + coord_string + ");way['natural'='coastline'](" + coord_string + ");relation['golf'='fairway'](" + coord_string + "););out geom;"
 
-    # try the primary Overpass server first, then fall back to mirrors
-    for url in [None, "https://overpass.kumi.systems/api/interpreter", "https://overpass.openstreetmap.ru/api/interpreter", "https://overpass-api.de/api/interpreter"]:
-        try:
-            op = overpy.Overpass() if url is None else overpy.Overpass(url=url)
-            return op.query(query)
-        except (overpy.exception.OverPyException, overpy.exception.OverpassGatewayTimeout):
-            continue
+    result = queryOverpass(query, coord_string, refresh, cache_dir, cache_ttl_hours, cache_max_mb, overpass_format)
+
+    if result is None:
+        printf("OpenStreetMap servers are too busy right now.  Try running this tool later.")
 
-    printf("OpenStreetMap servers are too busy right now.  Try running this tool later.")
-    return None
+    return result
 
 
-# calculate length of a degree of latitude at a given location
+# one Overpass result holds everything we need for a course: way['golf'] in getOSMGolfData's
+# query already matches the golf=hole ways, so split them out here instead of downloading them separately
+# returns the list of hole ways and the result to use for course features (CourseFeatures skips
+# the hole ways on its own)
 
-def getLatDegreeDistance(bottom_lat, top_lat):
+def splitCourseResult(result):
 
-    # this is the approximate distance of a degree of latitude at the equator in yards
-    lat_degree_distance_equator = 120925.62
+    hole_ways = [way for way in result.ways if way.tags.get("golf", None) == "hole"]
 
-    # a degree of latitude gets approximately 13.56 yards longer per degree you go north
-    lat_yds_per_degree = 13.56
+    return hole_ways, result
 
-    # find the average latitude of our course
-    average_lat = statistics.mean([bottom_lat, top_lat])
 
-    # calculate length of a degree of latitude is at this average latitude
-    lat_degree_distance_yds = lat_degree_distance_equator + (abs(average_lat) * lat_yds_per_degree)
+# function to get the golf holes and all course features for a bounding box with a single query
 
-    return lat_degree_distance_yds
+def getOSMCourseData(bottom_lat, left_lon, top_lat, right_lon, printf=print, refresh=False, cache_dir=OSM_CACHE_DIR, cache_ttl_hours=OSM_CACHE_TTL_HOURS, cache_max_mb=OSM_CACHE_MAX_MB, overpass_format="xml"):
 
+    result = getOSMGolfData(bottom_lat, left_lon, top_lat, right_lon, printf, refresh, cache_dir, cache_ttl_hours, cache_max_mb, overpass_format)
 
-# calculate length of a degree of longitude at a given location
+    if result is None:
+        return None, None
 
-def getLonDegreeDistance(bottom_lat, top_lat): # length of longitude depends on latitude because the Earth is a sphere!
+    return splitCourseResult(result)
 
-    # this is the approximate distance of a degree of longitude at the equator in yards
-    lon_degree_distance_equator_yds = 69.172 * 5280 / 3
 
-    # find the average latitude of our course
-    average_lat = statistics.mean([bottom_lat, top_lat])
+# read course data from a local OpenStreetMap extract (.osm / .osm.gz / .osm.bz2 XML, or .osm.pbf)
+# instead of the Overpass API - this is useful for rendering many courses from one regional extract
+# the file is streamed, keeping only what falls in the bounding box, so it never has to fit in memory
+# .osm.pbf files need pyosmium (pip install osmium)
 
-    # do some fancy trig to calculate how far a degree of longitude is at this average latitude
-    radian_avg_lat = average_lat * (math.pi/180)
 
-    lon_distance_multiplier = math.cos(radian_avg_lat)
+class _StopScan(Exception):
+    pass
 
-    lon_degree_distance_yds = lon_degree_distance_equator_yds * lon_distance_multiplier
 
-    return lon_degree_distance_yds
+# OSM files list all nodes, then all ways, then all relations, so a scan can stop as soon as
+# it gets past the last kind of element it cares about
 
+_OSM_KIND_ORDER = {"node": 0, "way": 1, "relation": 2}
 
-# given the points of a golf hole on OSM, define a bounding box for that hole
 
-def getHoleBoundingBox(way, lat_degree_distance, lon_degree_distance):
+def _scanOSMXml(path, node_fn=None, way_fn=None, relation_fn=None):
 
-    # get the bounding lat and lon of this particular hole
-    # print('Getting bounding box for the hole: ', datetime.now().time())
-    
-    hole_way_nodes = way.get_nodes(resolve_missing=True)
-    
-    lowest_lat, lowest_lon, highest_lat, highest_lon = getBoundingBoxLatLon(hole_way_nodes)
+    last_kind = max(_OSM_KIND_ORDER[kind] for kind, fn in [("node", node_fn), ("way", way_fn), ("relation", relation_fn)] if fn is not None)
 
-    # add 50 yards in each direction to the bounding box (to include all features like sand traps, water, etc)
-     
-    extra_lat_distance = 50 * (1/lat_degree_distance)
+    if path.endswith(".gz"):
+        opener = gzip.open
+    elif path.endswith(".bz2"):
+        opener = bz2.open
+    else:
+        opener = open
 
-    extra_lon_distance = 50 * (1/lon_degree_distance)
+    with opener(path, "rb") as f:
+        context = ET.iterparse(f, events=("start", "end"))
+        _, root = next(context)
 
-    lowest_lat = lowest_lat - extra_lat_distance
-    highest_lat = highest_lat + extra_lat_distance
+        for event, elem in context:
 
-    lowest_lon = lowest_lon - extra_lon_distance
-    highest_lon = highest_lon + extra_lon_distance
+            if event == "start":
+                if elem.tag in _OSM_KIND_ORDER and _OSM_KIND_ORDER[elem.tag] > last_kind:
+                    return
+                continue
 
-    return lowest_lat, lowest_lon, highest_lat, highest_lon, hole_way_nodes
+            if elem.tag not in _OSM_KIND_ORDER:
+                continue
 
+            tags = {tag.get("k"): tag.get("v") for tag in elem.iter("tag")}
 
-# create a blank image of the appropriate size to use in drawing the hole
+            if elem.tag == "node" and node_fn is not None:
+                node_fn(int(elem.get("id")), float(elem.get("lat")), float(elem.get("lon")), tags)
 
-def generateImage(latmin, lonmin, latmax, lonmax, lat_degree_distance, lon_degree_distance, rough_color):
+            elif elem.tag == "way" and way_fn is not None:
+                way_fn(int(elem.get("id")), tags, [int(nd.get("ref")) for nd in elem.iter("nd")])
 
-    lat_distance = (latmax - latmin) * lat_degree_distance
-    lon_distance = (lonmax - lonmin) * lon_degree_distance
+            elif elem.tag == "relation" and relation_fn is not None:
+                relation_fn(int(elem.get("id")), tags, [(member.get("type"), int(member.get("ref")), member.get("role")) for member in elem.iter("member")])
 
+            # drop everything parsed so far so memory use stays flat
+            root.clear()
 
-    # set the scale of our images to be 3000 pixels for the longest distance (x or y)
-    # also define yards per pixel and pixels per yard values to use in distance calculation
 
-    scale = 3000
+def _scanOSMPbf(path, node_fn=None, way_fn=None, relation_fn=None):
 
-    if lat_distance >= lon_distance:
-        y_dim = scale
-        x_dim = int((lon_distance / lat_distance) * scale)
-        ypp = lat_distance / scale
-    else:
-        x_dim = scale
-        y_dim = int((lat_distance / lon_distance) * scale)
-        ypp = lon_distance / scale
+    import osmium
 
+    last_kind = max(_OSM_KIND_ORDER[kind] for kind, fn in [("node", node_fn), ("way", way_fn), ("relation", relation_fn)] if fn is not None)
 
-    im = np.zeros((x_dim, y_dim, 3), np.uint8)
+    class Handler(osmium.SimpleHandler):
 
-    # Fill image with background color
+        def node(self, n):
+            if node_fn is not None and n.location.valid():
+                node_fn(n.id, n.location.lat, n.location.lon, {tag.k: tag.v for tag in n.tags})
 
-    im[:] = rough_color
+        def way(self, w):
+            if last_kind < _OSM_KIND_ORDER["way"]:
+                raise _StopScan()
+            if way_fn is not None:
+                way_fn(w.id, {tag.k: tag.v for tag in w.tags}, [nd.ref for nd in w.nodes])
 
-    # return the image and some other information for use in measurement
+        def relation(self, r):
+            if last_kind < _OSM_KIND_ORDER["relation"]:
+                raise _StopScan()
+            if relation_fn is not None:
+                member_types = {"n": "node", "w": "way", "r": "relation"}
+                relation_fn(r.id, {tag.k: tag.v for tag in r.tags}, [(member_types.get(m.type, m.type), m.ref, m.role) for m in r.members])
+
+    try:
+        Handler().apply_file(path)
+    except _StopScan:
+        pass
 
-    return im, x_dim, y_dim, ypp
 
+def _scanOSMFile(path, node_fn=None, way_fn=None, relation_fn=None):
+
+    if path.endswith(".pbf"):
+        _scanOSMPbf(path, node_fn, way_fn, relation_fn)
+    else:
+        _scanOSMXml(path, node_fn, way_fn, relation_fn)
 
-# given a golf hole's waypoints, get all feature data from OSM for that hole (e.g. fairway, sand traps, water hazards, etc)
 
-def getHoleOSMData(way, lat_degree_distance, lon_degree_distance):
+# the same tag filters getOSMGolfData sends to Overpass
 
-    # get the bounding box to search for this hole
+def _isCourseFeatureWay(tags):
 
-    hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, hole_way_nodes = getHoleBoundingBox(way, lat_degree_distance, lon_degree_distance)
+    return ("golf" in tags or tags.get("natural", None) in ("wood", "water", "coastline")
+            or tags.get("landuse", None) == "forest" or tags.get("waterway", None) == "riverbank")
 
-    # download all golf data in this bounding box from OSM
 
-    hole_result = getOSMGolfData(hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
+# build a GeomResult from the pieces we kept, laid out the same way Overpass `out geom` output is:
+# tagged nodes, the ways that match our filters, and relations with their member geometry inline
 
-    return hole_way_nodes, hole_result, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon
+def _buildGeomResult(nodes, tagged_node_ids, ways, relations):
 
+    def coordsFor(refs):
+        return np.array([nodes[ref][:2] for ref in refs], dtype=np.float64)
 
-# given a list of coordinates that define a golf hole in OSM, find the green
+    geom_nodes = [GeomNode(node_id, nodes[node_id][0], nodes[node_id][1], nodes[node_id][2]) for node_id in tagged_node_ids]
 
-def identifyGreen(hole_way_nodes, hole_result):
+    geom_ways = [GeomWay(way_id, tags, refs, coordsFor(refs)) for way_id, (tags, refs) in ways.items() if _isCourseFeatureWay(tags)]
 
-    # if mapped correctly, the last coordinate should mark the center of the green in OSM
+    geom_relations = []
+    for rel_id, (tags, members) in relations.items():
+        member_list = []
+        for member_type, ref, role in members:
+            if member_type == "way":
+                member_list.append(GeomMember(member_type, ref, role, coordsFor(ways[ref][1])))
+            else:
+                member_list.append(GeomMember(member_type, ref, role))
+        geom_relations.append(GeomRelation(rel_id, tags, member_list))
 
-    green_center = hole_way_nodes[-1]
+    return GeomResult(geom_nodes, geom_ways, geom_relations)
 
-    # now search all the data we have for this hole, and filter to find golf greens only
-    # check each one to see if it contains the center of the green for the hole we are on
-    # (we have to do this because sometimes the green from another hole might be close enough
-    # to the fairway to show up in our data pull)
 
-    green_found = False
+# get the same course data getOSMGolfData would download, but from a local extract
+# like Overpass's way(bbox), a way is kept if any of its nodes is inside the box; its full geometry and
+# that of the member ways of golf=fairway relations come along with it (like Overpass's `out geom`)
+# (a way whose nodes are all outside the box is missed even if one of its segments crosses it)
 
-    for way in hole_result.ways:
-        
-        if way.tags.get("golf", None) == "green":
+def readOSMExtract(path, bottom_lat, left_lon, top_lat, right_lon, printf=print):
 
-            # print('Identifying green center: ', datetime.now().time())
+    if not os.path.exists(path):
+        printf("Error: OSM file not found: " + str(path))
+        return None
 
-            green_nodes = way.get_nodes(resolve_missing=True)
+    bbox_node_ids = set()
+    tree_nodes = {}
+    touching_ways = {}
+    relations = {}
 
-            green_min_lat, green_min_lon, green_max_lat, green_max_lon = getBoundingBoxLatLon(green_nodes)
+    def inBBox(lat, lon):
+        return bottom_lat <= lat <= top_lat and left_lon <= lon <= right_lon
 
-            # checking if the center of the green for this hole is within this green
+    # first pass: find the nodes inside the box, every way that touches them, and the fairway relations
 
-            if green_center.lat > green_min_lat and green_center.lat < green_max_lat and green_center.lon > green_min_lon and green_center.lon < green_max_lon:
+    def firstPassNode(node_id, lat, lon, tags):
+        if inBBox(lat, lon):
+            bbox_node_ids.add(node_id)
+            if tags.get("natural", None) == "tree":
+                tree_nodes[node_id] = (lat, lon, tags)
 
-                green_found = True
-                return green_nodes
+    def firstPassWay(way_id, tags, refs):
+        for ref in refs:
+            if ref in bbox_node_ids:
+                touching_ways[way_id] = (tags, refs)
+                break
 
-    # if we couldn't find a green, return an error
+    def firstPassRelation(rel_id, tags, members):
+        if tags.get("golf", None) != "fairway":
+            return
+        for member_type, ref, role in members:
+            if (member_type == "way" and ref in touching_ways) or (member_type == "node" and ref in bbox_node_ids):
+                relations[rel_id] = (tags, members)
+                return
 
-    if green_found == False:
-        print("Error: green could not be found")
+    try:
+        _scanOSMFile(path, firstPassNode, firstPassWay, firstPassRelation)
+    except ImportError:
+        printf("Error: reading .osm.pbf files requires pyosmium (pip install osmium)")
+        return None
+    except (OSError, ET.ParseError) as e:
+        printf("Error: could not read OSM file: " + str(e))
         return None
 
+    bbox_node_ids = None
 
-# convert an OSM way to a numpy array we can use for image processing
+    ways = {way_id: way for way_id, way in touching_ways.items() if _isCourseFeatureWay(way[0])}
 
-def translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim):
-    #
-    # print("getting nodes for: ", way.tags.get("golf", None))
+    relation_way_ids = set(ref for tags, members in relations.values() for member_type, ref, role in members if member_type == "way")
+    for way_id in relation_way_ids:
+        if way_id in touching_ways:
+            ways[way_id] = touching_ways[way_id]
+    touching_ways = None
 
+    # second pass (only if needed): relation members that don't touch the box themselves
 
-    # convert each coordinate's location within the bounding box to a pixel location
-    # ex: if a coordinate is 70% of the way east and 30% of the way north in the bounding box,
-    # we want that point to be 70% from the left and 30% from the bottom of our image
-    
-    # print('Converting hole coordinates to numpy array: ', datetime.now().time())
-    
-    try:
-        node_list = way.nodes
-        # print('used cache')
+    missing_way_ids = relation_way_ids - set(ways)
 
-    except overpy.exception.DataIncomplete:
-        # print('no cache available')
-        node_list = way.get_nodes(resolve_missing=True)
+    if missing_way_ids:
 
-    nds = []
-    for node in node_list:
-        yfactor = ((float(node.lat) - hole_minlat) / (hole_maxlat - hole_minlat)) * y_dim
-        xfactor = ((float(node.lon) - hole_minlon) / (hole_maxlon - hole_minlon)) * x_dim
+        def secondPassWay(way_id, tags, refs):
+            if way_id in missing_way_ids:
+                ways[way_id] = (tags, refs)
 
-        # we need to round to integers for image processing
+        _scanOSMFile(path, way_fn=secondPassWay)
 
-        column = int(xfactor)
-        row = int(yfactor)
+    # last pass: coordinates for every node our ways need
 
-        nds.append((column, row))
+    needed_node_ids = set(ref for tags, refs in ways.values() for ref in refs)
+    needed_node_ids.update(ref for tags, members in relations.values() for member_type, ref, role in members if member_type == "node")
 
-    # the script uses points and not image pixels, so flip the x and y
+    nodes = dict(tree_nodes)
 
-    nds = np.array(nds)
-    nds[:,[0, 1]] = nds[:,[1, 0]]
+    def nodePass(node_id, lat, lon, tags):
+        if node_id in needed_node_ids:
+            nodes[node_id] = (lat, lon, tags)
 
-    return nds
+    _scanOSMFile(path, node_fn=nodePass)
 
+    # drop any references the extract can't satisfy (e.g. ways clipped at the extract boundary)
+    for way_id, (tags, refs) in list(ways.items()):
+        refs = [ref for ref in refs if ref in nodes]
+        if len(refs) < 2:
+            del ways[way_id]
+        else:
+            ways[way_id] = (tags, refs)
 
-# convert a list of coordinates to a numpy array we can use for image processing
+    for rel_id, (tags, members) in list(relations.items()):
+        relations[rel_id] = (tags, [m for m in members if (m[0] == "way" and m[1] in ways) or (m[0] == "node" and m[1] in nodes)])
 
-def translateNodestoNP(nodes, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim):
+    return _buildGeomResult(nodes, list(tree_nodes), ways, relations)
 
-    # print('Converting nodes to numpy array: ', datetime.now().time())
-    
-    # convert each coordinate's location within the bounding box to a pixel location
-    # ex: if a coordinate is 70% of the way east and 30% of the way north in the bounding box,
-    # we want that point to be 70% from the left and 30% from the bottom of our image
 
-    nds = []
-    for node in nodes:
-        yfactor = ((float(node.lat) - hole_minlat) / (hole_maxlat - hole_minlat)) * y_dim
-        xfactor = ((float(node.lon) - hole_minlon) / (hole_maxlon - hole_minlon)) * x_dim
+# all coordinates are projected onto a flat east/north plane that touches the earth (the WGS84
+# ellipsoid) at the middle of the course - at golf course scale this is accurate to well under an
+# inch, and it works on whole arrays of coordinates at once
+# distances on the plane are in yards (or meters, if in_meters is set)
+
+WGS84_A = 6378137.0
+WGS84_E2 = 6.69437999014e-3
+YARDS_PER_METER = 1 / 0.9144
+
 
+class LocalProjection:
 
-        # we need to round to integers for image processing
+    def __init__(self, lat0, lon0, in_meters=False):
 
-        column = int(xfactor)
-        row = int(yfactor)
+        self.lat0 = lat0
+        self.lon0 = lon0
+        self.units_per_meter = 1.0 if in_meters else YARDS_PER_METER
 
-        nds.append((column, row))
+        phi = math.radians(lat0)
+        lam = math.radians(lon0)
 
-    # the script uses points and not image pixels, so flip the x and y
+        self._origin = self._toECEF(np.array([[lat0, lon0]], dtype=np.float64))[0]
 
-    nds = np.array(nds)
-    nds[:,[0, 1]] = nds[:,[1, 0]]
+        # rows of the rotation from earth-centered coordinates to east/north at the origin
+        self._rotation = np.array([[-math.sin(lam), math.cos(lam), 0.0],
+                                   [-math.sin(phi) * math.cos(lam), -math.sin(phi) * math.sin(lam), math.cos(phi)]])
 
-    return nds
+        # length of a degree of latitude and longitude at the origin (for unproject)
+        w = math.sqrt(1 - WGS84_E2 * math.sin(phi) ** 2)
+        self._units_per_lat = WGS84_A * (1 - WGS84_E2) / w ** 3 * math.pi / 180 * self.units_per_meter
+        self._units_per_lon = WGS84_A / w * math.cos(phi) * math.pi / 180 * self.units_per_meter
 
+    @staticmethod
+    def _toECEF(latlons):
 
-# take the data dump for a given hole and categorize all the data by feature type for drawing
+        phi = np.radians(latlons[:, 0])
+        lam = np.radians(latlons[:, 1])
+        sin_phi = np.sin(phi)
+        cos_phi = np.cos(phi)
+        n = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_phi ** 2)
 
-def categorizeWays(hole_result, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim):
+        return np.stack([n * cos_phi * np.cos(lam), n * cos_phi * np.sin(lam), n * (1 - WGS84_E2) * sin_phi], axis=1)
 
-    sand_traps = []
-    tee_boxes = []
-    fairways = []
-    water_hazards = []
-    woods = []
-    trees = []
+    # (N, 2) array of (lat, lon) -> (N, 2) array of (east, north)
 
-    # print('Categorizing ways for hole: ', datetime.now().time())
+    def project(self, latlons):
 
-    for way in hole_result.ways:
+        latlons = np.asarray(latlons, dtype=np.float64).reshape(-1, 2)
 
-        # see how each object was tagged in OSM (and do a little extra categorizing for
-        # water hazards and woods)
+        return np.dot(self._toECEF(latlons) - self._origin, self._rotation.T) * self.units_per_meter
 
-        golf_type = way.tags.get("golf", None)
+    # (N, 2) array of (east, north) -> (N, 2) array of (lat, lon), refined until it projects back exactly
 
-        natural_type = way.tags.get("natural", None)
+    def unproject(self, local):
 
-        if natural_type == "water":
-            golf_type = "water_hazard"
+        local = np.asarray(local, dtype=np.float64).reshape(-1, 2)
 
-        if way.tags.get("waterway", None) == "riverbank":
-            golf_type = "water_hazard"
+        latlons = np.empty_like(local)
+        latlons[:, 0] = self.lat0 + local[:, 1] / self._units_per_lat
+        latlons[:, 1] = self.lon0 + local[:, 0] / self._units_per_lon
 
-        if natural_type == "wood" or way.tags.get("landuse", None) == "forest":
-            golf_type = "woods"
+        for i in range(3):
+            error = local - self.project(latlons)
+            latlons[:, 0] += error[:, 1] / self._units_per_lat
+            latlons[:, 1] += error[:, 0] / self._units_per_lon
 
+        return latlons
 
-        # find what kind of feature we have and add its numpy array to the appropriate list
 
-        if golf_type == "bunker":
-            # node_list = list(way.get_nodes(resolve_missing=True))
-            # print(node_list)
-            sand_traps.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+# the pixel grid for one hole image, covering a rectangle of the projected plane
+# the longest side of the rectangle gets `scale` pixels; ypp is yards (or meters) per pixel
+# (or, if ypp is given, the pixels are that size and the image is however big the rectangle needs)
+# image rows run east and columns run north, and points are (x, y) = (column, row) - the same
+# layout the original lat/lon-based images used
 
-        elif golf_type == "tee":
-            # node_list = list(way.get_nodes(resolve_missing=True))
-            # print(node_list)
-            tee_boxes.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+class ImageFrame:
 
-        elif golf_type == "water_hazard" or golf_type == "lateral_water_hazard":
-            # node_list = list(way.get_nodes(resolve_missing=True))
-            # print(node_list)
-            water_hazards.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+    def __init__(self, projection, east_min, north_min, east_max, north_max, scale=3000, ypp=None):
 
-        elif golf_type == "fairway":
-            # node_list = list(way.get_nodes(resolve_missing=True))
-            # print(node_list)
-            fairways.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
-            # print("fairway found")
+        self.projection = projection
+        self.east_min = east_min
+        self.north_min = north_min
+        self.east_max = east_max
+        self.north_max = north_max
 
-        elif golf_type == "woods":
-            woods.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+        north_distance = north_max - north_min
+        east_distance = east_max - east_min
 
+        if ypp is not None:
+            self.x_dim = int(east_distance / ypp)
+            self.y_dim = int(north_distance / ypp)
+            self.ypp = ypp
+        elif north_distance >= east_distance:
+            self.y_dim = scale
+            self.x_dim = int((east_distance / north_distance) * scale)
+            self.ypp = north_distance / scale
         else:
-            continue
+            self.x_dim = scale
+            self.y_dim = int((north_distance / east_distance) * scale)
+            self.ypp = east_distance / scale
+
+    # (N, 2) array of (east, north) -> (N, 2) float array of pixel points
+
+    def localToPixels(self, local):
+
+        local = np.asarray(local, dtype=np.float64).reshape(-1, 2)
+
+        return np.stack([(local[:, 1] - self.north_min) / self.ypp, (local[:, 0] - self.east_min) / self.ypp], axis=1)
+
+    # the same mapping as a 3x3 affine matrix on (east, north, 1), for composing with rotations
+
+    def pixelMatrix(self):
+
+        return np.array([[0.0, 1 / self.ypp, -self.north_min / self.ypp],
+                         [1 / self.ypp, 0.0, -self.east_min / self.ypp],
+                         [0.0, 0.0, 1.0]])
 
-        
-    # some fairways are mapped as relations
+    # (N, 2) array of (lat, lon) -> (N, 2) integer array of pixel points (truncated, like the old per-node loop)
 
-    for relation in hole_result.relations:
-        if relation.tags.get("golf", None) == "fairway":
+    def latLonToPixels(self, latlons):
 
-            # the relation is a list of ways, so we need to get the nodes for the outer way
-            # print(relation.members)
+        return self.localToPixels(self.projection.project(latlons)).astype(np.int64)
 
-            for relation_way in relation.members:
+    # a lat/lon box that covers the whole frame (e.g. for downloading elevation data)
 
-                # print(relation_way)
+    def latLonBounds(self):
 
-                if relation_way.role == "outer":
-                    
-                    way_id = int(relation_way.ref)
+        corners = self.projection.unproject([(self.east_min, self.north_min), (self.east_min, self.north_max),
+                                             (self.east_max, self.north_min), (self.east_max, self.north_max)])
 
-                    way = hole_result.get_way(way_id, resolve_missing=True)
+        return corners[:, 0].min(), corners[:, 1].min(), corners[:, 0].max(), corners[:, 1].max()
 
-                    fairways.append(translateWaytoNP(way, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
-                    # print("fairway found")
+    # longitude of each image row and latitude of each image column
+    # (rows and columns are straight lines of longitude/latitude to well within a pixel at hole scale)
 
-    # the only feature we care about that would show up as a node would be a tree
+    def pixelLatLonAxes(self):
 
-    for node in hole_result.nodes:
+        east_mid = (self.east_min + self.east_max) / 2
+        north_mid = (self.north_min + self.north_max) / 2
 
-        if node.tags.get("natural", None) == "tree":
+        rows = self.east_min + np.arange(self.x_dim) * self.ypp
+        cols = self.north_min + np.arange(self.y_dim) * self.ypp
 
-            trees.append(translateNodestoNP([node], hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+        lon_for_row = self.projection.unproject(np.stack([rows, np.full(self.x_dim, north_mid)], axis=1))[:, 1]
+        lat_for_col = self.projection.unproject(np.stack([np.full(self.y_dim, east_mid), cols], axis=1))[:, 0]
 
+        return lon_for_row, lat_for_col
 
-    # add any ocean/sea polygons derived from coastline ways
-    water_hazards.extend(coastlineToPolygons(hole_result, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
 
-    # give back a list of the numpy arrays for each feature type
+# given the points of a golf hole on OSM, define the image frame for that hole
 
-    return sand_traps, tee_boxes, fairways, water_hazards, woods, trees
+def getHoleFrame(projection, hole_latlons, scale=3000, ypp=None):
+
+    hole_local = projection.project(hole_latlons)
+
+    # add 50 yards in each direction to the bounding box (to include all features like sand traps, water, etc)
+
+    east_min, north_min = hole_local.min(axis=0) - 50
+    east_max, north_max = hole_local.max(axis=0) + 50
+
+    return ImageFrame(projection, east_min, north_min, east_max, north_max, scale, ypp)
+
+
+# preview renders draw each hole at this fraction of the full resolution, from a DEM this coarse (meters)
+# (a power of two, so scaling the points and the yards per pixel is exact and every distance - and so
+# every decision about what to label - comes out the same as in the full render)
+
+PREVIEW_SCALE = 0.25
+PREVIEW_DEM_RESOLUTION = 10
+
+
+# with a fixed yards per pixel, text, tree symbols and lines are drawn the size they'd be on a
+# full-resolution image at this many yards per pixel (a 500-yard frame) - the same size on every hole
+
+FIXED_SCALE_REFERENCE_YPP = 1 / 6
 
 
 # chain OSM coastline ways into ordered lat/lon paths by matching endpoint node IDs
@@ -418,12 +1021,9 @@ def _chainCoastlineWays(coastline_ways):
 
     way_data = []
     for way in coastline_ways:
-        try:
-            nodes = way.nodes
-        except overpy.exception.DataIncomplete:
-            nodes = way.get_nodes(resolve_missing=True)
-        latlons = [(float(n.lat), float(n.lon)) for n in nodes]
-        way_data.append({'latlons': latlons, 'start_id': nodes[0].id, 'end_id': nodes[-1].id, 'used': False})
+        latlons = [tuple(latlon) for latlon in wayLatLons(way).tolist()]
+        node_ids = wayNodeIds(way)
+        way_data.append({'latlons': latlons, 'start_id': node_ids[0], 'end_id': node_ids[-1], 'used': False})
 
     # build lookup: start_node_id -> way index (coastlines are directed, so only chain forward)
     node_starts = {wd['start_id']: i for i, wd in enumerate(way_data)}
@@ -529,30 +1129,44 @@ def _cornersClockwiseBetween(pos_end, pos_start, minlat, minlon, maxlat, maxlon)
     return [r[1] for r in result]
 
 
-# convert natural=coastline ways in the OSM result into filled ocean polygon arrays.
+# clip already-projected coastline chains ((N, 2) east/north arrays) to an image frame,
+# giving back closed east/north (ocean) polygons
 # OSM coastline convention: land is to the LEFT of way direction, ocean to the RIGHT.
 # open chains are closed by tracing the bbox boundary clockwise (which stays on the ocean/right side).
 
-def coastlineToPolygons(hole_result, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim):
+def clipCoastlineChains(chains, frame):
 
-    coastline_ways = [w for w in hole_result.ways if w.tags.get("natural") == "coastline"]
-    if not coastline_ways:
-        return []
-
-    chains = _chainCoastlineWays(coastline_ways)
     polygons = []
 
-    for chain in chains:
-        if len(chain) < 2:
-            continue
+    # clipping happens on the projected plane, with (north, east) standing in for (lat, lon)
+    minn, mine, maxn, maxe = frame.north_min, frame.east_min, frame.north_max, frame.east_max
+
+    for local in chains:
+
+        pts = local[:, ::-1]
+
+        # skip (without clipping) every segment whose ends are both beyond the same edge of the box
+        n, e = pts[:, 0], pts[:, 1]
+        outside = (((n[:-1] < minn) & (n[1:] < minn)) | ((n[:-1] > maxn) & (n[1:] > maxn)) |
+                   ((e[:-1] < mine) & (e[1:] < mine)) | ((e[:-1] > maxe) & (e[1:] > maxe)))
+
+        pts = pts.tolist()
 
         # clip the chain to the bbox, collecting continuous segments
         segments = []
         current_seg = []
+        last_i = None
+
+        for i in np.nonzero(~outside)[0].tolist():
+
+            # if we skipped over some segments, the current run has ended
+            if last_i is not None and i != last_i + 1 and current_seg:
+                segments.append(current_seg)
+                current_seg = []
+            last_i = i
+
+            clipped = _clipSegmentToBBox(pts[i], pts[i + 1], minn, mine, maxn, maxe)
 
-        for i in range(len(chain) - 1):
-            clipped = _clipSegmentToBBox(chain[i], chain[i + 1],
-                                         hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
             if clipped is None:
                 if current_seg:
                     segments.append(current_seg)
@@ -578,128 +1192,1277 @@ def coastlineToPolygons(hole_result, hole_minlat, hole_minlon, hole_maxlat, hole
             start_pt = seg[0]
             end_pt = seg[-1]
 
-            pos_start = _clockwisePos(start_pt[0], start_pt[1], hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
-            pos_end   = _clockwisePos(end_pt[0],   end_pt[1],   hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
+            pos_start = _clockwisePos(start_pt[0], start_pt[1], minn, mine, maxn, maxe)
+            pos_end   = _clockwisePos(end_pt[0],   end_pt[1],   minn, mine, maxn, maxe)
+
+            closing = _cornersClockwiseBetween(pos_end, pos_start, minn, mine, maxn, maxe)
 
-            closing = _cornersClockwiseBetween(pos_end, pos_start, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
+            # back to (east, north) like every other feature
+            polygons.append(np.array(seg + closing, dtype=np.float64)[:, ::-1])
 
-            all_latlons = seg + closing
+    return polygons
 
-            # convert to pixel coords using the same convention as translateWaytoNP:
-            # point = (yfactor, xfactor) = (lat-based, lon-based) after the axis swap
-            pixel_pts = []
-            for lat, lon in all_latlons:
-                yfactor = int(((lat - hole_minlat) / (hole_maxlat - hole_minlat)) * y_dim)
-                xfactor = int(((lon - hole_minlon) / (hole_maxlon - hole_minlon)) * x_dim)
-                pixel_pts.append((yfactor, xfactor))
 
-            polygons.append(np.array(pixel_pts))
+# a uniform grid over the course plane for finding which bounding boxes overlap a query box
+# (so picking out one hole's features doesn't mean checking every feature on a 36 or 54 hole facility)
+# boxes are (east_min, north_min, east_max, north_max); each one is listed in every cell it touches,
+# stored as one array of box ids sorted by cell, with an offset into it for each cell
 
-    return polygons
+GRID_CELL_SIZE = 100
 
+class GridIndex:
 
-# given a numpy array and an image, fill in the array as a polygon on the image (in a given color)
-# also draw an outline if it is specified
+    def __init__(self, bboxes, cell_size=GRID_CELL_SIZE):
 
-def drawFeature(image, array, color, line=-1):
+        self.bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        self.cell_size = float(cell_size)
 
-    nds = np.int32([array]) # bug in fillPoly - needs explicit cast to 32bit
+        if len(self.bboxes) == 0:
+            self.origin = np.zeros(2)
+            self.shape = (1, 1)
+            self.starts = np.zeros(2, dtype=np.int64)
+            self.entries = np.zeros(0, dtype=np.int64)
+            return
 
-    cv2.fillPoly(image, nds, color)
+        self.origin = self.bboxes[:, :2].min(axis=0)
 
-    if line > 0:
-        # need to redraw a line since fillPoly has no line thickness options that I've found
-        cv2.polylines(image, nds, True, (0,0,0), line, lineType=cv2.LINE_AA)
+        lo = self._cells(self.bboxes[:, :2])
+        hi = self._cells(self.bboxes[:, 2:])
+        self.shape = (int(hi[:, 0].max()) + 1, int(hi[:, 1].max()) + 1)
 
+        # expand each box into the cells it covers
+        counts_n = hi[:, 1] - lo[:, 1] + 1
+        counts = (hi[:, 0] - lo[:, 0] + 1) * counts_n
 
-# for a list of arrays and an image, draw each array as a polygon on the image (in a given color)
+        box_ids = np.repeat(np.arange(len(self.bboxes)), counts)
+        step = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
 
-def drawFeatures(image, feature_list, color, line=-1):
-    
-    # print('Drawing hole features: ', datetime.now().time())
+        cell_e = lo[box_ids, 0] + step // counts_n[box_ids]
+        cell_n = lo[box_ids, 1] + step % counts_n[box_ids]
+        cell_ids = cell_e * self.shape[1] + cell_n
 
-    for feature_nodes in feature_list:
+        order = np.lexsort((box_ids, cell_ids))
+        self.entries = box_ids[order]
+        self.starts = np.searchsorted(cell_ids[order], np.arange(self.shape[0] * self.shape[1] + 1))
 
-        drawFeature(image, feature_nodes, color, line)
+    def _cells(self, points):
 
+        return np.floor((points - self.origin) / self.cell_size).astype(np.int64)
 
-# for a list of tree nodes and an image, draw each tree on the image
+    # indices of the boxes that overlap the query box, in their original order
+
+    def query(self, east_min, north_min, east_max, north_max):
 
-def drawTrees(image, feature_list, color):
+        lo = self._cells(np.array([east_min, north_min]))
+        hi = self._cells(np.array([east_max, north_max]))
 
-    for feature_nodes in feature_list:
+        e0, n0 = max(int(lo[0]), 0), max(int(lo[1]), 0)
+        e1, n1 = min(int(hi[0]), self.shape[0] - 1), min(int(hi[1]), self.shape[1] - 1)
 
-        nds = np.int32([feature_nodes])
+        if e0 > e1 or n0 > n1:
+            return np.zeros(0, dtype=np.int64)
 
-        # convert from numpy array back to a list of coordinates (not best-practice)
-        tree = nds.tolist()[0][0]
+        rows = np.arange(e0, e1 + 1) * self.shape[1]
+        starts = self.starts[rows + n0]
+        ends = self.starts[rows + n1 + 1]
 
+        candidates = np.unique(np.concatenate([self.entries[a:b] for a, b in zip(starts, ends)]))
 
-        x = int(tree[0])
-        y = int(tree[1])
+        bboxes = self.bboxes[candidates]
+        hits = ((bboxes[:, 0] <= east_max) & (bboxes[:, 2] >= east_min) &
+                (bboxes[:, 1] <= north_max) & (bboxes[:, 3] >= north_min))
 
-        # draw a circle with an X inside as a tree symbol
+        return candidates[hits]
 
-        cv2.circle(image, (x,y), 50, color, thickness=6)
 
-        top = (x,y - 50)
-        bottom = (x,y + 50)
+# check whether a point is inside a polygon ((N, 2) array) by counting the edges a ray from it crosses
 
-        cv2.line(image, top, bottom, color, thickness=6)
+def pointInPolygon(x, y, polygon):
 
-        left = (x - 50, y)
-        right = (x + 50, y)
+    x1, y1 = polygon[:, 0], polygon[:, 1]
+    x2, y2 = np.roll(x1, -1), np.roll(y1, -1)
 
-        cv2.line(image, left, right, color, thickness=6)
+    straddles = (y1 > y) != (y2 > y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
 
-        tr = (x + int(50 * math.cos(math.pi/4)),y + int(50 * math.sin(math.pi/4)))
-        bl = (x + int(50 * math.cos(5*math.pi/4)),y + int(50 * math.sin(5*math.pi/4)))
+    return bool(np.count_nonzero(straddles & (x < crossing_x)) % 2)
 
-        cv2.line(image, tr, bl, color, thickness=6)
 
-        tl = (x + int(50 * math.cos(3*math.pi/4)),y + int(50 * math.sin(3*math.pi/4)))
-        br = (x + int(50 * math.cos(7*math.pi/4)),y + int(50 * math.sin(7*math.pi/4)))
+# every feature on the course that we draw, sorted by type and projected onto the course plane once
+# (instead of re-walking and re-projecting the whole course for every hole)
+# each type keeps a list of (N, 2) east/north arrays and an (N, 4) array of their bounding boxes,
+# and select() hands back the pieces that can show up in one hole's image, in pixels
 
-        cv2.line(image, tl, br, color, thickness=6)
+FEATURE_TYPES = ("sand_traps", "tee_boxes", "fairways", "water_hazards", "woods", "trees")
 
+class CourseFeatures:
 
-# when the features were rotated, their coordinates could have been outside our image boundaries
-# so we have to adjust them to be within the boundaries of our new image
+    def __init__(self, course_result, projection):
 
-def adjustRotatedFeatures(feature_list, ymin, xmin):
+        self.projection = projection
 
-    minx = miny = 10000
-    maxx = maxy = -10000
+        latlons = dict((feature_type, []) for feature_type in FEATURE_TYPES)
+        green_latlons = []
 
-    output_list = []
+        for way in course_result.ways:
 
-    for feature_nodes in feature_list:
+            # see how each object was tagged in OSM (and do a little extra categorizing for
+            # water hazards and woods)
 
-        w = np.zeros(feature_nodes.shape)
+            golf_type = way.tags.get("golf", None)
 
-        # print("pre-translation:",feature_nodes)
+            natural_type = way.tags.get("natural", None)
 
-        for i,v in enumerate(feature_nodes):
-            w[i] = v
+            if natural_type == "water":
+                golf_type = "water_hazard"
 
-            x = w[i,0]
-            y = w[i,1]
+            if way.tags.get("waterway", None) == "riverbank":
+                golf_type = "water_hazard"
 
-            newx = float(x) - xmin
-            newy = float(y) - ymin
+            if natural_type == "wood" or way.tags.get("landuse", None) == "forest":
+                golf_type = "woods"
 
+            if golf_type == "bunker":
+                latlons["sand_traps"].append(wayLatLons(way))
+
+            elif golf_type == "tee":
+                latlons["tee_boxes"].append(wayLatLons(way))
+
+            elif golf_type == "water_hazard" or golf_type == "lateral_water_hazard":
+                latlons["water_hazards"].append(wayLatLons(way))
+
+            elif golf_type == "fairway":
+                latlons["fairways"].append(wayLatLons(way))
+
+            elif golf_type == "woods":
+                latlons["woods"].append(wayLatLons(way))
+
+            elif golf_type == "green":
+                green_latlons.append(wayLatLons(way))
+
+        # some fairways are mapped as relations (we only need the outer ways)
+
+        for relation in course_result.relations:
+            if relation.tags.get("golf", None) == "fairway":
+                for relation_way in relation.members:
+                    if relation_way.role == "outer":
+                        latlons["fairways"].append(memberLatLons(relation_way, course_result))
+
+        # the only feature we care about that would show up as a node would be a tree
+
+        for node in course_result.nodes:
+            if node.tags.get("natural", None) == "tree":
+                latlons["trees"].append(np.array([[float(node.lat), float(node.lon)]]))
+
+        self.features = {}
+        self.bboxes = {}
+
+        self.indexes = {}
+
+        for feature_type in FEATURE_TYPES:
+            self.features[feature_type] = self._projectAll(latlons[feature_type])
+            self.bboxes[feature_type] = self._bboxes(self.features[feature_type])
+            self.indexes[feature_type] = GridIndex(self.bboxes[feature_type])
+
+        # greens are matched against a hole's green center, so they get an index of their own
+        # (plus their lat/lon boxes, for greens mapped a little off from the hole's end point)
+        self.greens = self._projectAll(green_latlons)
+        self.green_index = GridIndex(self._bboxes(self.greens))
+        self.green_bboxes = self._bboxes([np.asarray(g, dtype=np.float64).reshape(-1, 2)[:, ::-1] for g in green_latlons])
+
+        # coastlines get chained into long paths here, then clipped to each hole's frame
+        coastline_ways = [w for w in course_result.ways if w.tags.get("natural") == "coastline"]
+        self.coastline_chains = self._projectAll([c for c in _chainCoastlineWays(coastline_ways) if len(c) >= 2])
+
+    # project a list of lat/lon arrays in one pass and split them back up
+
+    def _projectAll(self, latlon_list):
+
+        if not latlon_list:
+            return []
+
+        arrays = [np.asarray(a, dtype=np.float64).reshape(-1, 2) for a in latlon_list]
+        lengths = [len(a) for a in arrays]
+
+        local = self.projection.project(np.concatenate(arrays))
+
+        return np.split(local, np.cumsum(lengths)[:-1])
+
+    @staticmethod
+    def _bboxes(arrays):
+
+        if not arrays:
+            return np.zeros((0, 4))
+
+        return np.array([(a[:, 0].min(), a[:, 1].min(), a[:, 0].max(), a[:, 1].max()) for a in arrays])
+
+    # indices (in course order) of the features of one type whose boxes overlap a box of the plane
+
+    def query(self, feature_type, east_min, north_min, east_max, north_max):
+
+        return self.indexes[feature_type].query(east_min, north_min, east_max, north_max)
+
+    # the green (as an east/north array) that contains a hole's green center
+
+    def findGreen(self, green_center):
+
+        lat = float(green_center.lat)
+        lon = float(green_center.lon)
+
+        east, north = self.projection.project([(lat, lon)])[0]
+
+        candidates = self.green_index.query(east, north, east, north)
+
+        for i in candidates:
+            if pointInPolygon(east, north, self.greens[i]):
+                return self.greens[i]
+
+        # if the center isn't inside any green, fall back to the first green whose box holds it
+        for i in candidates:
+            bbox = self.green_bboxes[i]
+            if bbox[1] < lat < bbox[3] and bbox[0] < lon < bbox[2]:
+                return self.greens[i]
+
+        print("Error: green could not be found")
+        return None
+
+    # the features that can end up in a hole's image, as east/north arrays: (sand_traps, tee_boxes, fairways, water_hazards, woods, trees)
+
+    def selectLocal(self, frame):
+
+        # the hole image is rotated onto a bigger canvas before drawing, and anything inside that
+        # canvas can be drawn - so keep every feature near the circle the rotated canvas fits in
+        # (plus room for the tree symbols, which reach 56 pixels from their center)
+
+        east_mid = (frame.east_min + frame.east_max) / 2
+        north_mid = (frame.north_min + frame.north_max) / 2
+
+        reach = math.sqrt(2) * math.hypot(frame.east_max - frame.east_min, frame.north_max - frame.north_min) / 2 + 64 * frame.ypp
+
+        selected = []
+
+        for feature_type in FEATURE_TYPES:
+
+            indices = self.query(feature_type, east_mid - reach, north_mid - reach, east_mid + reach, north_mid + reach)
+
+            arrays = self.features[feature_type]
+
+            selected.append([arrays[i] for i in indices])
+
+        # add any ocean/sea polygons derived from coastline ways
+        selected[3].extend(clipCoastlineChains(self.coastline_chains, frame))
+
+        return tuple(selected)
+
+    # the same selection as pixel arrays
+
+    def select(self, frame):
+
+        return tuple([frame.localToPixels(array).astype(np.int64) for array in arrays] for arrays in self.selectLocal(frame))
+
+
+# vector output: a VectorCanvas stands in for a numpy image (same pixel coordinates, same .shape) and
+# records the drawing calls made on it, so the picture can be written out as an SVG or PDF file
+# instead of being rasterized - or rasterized a band at a time (see writeTiledPNG). region() gives a
+# canvas onto part of it (the way a numpy slice would) and clipped() one whose drawing is confined to
+# a polygon
+# points are recorded in pixel-center coordinates (like cv2), and the vector writers shift them by
+# half a pixel, so a pixel (x, y) covers x to x + 1 in the output
+
+# PDF pages are sized as if the image were printed at this many pixels per inch
+PDF_DPI = 300
+
+# Helvetica advance widths (per 1000 units of font size) for the characters used in labels
+HELVETICA_WIDTHS = {" ": 278, ".": 278, "-": 333, "m": 833}
+
+class VectorCanvas:
+
+    def __init__(self, width, height, background=(0, 0, 0)):
+
+        self.width = int(width)
+        self.height = int(height)
+        self.shape = (self.height, self.width, 3)
+        self.background = background
+        self.ops = []
+        self.offset = np.zeros(2, np.int64)
+        self.clip = ()
+
+    # a canvas onto the (width x height) part of this one from (left, top) - drawing on it is shifted
+    # there and clipped to it, and it shares this canvas's display list
+    # (rectangular clips are kept as (x0, y0, x1, y1) pixel ranges, any other clip as a polygon)
+
+    def region(self, left, top, width, height):
+
+        canvas = VectorCanvas.__new__(VectorCanvas)
+        canvas.width = int(width)
+        canvas.height = int(height)
+        canvas.shape = (canvas.height, canvas.width, 3)
+        canvas.background = self.background
+        canvas.ops = self.ops
+        canvas.offset = self.offset + (int(left), int(top))
+        canvas.clip = self.clip + ((int(canvas.offset[0]), int(canvas.offset[1]), int(canvas.offset[0]) + canvas.width, int(canvas.offset[1]) + canvas.height),)
+
+        return canvas
+
+    # a canvas covering this one, with everything drawn on it clipped to a polygon ((N, 2) points)
+
+    def clipped(self, polygon):
+
+        canvas = self.region(0, 0, self.width, self.height)
+        canvas.clip = self.clip + (self.shift(np.asarray(polygon).reshape(-1, 2)),)
+
+        return canvas
+
+    # points on this canvas -> points on the whole canvas
+
+    def shift(self, points):
+
+        return np.asarray(points) + self.offset
+
+    # record a drawing call: its kind (the canvas* primitive it came from), and its arguments with any
+    # points already shifted onto the whole canvas (see _opBounds for the list)
+
+    def record(self, kind, *data):
+
+        self.ops.append((kind, self.clip, data, _opBounds(kind, data)))
+
+    # write the canvas to an .svg or .pdf file, or rasterize it into a .png file (by extension)
+
+    def save(self, path):
+
+        if path.lower().endswith(".pdf"):
+            with open(path, "wb") as f:
+                f.write(self.toPDF())
+        elif path.lower().endswith(".svg"):
+            with open(path, "w") as f:
+                f.write(self.toSVG())
+        else:
+            writeTiledPNG(self, path)
+
+    # draw the (width x height) part of the canvas from (x0, y0) as a numpy image, replaying each
+    # recorded call that reaches it with the same cv2 call the numpy image would have had
+    # (the pixels match drawing the whole canvas, except that cv2 re-rounds polygon edges that run
+    # off the image, so those can land a pixel differently along the band's top and bottom edges)
+
+    def rasterize(self, x0, y0, width, height):
+
+        image = np.zeros((height, width, 3), np.uint8)
+        image[:] = self.background
+
+        for kind, clip, data, bounds in self.ops:
+
+            # the part of the band the call can draw on
+            rx0, ry0, rx1, ry1 = max(x0, 0), max(y0, 0), min(x0 + width, self.width), min(y0 + height, self.height)
+            polygons = []
+
+            for c in clip:
+                if isinstance(c, tuple):
+                    rx0, ry0, rx1, ry1 = max(rx0, c[0]), max(ry0, c[1]), min(rx1, c[2]), min(ry1, c[3])
+                else:
+                    polygons.append(c)
+
+            if rx0 >= rx1 or ry0 >= ry1:
+                continue
+
+            if bounds[0] >= rx1 or bounds[1] >= ry1 or bounds[2] < rx0 or bounds[3] < ry0:
+                continue
+
+            target = image[ry0 - y0:ry1 - y0, rx0 - x0:rx1 - x0]
+            origin = np.array([rx0, ry0])
+
+            if polygons:
+                before = target.copy()
+
+            _replayOp(target, origin, kind, data)
+
+            # anything drawn outside the clip polygons is put back
+            if polygons:
+                outside = np.zeros(target.shape[:2], np.uint8)
+                for polygon in polygons:
+                    inside = np.zeros_like(outside)
+                    cv2.fillPoly(inside, [np.int32(polygon - origin)], 255)
+                    outside |= ~inside
+                outside = outside > 0
+                target[outside] = before[outside]
+
+        return image
+
+    # the recorded calls as vector shapes for the writers, each with its clip as a tuple of polygons:
+    # ("path", (polys, closed, fill, stroke, width, opacity)), ("circle", (center, radius, fill, stroke,
+    # width)), ("text", (text, org, font size, width, color, bold)), ("image", (image, corner, opacity))
+    # or ("trees", (centers, color, radius, thickness))
+
+    def shapes(self):
+
+        yield "path", (), ([np.array([[-0.5, -0.5], [self.width - 0.5, -0.5], [self.width - 0.5, self.height - 0.5], [-0.5, self.height - 0.5]])],
+                           True, self.background, None, 1, 1.0)
+
+        # (each clip has to stay the same object from one call to the next, for the writers' groups)
+        polygons = {}
+        clips = {}
+
+        for kind, clip, data, _ in self.ops:
+
+            if id(clip) not in clips:
+                for c in clip:
+                    if id(c) not in polygons:
+                        polygons[id(c)] = (np.array([[c[0] - 0.5, c[1] - 0.5], [c[2] - 0.5, c[1] - 0.5], [c[2] - 0.5, c[3] - 0.5], [c[0] - 0.5, c[3] - 0.5]])
+                                           if isinstance(c, tuple) else np.asarray(c, dtype=np.float64))
+                clips[id(clip)] = tuple(polygons[id(c)] for c in clip)
+
+            for shape in _vectorShapes(kind, data):
+                yield shape[0], clips[id(clip)], shape[1]
+
+    def toSVG(self):
+
+        out = ['<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+               'width="%d" height="%d" viewBox="0 0 %d %d">' % (self.width, self.height, self.width, self.height),
+               '<g transform="translate(0.5 0.5)">']
+
+        clip_names = {}
+        current = ()
+        trees = 0
+
+        for kind, clip, data in self.shapes():
+
+            # each clip polygon is one nested group
+            if clip is not current:
+                out.append("</g>" * len(current))
+                for polygon in clip:
+                    if id(polygon) not in clip_names:
+                        clip_names[id(polygon)] = ("c%d" % len(clip_names), polygon)
+                        out.append('<clipPath id="%s"><path d="%s"/></clipPath>' % (clip_names[id(polygon)][0], _svgPathData([polygon], True)))
+                    out.append('<g clip-path="url(#%s)">' % clip_names[id(polygon)][0])
+                current = clip
+
+            if kind == "path":
+                polys, closed, fill, stroke, width, opacity = data
+                out.append('<path d="%s"%s%s/>' % (_svgPathData(polys, closed), _svgPaint(fill, stroke, width), _svgOpacity(opacity)))
+
+            elif kind == "circle":
+                center, radius, fill, stroke, width = data
+                out.append('<circle cx="%.1f" cy="%.1f" r="%.1f"%s/>' % (center[0], center[1], radius, _svgPaint(fill, stroke, width)))
+
+            elif kind == "text":
+                text, org, font_size, label_width, color, bold = data
+                out.append('<text x="%.1f" y="%.1f" font-family="Helvetica, Arial, sans-serif" font-size="%.2f"%s fill="%s" '
+                           'textLength="%d" lengthAdjust="spacingAndGlyphs">%s</text>'
+                           % (org[0], org[1], font_size, ' font-weight="bold"' if bold else "", _hexColor(color),
+                              label_width, text.replace("&", "&amp;").replace("<", "&lt;")))
+
+            elif kind == "image":
+                image, corner, opacity = data
+                png = base64.b64encode(cv2.imencode(".png", image)[1].tobytes()).decode("ascii")
+                out.append('<image x="%.1f" y="%.1f" width="%d" height="%d" preserveAspectRatio="none"%s xlink:href="data:image/png;base64,%s"/>'
+                           % (corner[0] - 0.5, corner[1] - 0.5, image.shape[1], image.shape[0], _svgOpacity(opacity), png))
+
+            elif kind == "trees":
+                centers, color, radius, thickness = data
+                name = "t%d" % trees
+                trees += 1
+                out.append('<defs><g id="%s"%s><circle r="%d"/><path d="%s"/></g></defs>'
+                           % (name, _svgPaint(None, color, thickness), radius, _svgPathData(_treeLines(radius), False)))
+                out.extend('<use xlink:href="#%s" x="%.1f" y="%.1f"/>' % (name, x, y) for x, y in centers)
+
+        out.append("</g>" * len(current))
+        out.append("</g></svg>\n")
+
+        return "\n".join(out)
+
+    def toPDF(self):
+
+        s = 72.0 / PDF_DPI
+        page_width, page_height = self.width * s, self.height * s
+
+        # flip to pixel coordinates (y down), shifted half a pixel
+        content = ["%.4f 0 0 %.4f %.4f %.4f cm" % (s, -s, 0.5 * s, page_height - 0.5 * s)]
+
+        states = {}
+        images = []
+        current = ()
+
+        for kind, clip, data in self.shapes():
+
+            if clip is not current:
+                content.append(" ".join(["Q"] * len(current)))
+                for polygon in clip:
+                    content.append("q %s W n" % _pdfPathData([polygon], True))
+                current = clip
+
+            if kind == "path":
+                polys, closed, fill, stroke, width, opacity = data
+                content.append("q %s%s%s %s Q" % (_pdfOpacity(opacity, states), _pdfPaint(fill, stroke, width),
+                                                 _pdfPathData(polys, closed), "f*" if fill is not None else "S"))
+
+            elif kind == "circle":
+                center, radius, fill, stroke, width = data
+                content.append("q %s%s %s Q" % (_pdfPaint(fill, stroke, width), _pdfCircle(center, radius), "f" if fill is not None else "S"))
+
+            elif kind == "text":
+                text, org, font_size, label_width, color, bold = data
+                natural = sum(HELVETICA_WIDTHS.get(c, 556) for c in text) * font_size / 1000
+                escaped = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+                content.append("BT %s rg /%s %.2f Tf %.1f Tz 1 0 0 -1 %.2f %.2f Tm (%s) Tj ET"
+                               % (_pdfColor(color), "F2" if bold else "F1", font_size, 100 * label_width / max(natural, 1e-6),
+                                  org[0], org[1], escaped))
+
+            elif kind == "image":
+                image, corner, opacity = data
+                images.append(image)
+                h, w = image.shape[:2]
+                content.append("q %s%d 0 0 %d %.2f %.2f cm /Im%d Do Q" % (_pdfOpacity(opacity, states), w, -h, corner[0] - 0.5, corner[1] - 0.5 + h, len(images)))
+
+            elif kind == "trees":
+                centers, color, radius, thickness = data
+                lines = _treeLines(radius)
+                content.append("q %s" % _pdfPaint(None, color, thickness))
+                for center in centers:
+                    content.append("%s S %s S" % (_pdfCircle(center, radius), _pdfPathData([line + center for line in lines], False)))
+                content.append("Q")
+
+        content.append(" ".join(["Q"] * len(current)))
+
+        # object 1 is the catalog, 2 the page list, 3 the page, 4 its content, 5 and 6 the fonts,
+        # then one object per transparency state and one per image
+        stream = zlib.compress("\n".join(content).encode("latin-1"))
+
+        objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+                   b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+                   None,
+                   b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream",
+                   b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+                   b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"]
+
+        state_refs = []
+        for opacity, name in sorted(states.items(), key=lambda item: item[1]):
+            objects.append(b"<< /Type /ExtGState /CA %.3f /ca %.3f >>" % (opacity, opacity))
+            state_refs.append(b"/%s %d 0 R" % (name.encode("ascii"), len(objects)))
+
+        image_refs = []
+        for i, image in enumerate(images):
+            data = zlib.compress(cv2.cvtColor(image, cv2.COLOR_BGR2RGB).tobytes())
+            objects.append(b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB /BitsPerComponent 8 "
+                           b"/Filter /FlateDecode /Length %d >>\nstream\n" % (image.shape[1], image.shape[0], len(data)) + data + b"\nendstream")
+            image_refs.append(b"/Im%d %d 0 R" % (i + 1, len(objects)))
+
+        objects[2] = (b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents 4 0 R "
+                      b"/Resources << /Font << /F1 5 0 R /F2 6 0 R >> /ExtGState << %s >> /XObject << %s >> >> >>"
+                      % (page_width, page_height, b" ".join(state_refs), b" ".join(image_refs)))
+
+        pdf = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for i, body in enumerate(objects):
+            offsets.append(len(pdf))
+            pdf += b"%d 0 obj\n" % (i + 1) + body + b"\nendobj\n"
+
+        xref = len(pdf)
+        pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+        pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+        pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+        return bytes(pdf)
+
+
+# the four strokes of a tree symbol's X, as (2, 2) arrays of points around (0, 0) (matching getTreeSprite)
+
+def _treeLines(radius):
+
+    d = int(radius * math.cos(math.pi/4))
+
+    return [np.array(line, dtype=np.float64) for line in
+            ([[0, -radius], [0, radius]], [[-radius, 0], [radius, 0]], [[d, d], [-d, -d]], [[-d, d], [d, -d]])]
+
+
+def _hexColor(color):
+
+    return "#%02x%02x%02x" % (int(color[2]), int(color[1]), int(color[0]))
+
+
+def _svgPathData(polys, closed):
+
+    parts = []
+    for poly in polys:
+        coords = " ".join("%g,%g" % (x, y) for x, y in np.round(poly, 1))
+        parts.append("M" + coords.replace(" ", " L", 1) + (" Z" if closed else ""))
+
+    return " ".join(parts)
+
+
+def _svgPaint(fill, stroke, width):
+
+    if stroke is None:
+        return ' fill="%s" fill-rule="evenodd"' % _hexColor(fill)
+
+    return (' fill="%s" stroke="%s" stroke-width="%s" stroke-linecap="round" stroke-linejoin="round"'
+            % (_hexColor(fill) if fill is not None else "none", _hexColor(stroke), width))
+
+
+def _svgOpacity(opacity):
+
+    return ' opacity="%.3f"' % opacity if opacity < 1 else ""
+
+
+def _pdfColor(color):
+
+    return "%.3f %.3f %.3f" % (color[2] / 255, color[1] / 255, color[0] / 255)
+
+
+def _pdfPathData(polys, closed):
+
+    parts = []
+    for poly in polys:
+        poly = np.round(np.asarray(poly), 1)
+        parts.append("%g %g m " % tuple(poly[0]) + " ".join("%g %g l" % (x, y) for x, y in poly[1:]) + (" h" if closed else ""))
+
+    return " ".join(parts)
+
+
+def _pdfPaint(fill, stroke, width):
+
+    if stroke is None:
+        return "%s rg " % _pdfColor(fill)
+
+    return "%s RG %s w 1 J 1 j " % (_pdfColor(stroke), width)
+
+
+def _pdfOpacity(opacity, states):
+
+    if opacity >= 1:
+        return ""
+
+    if opacity not in states:
+        states[opacity] = "GS%d" % (len(states) + 1)
+
+    return "/%s gs " % states[opacity]
+
+
+def _pdfCircle(center, radius):
+
+    # four Bezier quarter circles
+    x, y = center
+    k = 0.5523 * radius
+
+    return ("%.1f %.1f m %.1f %.1f %.1f %.1f %.1f %.1f c %.1f %.1f %.1f %.1f %.1f %.1f c "
+            "%.1f %.1f %.1f %.1f %.1f %.1f c %.1f %.1f %.1f %.1f %.1f %.1f c h"
+            % (x + radius, y,
+               x + radius, y + k, x + k, y + radius, x, y + radius,
+               x - k, y + radius, x - radius, y + k, x - radius, y,
+               x - radius, y - k, x - k, y - radius, x, y - radius,
+               x + k, y - radius, x + radius, y - k, x + radius, y))
+
+
+# points along an elliptical arc, the way cv2.ellipse draws it (angles in degrees, clockwise on screen)
+
+def ellipseArcPoints(center, axes, angle, start_angle, end_angle):
+
+    t = np.radians(np.linspace(start_angle, end_angle, max(2, int(abs(end_angle - start_angle)) + 1)))
+    a = math.radians(angle)
+
+    x = axes[0] * np.cos(t)
+    y = axes[1] * np.sin(t)
+
+    return np.stack([center[0] + x * math.cos(a) - y * math.sin(a), center[1] + x * math.sin(a) + y * math.cos(a)], axis=1)
+
+
+# the bounding box (x0, y0, x1, y1, inclusive, with room for line widths) of a recorded call - the
+# calls are:
+#   ("fill", polys, color), ("polylines", polys, closed, color, thickness, line type, opacity),
+#   ("line", pt1, pt2, color, thickness), ("circle", center, radius, color, thickness),
+#   ("rectangle", pt1, pt2, color, thickness),
+#   ("ellipse", center, axes, angle, start angle, end angle, color, thickness),
+#   ("text", text, org, text size, color, weight), ("arrow", pt1, pt2, color, thickness, tip length),
+#   ("image", image, corner, opacity), ("trees", centers, color, radius, thickness),
+#   ("canopy", coverage, corner, color)
+
+def _opBounds(kind, data):
+
+    if kind == "fill" or kind == "polylines":
+        polys = [poly for poly in data[0] if len(poly) > 0]
+        if not polys:
+            return (0, 0, -1, -1)
+        points = np.concatenate(polys)
+        pad = data[3] + 1 if kind == "polylines" else 1
+    elif kind == "line" or kind == "rectangle":
+        points = np.array([data[0], data[1]])
+        pad = abs(data[3]) + 1
+    elif kind == "arrow":
+        points = np.array([data[0], data[1]])
+        pad = data[3] + 1 + math.hypot(*(points[1] - points[0])) * data[4]
+    elif kind == "circle":
+        points = np.array([data[0]])
+        pad = data[1] + abs(data[3]) + 1
+    elif kind == "ellipse":
+        points = np.array([data[0]])
+        pad = max(data[1]) + abs(data[6]) + 1
+    elif kind == "text":
+        (label_width, label_height), baseline = cv2.getTextSize(data[0], cv2.FONT_HERSHEY_SIMPLEX, data[2], data[4])
+        points = np.array([[data[1][0], data[1][1] - label_height], [data[1][0] + label_width, data[1][1] + baseline]])
+        pad = data[4] + 2
+    elif kind == "image" or kind == "canopy":
+        h, w = data[0].shape[:2]
+        points = np.array([data[1], (data[1][0] + w - 1, data[1][1] + h - 1)])
+        pad = 0
+    else:
+        points = data[0]
+        pad = data[2] + data[3] + 1
+
+    (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+
+    return (int(math.floor(x0 - pad)), int(math.floor(y0 - pad)), int(math.ceil(x1 + pad)), int(math.ceil(y1 + pad)))
+
+
+# replay a recorded call onto (part of) a numpy image whose top left pixel is at origin on the canvas
+
+def _replayOp(image, origin, kind, data):
+
+    def at(point):
+        return tuple(int(v) for v in np.asarray(point) - origin)
+
+    if kind == "fill":
+        canvasFillPoly(image, [np.int32(poly - origin) for poly in data[0]], data[1])
+
+    elif kind == "polylines":
+        polys, closed, color, thickness, line_type, opacity = data
+        polys = [np.int32(poly - origin) for poly in polys]
+        if opacity >= 1:
+            canvasPolylines(image, polys, closed, color, thickness, line_type)
+        else:
+            blendPolylines(image, polys, closed, color, thickness, opacity, line_type)
+
+    elif kind == "line":
+        canvasLine(image, at(data[0]), at(data[1]), data[2], data[3])
+
+    elif kind == "circle":
+        canvasCircle(image, at(data[0]), data[1], data[2], data[3])
+
+    elif kind == "rectangle":
+        canvasRectangle(image, at(data[0]), at(data[1]), data[2], data[3])
+
+    elif kind == "ellipse":
+        canvasEllipse(image, at(data[0]), *data[1:])
+
+    elif kind == "text":
+        canvasPutText(image, data[0], at(data[1]), *data[2:])
+
+    elif kind == "arrow":
+        canvasArrowedLine(image, at(data[0]), at(data[1]), *data[2:])
+
+    elif kind == "image":
+        picture, corner, opacity = data
+        x0, y0 = at(corner)
+        h, w = image.shape[:2]
+        ix0, iy0 = max(x0, 0), max(y0, 0)
+        ix1, iy1 = min(x0 + picture.shape[1], w), min(y0 + picture.shape[0], h)
+        if ix0 < ix1 and iy0 < iy1:
+            region = image[iy0:iy1, ix0:ix1]
+            region[:] = cv2.addWeighted(picture[iy0 - y0:iy1 - y0, ix0 - x0:ix1 - x0], opacity, region, 1.0 - opacity, 0)
+
+    elif kind == "trees":
+        centers, color, radius, thickness = data
+        centers = centers - origin
+        r = radius + thickness
+        h, w = image.shape[:2]
+        centers = centers[(centers[:, 0] >= -r) & (centers[:, 0] < w + r) & (centers[:, 1] >= -r) & (centers[:, 1] < h + r)]
+        if len(centers) > 0:
+            stampSprite(image, centers, getTreeSprite(radius, thickness), color)
+
+    elif kind == "canopy":
+        coverage, corner, color = data
+        x0, y0 = at(corner)
+        blendCoverage(image, coverage, x0, y0, color)
+
+
+# a recorded call as vector shapes (see VectorCanvas.shapes)
+
+def _vectorShapes(kind, data):
+
+    if kind == "fill":
+        polys = [np.asarray(poly, dtype=np.float64) for poly in data[0] if len(poly) > 0]
+        if polys:
+            yield "path", (polys, True, data[1], None, 1, 1.0)
+
+    elif kind == "polylines":
+        polys, closed, color, thickness, _, opacity = data
+        polys = [np.asarray(poly, dtype=np.float64) for poly in polys if len(poly) > 0]
+        if polys:
+            yield "path", (polys, closed, None, color, thickness, opacity)
+
+    elif kind == "line":
+        pt1, pt2, color, thickness = data
+        yield "path", ([np.array([pt1, pt2], dtype=np.float64)], False, None, color, thickness, 1.0)
+
+    elif kind == "circle":
+        center, radius, color, thickness = data
+        if thickness < 0:
+            yield "circle", (center, radius, color, None, 1)
+        else:
+            yield "circle", (center, radius, None, color, thickness)
+
+    elif kind == "rectangle":
+        (x1, y1), (x2, y2), color, thickness = data
+        if thickness < 0:
+            # a filled rectangle covers both corner pixels
+            yield "path", ([np.array([[x1 - 0.5, y1 - 0.5], [x2 + 0.5, y1 - 0.5], [x2 + 0.5, y2 + 0.5], [x1 - 0.5, y2 + 0.5]])], True, color, None, 1, 1.0)
+        else:
+            yield "path", ([np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float64)], True, None, color, thickness, 1.0)
+
+    elif kind == "ellipse":
+        center, axes, angle, start_angle, end_angle, color, thickness = data
+        yield "path", ([ellipseArcPoints(center, axes, angle, start_angle, end_angle)], False, None, color, thickness, 1.0)
+
+    elif kind == "text":
+        text, org, text_size, color, weight = data
+        (label_width, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, text_size, weight)
+        # text sized to cover the same box that cv2's FONT_HERSHEY_SIMPLEX would: cv2's digits are 21
+        # units tall (plus the stroke), Helvetica's are 0.718 of the font size
+        font_size = (21 * text_size + weight - 1) / 0.718
+        yield "text", (text, np.asarray(org, dtype=np.float64), font_size, label_width, color, weight >= 2)
+
+    elif kind == "arrow":
+        pt1, pt2, color, thickness, tip_length = data
+        # the same arrow head cv2.arrowedLine draws: two strokes at 45 degrees to the shaft
+        tip = math.hypot(pt1[0] - pt2[0], pt1[1] - pt2[1]) * tip_length
+        angle = math.atan2(pt1[1] - pt2[1], pt1[0] - pt2[0])
+        heads = [np.array([(pt2[0] + tip * math.cos(angle + d), pt2[1] + tip * math.sin(angle + d)), pt2], dtype=np.float64) for d in (math.pi/4, -math.pi/4)]
+        yield "path", ([np.array([pt1, pt2], dtype=np.float64)] + heads, False, None, color, thickness, 1.0)
+
+    elif kind == "image":
+        yield "image", data
+
+    elif kind == "trees":
+        yield "trees", data
+
+    elif kind == "canopy":
+        # the canopy outlines become polygons (with holes, drawn even-odd)
+        coverage, corner, color = data
+        outlines, _ = cv2.findContours((coverage > 0).astype(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        if outlines:
+            yield "path", ([outline.reshape(-1, 2) + corner for outline in outlines], True, color, None, 1, 1.0)
+
+
+# drawing primitives: each one draws on a numpy image with cv2 (the default), or records the same
+# call on a VectorCanvas
+
+def canvasFillPoly(image, pts, color):
+
+    if isinstance(image, VectorCanvas):
+        image.record("fill", [image.shift(np.asarray(poly).reshape(-1, 2)) for poly in pts], color)
+    else:
+        cv2.fillPoly(image, pts, color)
+
+
+def canvasPolylines(image, pts, closed, color, thickness, line_type=cv2.LINE_8):
+
+    if isinstance(image, VectorCanvas):
+        image.record("polylines", [image.shift(np.asarray(poly).reshape(-1, 2)) for poly in pts], closed, color, thickness, line_type, 1.0)
+    else:
+        cv2.polylines(image, pts, closed, color, thickness, lineType=line_type)
+
+
+def canvasLine(image, pt1, pt2, color, thickness):
+
+    if isinstance(image, VectorCanvas):
+        image.record("line", image.shift(pt1), image.shift(pt2), color, thickness)
+    else:
+        cv2.line(image, pt1, pt2, color, thickness=thickness)
+
+
+def canvasCircle(image, center, radius, color, thickness):
+
+    if isinstance(image, VectorCanvas):
+        image.record("circle", image.shift(center), radius, color, thickness)
+    else:
+        cv2.circle(image, center, radius, color, thickness=thickness)
+
+
+def canvasRectangle(image, pt1, pt2, color, thickness):
+
+    if isinstance(image, VectorCanvas):
+        image.record("rectangle", image.shift(pt1), image.shift(pt2), color, thickness)
+    else:
+        cv2.rectangle(image, pt1, pt2, color, thickness)
+
+
+def canvasEllipse(image, center, axes, angle, start_angle, end_angle, color, thickness):
+
+    if isinstance(image, VectorCanvas):
+        image.record("ellipse", image.shift(center), axes, angle, start_angle, end_angle, color, thickness)
+    else:
+        cv2.ellipse(image, center, axes, angle, start_angle, end_angle, color, thickness)
+
+
+def canvasPutText(image, text, org, text_size, color, weight):
+
+    if isinstance(image, VectorCanvas):
+        image.record("text", text, image.shift(org), text_size, color, weight)
+    else:
+        cv2.putText(image, text, org, cv2.FONT_HERSHEY_SIMPLEX, text_size, color, weight)
+
+
+def canvasArrowedLine(image, pt1, pt2, color, thickness, tip_length):
+
+    if isinstance(image, VectorCanvas):
+        image.record("arrow", image.shift(pt1), image.shift(pt2), color, thickness, tip_length)
+    else:
+        cv2.arrowedLine(image, pt1, pt2, color, thickness=thickness, tipLength=tip_length, line_type=cv2.LINE_8)
+
+
+# tiled PNG output: a large canvas is rasterized TILE_ROWS rows at a time, and each band is filtered,
+# compressed and written out before the next one is drawn, so only one band is ever in memory
+# each band is drawn with TILE_MARGIN extra rows above and below (then trimmed), so the lines and
+# text that cross the band edges are clipped by cv2 away from the rows that are kept
+# only the drawing is tiled: with topo on, a hole's elevation image, its smoothed copy and the contour
+# bands are still whole-hole arrays (about 10 bytes a pixel), so at a small yards_per_pixel topo, not
+# the image, sets the peak memory
+
+TILE_ROWS = 256
+TILE_MARGIN = 16
+
+class PNGWriter:
+
+    def __init__(self, path, width, height):
+
+        self.file = open(path, "wb")
+        self.width = width
+        self.previous = np.zeros(width * 3, np.uint8)
+        self.compressor = zlib.compressobj(6)
+
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self.chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def chunk(self, kind, data):
+
+        self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff))
+
+    # add a band of rows (a BGR numpy image as wide as the PNG)
+    # every row is stored with the Up filter (as its difference from the row above), which is quick
+    # to work out for a whole band at once and suits these mostly flat-colored maps
+
+    def write(self, band):
+
+        raw = cv2.cvtColor(band, cv2.COLOR_BGR2RGB).reshape(len(band), -1)
+
+        rows = np.empty((len(band), raw.shape[1] + 1), np.uint8)
+        rows[:, 0] = 2
+        rows[:, 1:] = raw
+        rows[0, 1:] -= self.previous
+        rows[1:, 1:] -= raw[:-1]
+
+        self.previous = raw[-1].copy()
+
+        data = self.compressor.compress(rows.tobytes())
+        if data:
+            self.chunk(b"IDAT", data)
+
+    def close(self):
+
+        self.chunk(b"IDAT", self.compressor.flush())
+        self.chunk(b"IEND", b"")
+        self.file.close()
+
+
+# rasterize a VectorCanvas into a PNG file one band at a time
+
+def writeTiledPNG(canvas, path, tile_rows=TILE_ROWS):
+
+    writer = PNGWriter(path, canvas.width, canvas.height)
+
+    try:
+        for y in range(0, canvas.height, tile_rows):
+            rows = min(tile_rows, canvas.height - y)
+            band = canvas.rasterize(0, y - TILE_MARGIN, canvas.width, rows + 2 * TILE_MARGIN)
+            writer.write(band[TILE_MARGIN:TILE_MARGIN + rows])
+    finally:
+        writer.close()
+
+
+# write a finished image out - a numpy image as a PNG (with cv2), a VectorCanvas as SVG, PDF or a
+# tiled PNG
+
+def saveImage(image, path):
+
+    if isinstance(image, VectorCanvas):
+        image.save(path)
+    else:
+        cv2.imwrite(path, image)
+
+
+# a list of polygons ready to draw: every feature is cast to int32 once, up front, and the polygons
+# are split into batches whose bounding boxes don't touch
+# (rounding down rather than toward zero, so points left of or above the image land the same way
+# whether we draw on the whole rotated image or a window cut out of it)
+# each batch is filled with a single cv2.fillPoly call - fillPoly treats everything it's given as
+# one shape (even-odd), so overlapping polygons in the same call would cut holes in each other
+
+class PolygonLayer:
+
+    def __init__(self, feature_list):
+
+        self.contours = []
+        self.batches = []
+
+        feature_list = [array for array in feature_list if len(array) > 0]
+
+        if not feature_list:
+            return
+
+        lengths = np.array([len(array) for array in feature_list])
+        starts = np.cumsum(lengths) - lengths
+
+        points = np.int32(np.floor(np.concatenate(feature_list).reshape(-1, 2)))
+
+        self.contours = np.split(points, starts[1:])
+
+        bboxes = np.hstack([np.minimum.reduceat(points, starts, axis=0),
+                            np.maximum.reduceat(points, starts, axis=0)])
+
+        self.batches = [[self.contours[i] for i in batch] for batch in groupDisjointBoxes(bboxes)]
+
+
+# split boxes ((N, 4) array of xmin, ymin, xmax, ymax) into groups in which no two boxes touch
+# boxes count as touching within one pixel, so polygons that share an edge aren't filled together either
+
+def groupDisjointBoxes(bboxes):
+
+    bboxes = np.asarray(bboxes)
+    n = len(bboxes)
+
+    if n == 0:
+        return []
+
+    # find every touching pair at once: sort the boxes by left edge, pair each box with the ones
+    # that start before it ends, then keep the pairs that overlap vertically too
+    order = np.argsort(bboxes[:, 0], kind="stable")
+    boxes = bboxes[order]
+
+    ends = np.searchsorted(boxes[:, 0], boxes[:, 2] + 1, side="right")
+    counts = np.maximum(ends - np.arange(n) - 1, 0)
+
+    first = np.repeat(np.arange(n), counts)
+    second = first + 1 + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+    touching = (boxes[first, 1] <= boxes[second, 3] + 1) & (boxes[first, 3] >= boxes[second, 1] - 1)
+
+    pairs = np.sort(np.stack([order[first[touching]], order[second[touching]]], axis=1), axis=1)
+
+    # boxes that touch nothing all go in the first group; the rest go (in order) into the
+    # first group that none of the earlier boxes they touch are in
+    group_of = np.zeros(n, dtype=np.int64)
+
+    earlier_neighbors = {}
+    for a, b in pairs.tolist():
+        earlier_neighbors.setdefault(b, []).append(a)
+
+    for i in sorted(earlier_neighbors):
+        taken = set(group_of[earlier_neighbors[i]].tolist())
+        group = 0
+        while group in taken:
+            group += 1
+        group_of[i] = group
+
+    return [np.nonzero(group_of == g)[0].tolist() for g in range(int(group_of.max()) + 1)]
+
+
+# for a list of arrays (or a PolygonLayer) and an image, draw each array as a polygon on the image
+# (in a given color), with one fillPoly call per batch of non-overlapping polygons
+
+def drawFeatures(image, feature_list, color, line=-1):
+    
+    # print('Drawing hole features: ', datetime.now().time())
+
+    if not isinstance(feature_list, PolygonLayer):
+        feature_list = PolygonLayer(feature_list)
+
+    for batch in feature_list.batches:
+        canvasFillPoly(image, batch, color)
+
+    if line > 0 and feature_list.contours:
+        # need to redraw a line since fillPoly has no line thickness options that I've found
+        canvasPolylines(image, feature_list.contours, True, (0,0,0), line, line_type=cv2.LINE_AA)
+
+
+# tree symbols are a circle with an X inside, drawn once into a sprite (per size) and then stamped
+# at every tree, instead of drawing a circle and four lines for each tree
+
+TREE_RADIUS = 50
+TREE_THICKNESS = 6
+
+# in canopy mode, groups of at least this many overlapping trees are drawn as one canopy blob
+TREE_CANOPY_MIN_TREES = 3
+
+_tree_sprites = {}
+
+
+# the tree symbol as a float32 alpha sprite, centered in a (2r + 1) square
+
+def getTreeSprite(radius=TREE_RADIUS, thickness=TREE_THICKNESS):
+
+    key = ("symbol", radius, thickness)
+
+    if key not in _tree_sprites:
+
+        r = radius + thickness
+        sprite = np.zeros((2 * r + 1, 2 * r + 1), np.uint8)
+
+        x = y = r
+
+        cv2.circle(sprite, (x,y), radius, 255, thickness=thickness)
+
+        cv2.line(sprite, (x, y - radius), (x, y + radius), 255, thickness=thickness)
+        cv2.line(sprite, (x - radius, y), (x + radius, y), 255, thickness=thickness)
+
+        tr = (x + int(radius * math.cos(math.pi/4)),y + int(radius * math.sin(math.pi/4)))
+        bl = (x + int(radius * math.cos(5*math.pi/4)),y + int(radius * math.sin(5*math.pi/4)))
+
+        cv2.line(sprite, tr, bl, 255, thickness=thickness)
+
+        tl = (x + int(radius * math.cos(3*math.pi/4)),y + int(radius * math.sin(3*math.pi/4)))
+        br = (x + int(radius * math.cos(7*math.pi/4)),y + int(radius * math.sin(7*math.pi/4)))
+
+        cv2.line(sprite, tl, br, 255, thickness=thickness)
+
+        _tree_sprites[key] = sprite.astype(np.float32) / 255
+
+    return _tree_sprites[key]
+
+
+# a filled disc the size of a tree symbol, for finding overlapping trees in canopy mode
+
+def getCanopySprite(radius=TREE_RADIUS, thickness=TREE_THICKNESS):
+
+    key = ("canopy", radius, thickness)
+
+    if key not in _tree_sprites:
+
+        r = radius + thickness
+        sprite = np.zeros((2 * r + 1, 2 * r + 1), np.uint8)
+
+        cv2.circle(sprite, (r, r), radius + thickness // 2, 255, thickness=-1)
+
+        _tree_sprites[key] = sprite.astype(np.float32) / 255
+
+    return _tree_sprites[key]
+
+
+# the pixels covered by a sprite stamped at each center ((N, 2) int array of x, y), as a coverage
+# array (the highest alpha at each pixel) over the box from (x0, y0) that holds all the stamps
+# each stamp is a np.maximum into a slice of the coverage array, so nothing bigger than the
+# coverage array itself is ever allocated
+
+def getSpriteCoverage(centers, sprite):
+
+    size = sprite.shape[0]
+    r = size // 2
+
+    x0, y0 = centers.min(axis=0) - r
+    x1, y1 = centers.max(axis=0) + r + 1
+
+    coverage = np.zeros((y1 - y0, x1 - x0), np.float32)
+
+    for x, y in (centers - (x0 + r, y0 + r)).tolist():
+        stamp = coverage[y:y + size, x:x + size]
+        np.maximum(stamp, sprite, out=stamp)
+
+    return coverage, int(x0), int(y0)
+
+
+# paint a color into an image wherever a sprite stamped at each center ((N, 2) int array of x, y)
+# covers it, one slice of the image per stamp, clipping at the image edge
+# (the tree sprites are opaque - alpha 0 or 1 - so painting the color is the same as blending it)
+
+def stampSprite(image, centers, sprite, color):
+
+    h, w = image.shape[:2]
+    size = sprite.shape[0]
+    r = size // 2
+
+    covered = (sprite > 0).astype(np.uint8)
+    patch = np.empty((size, size) + image.shape[2:], image.dtype)
+    patch[:] = color
+
+    for x, y in (centers - r).tolist():
+
+        ix0, iy0 = max(x, 0), max(y, 0)
+        ix1, iy1 = min(x + size, w), min(y + size, h)
+
+        if ix0 >= ix1 or iy0 >= iy1:
+            continue
+
+        sx, sy = slice(ix0 - x, ix1 - x), slice(iy0 - y, iy1 - y)
+        cv2.copyTo(patch[sy, sx], covered[sy, sx], image[iy0:iy1, ix0:ix1])
+
+
+# blend a color into an image wherever the coverage array (placed at x0, y0) is non-zero,
+# clipping at the image edge
+# (a strip of BLEND_ROWS rows at a time, skipping strips with nothing in them, so the temporary
+# arrays stay small however much of the image the coverage spans)
+
+def blendCoverage(image, coverage, x0, y0, color):
+
+    h, w = image.shape[:2]
+    ch, cw = coverage.shape
+
+    ix0, iy0 = max(x0, 0), max(y0, 0)
+    ix1, iy1 = min(x0 + cw, w), min(y0 + ch, h)
+
+    color = np.array(color, dtype=np.float32)
+
+    for top in range(iy0, iy1, BLEND_ROWS):
+
+        bottom = min(top + BLEND_ROWS, iy1)
+
+        alpha = coverage[top - y0:bottom - y0, ix0 - x0:ix1 - x0]
+        mask = alpha > 0
+
+        if not mask.any():
+            continue
+
+        region = image[top:bottom, ix0:ix1]
+        a = alpha[mask][:, None]
+
+        region[mask] = np.round(region[mask] * (1 - a) + color * a).astype(np.uint8)
+
+
+# for a list of tree nodes and an image, draw each tree on the image
+# with canopy set, groups of overlapping trees (TREE_CANOPY_MIN_TREES or more) become one filled canopy
+# instead of a pile of symbols
+
+def drawTrees(image, feature_list, color, canopy=False, radius=TREE_RADIUS, thickness=TREE_THICKNESS):
+
+    if not feature_list:
+        return
+
+    centers = np.int32(np.floor(np.concatenate(feature_list).reshape(-1, 2))).astype(np.int64)
+
+    if canopy:
+
+        coverage, x0, y0 = getSpriteCoverage(centers, getCanopySprite(radius, thickness))
+
+        # label each separate blob, and count how many trees are in each
+        count, labels = cv2.connectedComponents((coverage > 0).astype(np.uint8))
+        tree_labels = labels[centers[:, 1] - y0, centers[:, 0] - x0]
+        trees_per_label = np.bincount(tree_labels, minlength=count)
+
+        canopy_labels = trees_per_label >= TREE_CANOPY_MIN_TREES
+        canopy_labels[0] = False
+
+        if isinstance(image, VectorCanvas):
+            image.record("canopy", canopy_labels[labels].astype(np.float32), image.shift((x0, y0)), color)
+        else:
+            blendCoverage(image, canopy_labels[labels].astype(np.float32), x0, y0, color)
 
-            w[i,0] = newx
-            w[i,1] = newy
+        # everything else still gets its own symbol
+        centers = centers[~canopy_labels[tree_labels]]
 
-            minx = min(x, minx)
-            miny = min(y, miny)
-            maxx = max(x, maxx)
-            maxy = max(y, maxy)
+        if len(centers) == 0:
+            return
 
-        output_list.append(w)
+    if isinstance(image, VectorCanvas):
+        image.record("trees", image.shift(centers), color, radius, thickness)
+        return
 
-    return output_list, minx, miny, maxx, maxy
+    stampSprite(image, centers, getTreeSprite(radius, thickness), color)
 
 
 # take a properly rotated hole from OSM and create a bounding box around it
@@ -784,9 +2547,6 @@ def filterArrayList(rotated_hole_array, feature_list, ypp, par, tee_box=0, fairw
         midpoint = hole_node_list[1]
 
 
-    # define an empty result list
-    filtered_list = []
-
     box_width = bb_xmax - bb_xmin
 
 
@@ -803,131 +2563,85 @@ def filterArrayList(rotated_hole_array, feature_list, ypp, par, tee_box=0, fairw
     # optional parameters to control how features are filtered near the tee box
     small = filter_yards * small_filter #0.5
     med = filter_yards * med_filter #0.75
-    # lg =  box_width - (box_width / 1.25)
-
-
-    for array in feature_list:
 
-        centroid = array.mean(axis=0)
 
-        x = float(centroid[0])
-        y = float(centroid[1])
-
-        # filter to see whether the point is within 75 yards
-        # of the tee box (near tee) or within 150 yards (short range)
-
-        nearest_tee = ((bb_ymax - y)*ypp < 75)
-        short_range = ((bb_ymax - y)*ypp < 150)
-        # mid_range = ((bb_ymax - y)*ypp < 200)
+    # all the checks below run on every feature at once: stack the points of all the
+    # features into one array and note where each feature starts
+    # (a feature with no points can't be placed, so it never makes it through)
 
-        if par == 3:
-            # for par 3s, don't filter anything more constrained than the initial box
-            # so, ignore whether the object is close to the tee box
+    lengths = np.array([len(array) for array in feature_list])
+    indices = np.nonzero(lengths)[0]
 
-            nearest_tee = False
-            short_range = False
-            # mid_range = False
+    if len(indices) == 0:
+        return []
 
+    starts = (np.cumsum(lengths) - lengths)[indices]
+    lengths = lengths[indices]
 
-        # first step - if the center of our object is outside the hole bounding box,
-        # let's filter it out.
-        # when draw_all_fairways is True, fairways skip the centroid y check so that
-        # shared fairways (e.g. North Berwick 1/18) that extend past the green aren't
-        # dropped before the extent check below gets a chance to evaluate them.
+    points = np.concatenate(feature_list).reshape(-1, 2).astype(np.float64, copy=False)
 
-        if x < bb_xmin or x > bb_xmax:
-            continue
+    centroids = np.add.reduceat(points, starts, axis=0) / lengths[:, None]
 
-        if not (fairway and draw_all_fairways):
-            if y > bb_ymax or y < (bb_ymin + tee_box_filter):
-                # print("Object outside bounding box filtered out")
-                continue
+    x = centroids[:, 0]
+    y = centroids[:, 1]
 
 
-        # we can add another easy check for whether a fairway belongs to the
-        # current hole by seeing if it has any points that go behind the tee box or
-        # past the green - if it does, we'll filter it out.
-        # when draw_all_fairways is True, only filter if there is no y-range overlap
-        # at all, so shared fairways that extend beyond the green are still drawn.
+    # first step - if the center of our object is outside the hole bounding box,
+    # let's filter it out.
+    # when draw_all_fairways is True, fairways skip the centroid y check so that
+    # shared fairways (e.g. North Berwick 1/18) that extend past the green aren't
+    # dropped before the extent check below gets a chance to evaluate them.
 
-        if fairway == 1:
+    keep = ~((x < bb_xmin) | (x > bb_xmax))
 
-            pointlist = array.tolist()
-            maxpoint = minpoint = pointlist[0]
+    if not (fairway and draw_all_fairways):
+        keep &= ~((y > bb_ymax) | (y < (bb_ymin + tee_box_filter)))
 
-            for point in pointlist:
-                if point[1] > maxpoint[1]:
-                    maxpoint = point
-                if point[1] < minpoint[1]:
-                    minpoint = point
 
-            if draw_all_fairways:
-                if maxpoint[1] < bb_ymin or minpoint[1] > bb_ymax:
-                    # print("Fairway filtered out - no y-range overlap with hole")
-                    continue
-            else:
-                if maxpoint[1] > bb_ymax or minpoint[1] < bb_ymin:
-                    # print("Fairway filtered out - points outside of bounding box")
-                    continue
+    # we can add another easy check for whether a fairway belongs to the
+    # current hole by seeing if it has any points that go behind the tee box or
+    # past the green - if it does, we'll filter it out.
+    # when draw_all_fairways is True, only filter if there is no y-range overlap
+    # at all, so shared fairways that extend beyond the green are still drawn.
 
+    if fairway == 1:
 
-        # now we're getting to trickier filtering
-        # we want to calculate how far away the object is from the "center line" of the hole
+        max_y = np.maximum.reduceat(points[:, 1], starts)
+        min_y = np.minimum.reduceat(points[:, 1], starts)
 
-        if y < midpoint[1]:
-            dist_to_way = distToLine(centroid,midpoint,green_center,ypp)
+        if draw_all_fairways:
+            keep &= ~((max_y < bb_ymin) | (min_y > bb_ymax))
         else:
-            dist_to_way = distToLine(centroid,midpoint,hole_origin,ypp)
-
-        # # print("Bounding box nearest tees: x from",(bb_xmin + (30/ypp)), "to",(bb_xmax - (30/ypp)),"y from", bb_ymin, "to", bb_ymax)
-        # # print("Bounding box for tee boxes nearest tees: x from",
-        # (bb_xmin + (30/ypp)), "to",(bb_xmax - (30/ypp)),"y from", (bb_ymin + (tee_box * 190 / ypp)), "to", bb_ymax)
-
-        # if constrained:
+            keep &= ~((max_y > bb_ymax) | (min_y < bb_ymin))
 
-        #     if x > bb_xmin and x < bb_xmax and y > (bb_ymin + (tee_box * 190 / ypp)) and y < bb_ymax:
-        #         filtered_list.append(array)
-        #     else:
-        #         print("Array filtered out:", centroid)
-
-        # else:
 
+    # now we're getting to trickier filtering
+    # we want to calculate how far away the object is from the "center line" of the hole
+    # (the midpoint-to-green line past the midpoint, the midpoint-to-tee line before it)
 
-        # now we are going to filter based on hole width - if something is too far
-        # to the left or right, we'll assume it's from a different hole and filter it out.
-        # (again, there is an option to filter more aggressively near the tee box)
+    dist_to_way = np.where(y < midpoint[1],
+                           distToLineArray(centroids, midpoint, green_center, ypp),
+                           distToLineArray(centroids, midpoint, hole_origin, ypp))
 
-        if nearest_tee:
-            if dist_to_way < small:
-                filtered_list.append(array)
-            # else:
-                # print("Array filtered out:", centroid)
 
-        elif short_range:
-            if dist_to_way < med:
-                filtered_list.append(array)
-            # else:
-                # print("Array filtered out:", centroid)
+    # now we are going to filter based on hole width - if something is too far
+    # to the left or right, we'll assume it's from a different hole and filter it out.
+    # (again, there is an option to filter more aggressively near the tee box: within
+    # 75 yards of the tee box (near tee) or within 150 yards (short range))
+    # for par 3s, don't filter anything more constrained than the initial box,
+    # so ignore whether the object is close to the tee box
 
-        else:
-            if dist_to_way < filter_yards:
-                filtered_list.append(array)
-            # else:
-                # print("Array filtered out:", centroid)
+    if par == 3:
+        limit = filter_yards
+    else:
+        nearest_tee = ((bb_ymax - y)*ypp < 75)
+        short_range = ((bb_ymax - y)*ypp < 150)
 
-        # elif mid_range:
-        #     if x > (bb_xmin + lg/2) and x < (bb_xmax - lg/2) and y > (bb_ymin + tee_box_filter) and y < bb_ymax:
-        #         filtered_list.append(array)
-        #     else:
-        #         print("Array filtered out:", centroid)
+        limit = np.where(nearest_tee, small, np.where(short_range, med, filter_yards))
 
-        # else:
-        #     if x > bb_xmin and x < bb_xmax and y > (bb_ymin + tee_box_filter) and y < bb_ymax:
-        #         filtered_list.append(array)
-        #     else:
-        #         print("Array filtered out:", centroid)
+    keep &= dist_to_way < limit
 
-    return filtered_list
+    return [feature_list[indices[i]] for i in np.nonzero(keep)[0]]
 
 
 # calculate the angle from the center of the green to an arbitrary point
@@ -1073,69 +2787,101 @@ def Rotate2D(pts,cnt,ang):
         [-math.sin(ang),math.cos(ang)]]))+cnt
 
 
-# rotate an array (such as a sand trap) by the appropriate angle to show
-# the hole running from bottom to top
+# where the corners of an image of this shape end up after rotating it by angle (about its center) to
+# show the hole running from bottom to top
+# returns ymin, xmin, ymax, xmax (the rotated image's extent, relative to the original)
+
+def getRotatedBounds(image_shape, angle):
+
+    (h, w) = image_shape[:2]
+
+    boundary_array = np.array([[0,0],[w,0],[0,h],[w,h]])
+
+    result_array = Rotate2D(boundary_array, np.array([w // 2, h // 2]), np.radians(-angle))
+
+    xmin, ymin = result_array.min(axis=0).tolist()
+    xmax, ymax = result_array.max(axis=0).tolist()
+
+    return ymin, xmin, ymax, xmax
+
 
-def rotateArray(image, array, angle):
+# the rotation getRotatedBounds describes (about the center of an image of this shape), as a 3x3 affine matrix on (x, y, 1)
+
+def getRotationMatrix(image_shape, angle):
 
     theta = np.radians(-angle)
 
-    (height, width) = image.shape[:2]
+    (height, width) = image_shape[:2]
 
     ox = width // 2
     oy = height // 2
 
-    center = np.array([ox, oy])
+    cos = math.cos(theta)
+    sin = math.sin(theta)
 
-    return Rotate2D(array,center,theta)
+    return np.array([[cos, -sin, ox - cos * ox + sin * oy],
+                     [sin, cos, oy - sin * ox - cos * oy],
+                     [0.0, 0.0, 1.0]])
 
 
-# given a list of arrays for a certain hole, rotate each of them by a given angle
+# a 3x3 affine matrix that shifts points by (dx, dy)
 
-def rotateArrayList(image,array_list,angle):
+def getTranslationMatrix(dx, dy):
 
-    new_list = []
+    return np.array([[1.0, 0.0, dx],
+                     [0.0, 1.0, dy],
+                     [0.0, 0.0, 1.0]])
 
-    for array in array_list:
-        rotated_array = rotateArray(image, array, angle)
-        new_list.append(rotated_array)
 
-    return new_list
+# for each view of a hole (the hole itself, the green close-up), everything we draw goes through one
+# 3x3 matrix: plane -> pixels -> rotation about the image center -> shift onto the rotated canvas
+# the features live in a single vertex buffer (every feature's points stacked into one array, with the
+# offset where each one starts), so each view is one matrix multiply no matter how many features there are
 
+class FeatureBuffer:
 
-# given an existing hole image and an angle to rotate it,
-# create a new image with appropriate dimensions to display
-# the hole running from bottom to top
+    # feature_lists is a list of lists of (N, 2) arrays (one list per feature type)
 
-def getNewImage(image, angle, rough_color):
-    (h, w) = image.shape[:2]
+    def __init__(self, feature_lists):
 
-    boundary_array = np.array([[0,0],[w,0],[0,h],[w,h]])
+        self.counts = [len(feature_list) for feature_list in feature_lists]
+
+        arrays = [np.asarray(array, dtype=np.float64).reshape(-1, 2) for feature_list in feature_lists for array in feature_list]
+
+        self.offsets = np.cumsum([0] + [len(array) for array in arrays])
+        self.vertices = np.concatenate(arrays) if arrays else np.zeros((0, 2))
 
-    result_array = rotateArray(image,boundary_array,angle)
+    # apply a 3x3 affine matrix to every vertex, and split the result back into lists of features
 
-    coord_list = result_array.tolist()
+    def transform(self, matrix):
 
-    xmin = ymin = 10000
-    xmax = ymax = -10000
+        vertices = np.dot(self.vertices, matrix[:2, :2].T) + matrix[:2, 2]
 
-    for coord in coord_list:
+        features = np.split(vertices, self.offsets[1:-1]) if len(self.offsets) > 1 else []
 
-        xmin = min(xmin,coord[0])
-        ymin = min(ymin,coord[1])
-        xmax = max(xmax,coord[0])
-        ymax = max(ymax,coord[1])
+        output = []
+        start = 0
+        for count in self.counts:
+            output.append(features[start:start + count])
+            start += count
 
-    x_dim = int(xmax - xmin)
-    y_dim = int(ymax - ymin)
+        return output
 
-    new_image = np.zeros((y_dim, x_dim, 3), np.uint8)
 
-    # Fill image with background color
+# the smallest and largest x and y across a list of features
+# (10000 / -10000 if the list is empty, so an empty list never wins a min or max)
 
-    new_image[:] = rough_color
+def getFeatureBounds(feature_list):
 
-    return new_image, ymin, xmin, ymax, xmax
+    if not feature_list:
+        return 10000, 10000, -10000, -10000
+
+    points = np.concatenate(feature_list)
+
+    minx, miny = points.min(axis=0)
+    maxx, maxy = points.max(axis=0)
+
+    return minx, miny, maxx, maxy
 
 
 # calculate the difstance between two pixels in yards (given a yards per pixel value)
@@ -1201,7 +2947,7 @@ def drawMarkerPoints(image, marker_point_list, text_size, text_color):
     
     for point in marker_point_list:
 
-        cv2.circle(image, (int(point[0]),int(point[1])), int(6.5+text_size), text_color, thickness=-1)
+        canvasCircle(image, (int(point[0]),int(point[1])), int(6.5+text_size), text_color, -1)
 
 
 # given a point, draw in the carry distances to that point from the
@@ -1263,13 +3009,13 @@ def drawCarry(image, green_center, carrypoint, tee_box_points, ypp, text_size, t
 
     for distance in dist_list:
 
-        cv2.putText(image, str(distance), (x , y), cv2.FONT_HERSHEY_SIMPLEX, text_size, text_color, text_weight)
+        canvasPutText(image, str(distance), (x , y), text_size, text_color, text_weight)
 
         y += yinc
 
     # mark where these distances are measuring
 
-    cv2.circle(image, (int(carrypoint[0]),int(carrypoint[1])), int(6.5+text_size), text_color, thickness=-1)
+    canvasCircle(image, (int(carrypoint[0]),int(carrypoint[1])), int(6.5+text_size), text_color, -1)
 
     drawMarkerPoints(image, tee_box_points, text_size, text_color)
 
@@ -1354,6 +3100,33 @@ def distToLine(point,line1,line2,ypp):
     return distance * ypp
 
 
+# the same distance as distToLine, for an (N, 2) array of points at once
+
+def distToLineArray(points,line1,line2,ypp):
+
+    try:
+        slope = (line1[1]-line2[1])/(line1[0]-line2[0])
+        vertical = False
+    except ZeroDivisionError:
+        vertical = True
+
+    if vertical:
+
+        distance = np.abs(line1[0] - points[:, 0])
+
+    else:
+
+        intercept = line1[1] - (slope * line1[0])
+
+        a = -slope
+        b = 1
+        c = -intercept
+
+        distance = (np.abs(a*points[:, 0] + b*points[:, 1] + c) / math.sqrt(a**2 + b**2))
+
+    return distance * ypp
+
+
 def getLine(point1,point2):
 
     # print("point 1:",point1)
@@ -1506,7 +3279,7 @@ def drawDistanceText(image, distance, point, text_size, text_color):
     x = int(point[0] - (0.5*label_width))
     y = int(point[1] + 16 + (26 * text_size))
 
-    cv2.putText(image, str(distance), (x,y), cv2.FONT_HERSHEY_SIMPLEX, text_size, text_color, text_weight)
+    canvasPutText(image, str(distance), (x,y), text_size, text_color, text_weight)
 
 
 # complicated - we are drawing arcs at 50, 100, 150, 200 yards, etc.
@@ -1601,7 +3374,7 @@ def drawFarGreenDistances(image, adjusted_hole_array, ypp, draw_dist, text_size,
 
         # print("Offset is:", offset)
 
-        cv2.ellipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
+        canvasEllipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
 
         draw_dist += 50
 
@@ -1625,7 +3398,7 @@ def drawFarGreenDistances(image, adjusted_hole_array, ypp, draw_dist, text_size,
 
         offset = angle_dict[draw_dist]
 
-        cv2.ellipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
+        canvasEllipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
 
 
         draw_dist += 50
@@ -1699,7 +3472,7 @@ def drawGreenDistancesAnyWaypoint(image, adjusted_hole_array, ypp, draw_dist, te
 
             # print("Offset is:", offset)
 
-            cv2.ellipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
+            canvasEllipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
 
             draw_dist += 50
 
@@ -1725,7 +3498,7 @@ def drawGreenDistancesAnyWaypoint(image, adjusted_hole_array, ypp, draw_dist, te
 
             # print("Offset is:", offset)
 
-            cv2.ellipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
+            canvasEllipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
 
             draw_dist += 50
 
@@ -1749,7 +3522,7 @@ def drawGreenDistancesAnyWaypoint(image, adjusted_hole_array, ypp, draw_dist, te
 
             # print("Offset is:", offset)
 
-            cv2.ellipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
+            canvasEllipse(image,integer_green_center,(pixel_dist,pixel_dist),drawn_angle,-offset,offset,text_color,2)
 
 
             draw_dist += 50
@@ -1770,10 +3543,10 @@ def drawTriangle(image, point, base, height, text_color):
     # draw a triangle
     vertices = np.array([apex, base1, base2], np.int32)
     pts = vertices.reshape((-1, 1, 2))
-    cv2.polylines(image, [pts], isClosed=True, color=(0, 0, 0), thickness=2)
+    canvasPolylines(image, [pts], True, (0, 0, 0), 2)
 
     # fill it
-    cv2.fillPoly(image, [pts], color=text_color)
+    canvasFillPoly(image, [pts], text_color)
 
 
 def drawTriangleMarkers(image, points, base, height, text_color):
@@ -1915,13 +3688,13 @@ def drawGreenDistancesTree(image, adjusted_hole_array, tree_list, ypp, text_size
 
             line_drawpoint = (point[0] - 75,point[1])
 
-            cv2.line(image,(int(point[0]),int(point[1])),(int(line_drawpoint[0]),int(line_drawpoint[1])),text_color, 3)
+            canvasLine(image,(int(point[0]),int(point[1])),(int(line_drawpoint[0]),int(line_drawpoint[1])),text_color, 3)
 
         else:
 
             drawpoint = (point[0] + 75,point[1])
 
-            cv2.line(image,(int(point[0]),int(point[1])),(int(drawpoint[0]),int(drawpoint[1])),text_color, 3)
+            canvasLine(image,(int(point[0]),int(point[1])),(int(drawpoint[0]),int(drawpoint[1])),text_color, 3)
 
         text_weight = round(text_size*2)
 
@@ -1930,7 +3703,7 @@ def drawGreenDistancesTree(image, adjusted_hole_array, tree_list, ypp, text_size
         x = int(drawpoint[0] + 2*text_weight)
         y = int(drawpoint[1] + 0.5*label_height)
 
-        cv2.putText(image, str(distance), (x,y), cv2.FONT_HERSHEY_SIMPLEX, text_size, text_color, text_weight)
+        canvasPutText(image, str(distance), (x,y), text_size, text_color, text_weight)
 
         drawn_distances.append(point)
 
@@ -1972,215 +3745,562 @@ def drawGreenDistancesMax(image, adjusted_hole_array, feature_list, ypp, text_si
         drawDistanceText(image, distance, point, text_size, text_color)
 
 
-# draw a three-yard grid over the green image that is aligned with the center of the green
-
-def getGreenGrid(b_w_image, adjusted_hole_array, ypp, elev_img=None,
-                 green_topo_style='gradient', green_topo_color=(80, 80, 80),
-                 green_arrow_color=None,
-                 green_topo_interval=0.5, green_topo_scale_m=5.0,
-                 green_poly=None):
+# the part of the rotated green image that the green close-up shows: 30 yards either side of
+# the green center, 30 yards past it and 39 yards short of it
+# also returns the green center, and how much the window gets scaled up so its longest side
+# is green_px pixels (so elevation arrows and the grid are readable however big the hole is)
 
-    # print('Creating a green grid: ', datetime.now().time())
+def getGreenWindow(adjusted_hole_array, ypp, green_px=1200):
 
     hole_origin, midpoint, green_center = getThreeWaypoints(adjusted_hole_array)
 
-    x = int(green_center[0])
-    y = int(green_center[1])
+    x = int(green_center[0])
+    y = int(green_center[1])
+
+    xmin = int(x - (30/ypp))
+    xmax = int(x + (30/ypp))
+    ymin = int(y - (30/ypp))
+    ymax = int(y + (39/ypp))
+
+    max_dim = max(xmax - xmin, ymax - ymin)
+    if max_dim > 0 and max_dim < green_px:
+        green_scale = green_px / max_dim
+    else:
+        green_scale = 1.0
+
+    return x, y, xmin, ymin, xmax, ymax, green_scale
+
+
+# apply a 3x3 affine matrix to every feature in a list
+
+def transformFeatures(feature_list, matrix):
+
+    return [np.dot(array, matrix[:2, :2].T) + matrix[:2, 2] for array in feature_list]
+
+
+# draw the green close-up with a three-yard grid that is aligned with the center of the green
+# instead of cropping and upsampling a drawing of the whole hole, only the features that reach the
+# green window are drawn, straight at the final resolution
+# layers is a list of (feature_list, color, outline thickness) in rotated green image coordinates,
+# drawn in order; elev_img is the hole's (unrotated) elevation image and elev_matrix the 3x3 matrix
+# taking its pixels onto the rotated green image, so only the window gets resampled
+# with vector set, the view is drawn on a VectorCanvas (and returned as one) instead of a numpy image
+
+def renderGreenView(layers, adjusted_hole_array, ypp, elev_img=None, elev_matrix=None,
+                    green_topo_style='gradient', green_topo_color=(80, 80, 80),
+                    green_arrow_color=None,
+                    green_topo_interval=0.5, green_topo_scale_m=5.0,
+                    green_poly=None, green_px=1200, vector=False):
+
+    x, y, xmin, ymin, xmax, ymax, green_scale = getGreenWindow(adjusted_hole_array, ypp, green_px)
+
+    # yards-per-pixel in the green image
+    ypp_green = ypp / green_scale
+
+    w = int(round((xmax - xmin) * green_scale))
+    h = int(round((ymax - ymin) * green_scale))
+
+    # rotated green image -> green window pixels
+    window = np.dot(np.diag([green_scale, green_scale, 1.0]), getTranslationMatrix(-xmin, -ymin))
+
+    if w > 850:
+        line_thickness = 2
+    else:
+        line_thickness = 1
+
+    # we're going to draw everything in black and white this time for a different style
+    # (a vector canvas gets its border up front, where the raster image has it added at the end)
+    if vector:
+        padded_image = VectorCanvas(w + 2 * line_thickness, h + 2 * line_thickness, (140, 140, 140))
+        cropped_image = padded_image.region(line_thickness, line_thickness, w, h)
+        canvasRectangle(cropped_image, (0, 0), (w - 1, h - 1), (255, 255, 255), -1)
+    else:
+        cropped_image = np.zeros((h, w, 3), np.uint8)
+        cropped_image[:] = (255, 255, 255)
+
+    for feature_list, color, line in layers:
+
+        # skip anything that doesn't reach the window
+        in_window = [array for array in feature_list if len(array) > 0 and
+                     array[:, 0].max() >= xmin and array[:, 0].min() <= xmax and
+                     array[:, 1].max() >= ymin and array[:, 1].min() <= ymax]
+
+        if line > 0:
+            line = max(1, int(round(line * green_scale)))
+
+        drawFeatures(cropped_image, PolygonLayer(transformFeatures(in_window, window)), color, line)
+
+
+    # mark the center of the green
+
+    start = (int((x - int(0.5/ypp) - xmin) * green_scale), int((y + int(0.5/ypp) - ymin) * green_scale))
+    end = (int((x + int(0.5/ypp) - xmin) * green_scale), int((y - int(0.5/ypp) - ymin) * green_scale))
+
+    canvasRectangle(cropped_image, start, end, (0,0,0), -1)
+
+
+    # --- green topography visualization ---
+    if elev_img is not None and elev_matrix is not None:
+
+        # sample the elevation for just the window, at the window's resolution
+        elev_crop = cv2.warpAffine(elev_img, np.dot(window, elev_matrix)[:2], (w, h),
+                                   flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+        # build a mask so visualizations are confined to the green polygon surface
+        green_mask = np.zeros((h, w), dtype=np.uint8)
+        if green_poly is not None:
+            pts = np.int32(np.floor(transformFeatures([green_poly], window)[0])).reshape(-1, 1, 2)
+            cv2.fillPoly(green_mask, [pts], 255)
+        else:
+            green_mask[:] = 255  # no polygon: apply to whole crop
+
+        # each visualization only draws inside green_mask
+        # (on a vector canvas, the drawing is clipped to the green instead)
+        if vector and green_poly is not None:
+            topo_image = cropped_image.clipped(pts.reshape(-1, 2))
+        else:
+            topo_image = cropped_image
+
+        if green_topo_style in ('gradient', 'both'):
+            drawGreenElevationGradient(topo_image, elev_crop,
+                                       scale_m=green_topo_scale_m, green_mask=green_mask)
+
+        if green_topo_style in ('arrows', 'both'):
+            arrow_color = green_arrow_color if green_arrow_color is not None else green_topo_color
+            drawGreenSlopeArrows(topo_image, elev_crop, ypp_green, color=arrow_color,
+                                 green_mask=green_mask)
+
+        if green_topo_style == 'contours':
+            green_contours = getContourArrays(elev_crop, interval_m=green_topo_interval)
+            if green_contours:
+                drawContourLines(topo_image, green_contours, green_topo_color, thickness=1, mask=green_mask)
+
+    grid_x = (x - xmin) * green_scale
+
+    while grid_x < w:
+        x1, y1 = int(grid_x), 0
+        x2, y2 = int(grid_x), h
+
+        canvasLine(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), line_thickness)
+
+        grid_x += 3/ypp_green
+
+    grid_x = (x - xmin) * green_scale - 3/ypp_green
+
+    while grid_x > 0:
+        x1, y1 = int(grid_x), 0
+        x2, y2 = int(grid_x), h
+
+        canvasLine(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), line_thickness)
+
+        grid_x -= 3/ypp_green
+
+    grid_y = (y - ymin) * green_scale
+
+    while grid_y < h:
+        x1, y1 = 0, int(grid_y)
+        x2, y2 = w, int(grid_y)
+
+        canvasLine(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), line_thickness)
+
+        grid_y += 3/ypp_green
+
+    grid_y = (y - ymin) * green_scale - 3/ypp_green
+
+    while grid_y > 0:
+        x1, y1 = 0, int(grid_y)
+        x2, y2 = w, int(grid_y)
+
+        canvasLine(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), line_thickness)
+
+        grid_y -= 3/ypp_green
+
+    if not vector:
+        padded_image = cv2.copyMakeBorder(cropped_image,line_thickness,line_thickness,line_thickness,line_thickness, cv2.BORDER_CONSTANT, value=(140, 140, 140))
+
+    return padded_image
+
+
+# elevation data is kept as an ElevationGrid: a DEM sampled on a regular lat/lon (EPSG:4326) grid
+# lats and lons are the ascending sample positions, and values[i, j] is the elevation in meters at
+# (lats[i], lons[j]) as float32 (NaN where there's no data)
+
+class ElevationGrid:
+
+    def __init__(self, lats, lons, values):
+
+        self.lats = lats
+        self.lons = lons
+        self.values = values
+        self.shape = values.shape
+
+    # the (lat, lon) bounds of the samples
+
+    def bounds(self):
+
+        return self.lats[0], self.lons[0], self.lats[-1], self.lons[-1]
+
+
+# downloaded elevation is cached on disk as tiles on a fixed lat/lon grid (DEM_TILE_DEGREES on a
+# side, one .npy file of float32 samples per tile and resolution), so a repeat run - or a
+# neighbouring course - only downloads the tiles it doesn't have yet, and a warm cache works offline
+# tiles are memory-mapped when read, so only the rows a request needs are loaded
+# elevation doesn't go stale, so there's no TTL - just a size limit, with the least recently used
+# tiles evicted first
+
+DEM_CACHE_DIR = os.path.join("cache", "dem")
+DEM_CACHE_MAX_MB = 500
+DEM_TILE_DEGREES = 0.01
+
+
+# the sample positions along one side of tile number index (lat or lon), for a DEM resolution in
+# meters - samples are spaced about resolution meters apart (going by a degree of latitude), at the
+# centers of the tile's cells
+
+def demTileAxis(index, resolution):
+
+    n = max(2, int(round(DEM_TILE_DEGREES * 111320 / resolution)))
+
+    return (index * n + np.arange(n) + 0.5) * (DEM_TILE_DEGREES / n)
+
+
+def _demTileName(lat_index, lon_index, resolution):
+
+    return "r%g_%d_%d.npy" % (resolution, lat_index, lon_index)
+
+
+# get elevation data for a bounding box, as an ElevationGrid, from the tile cache - any tiles that
+# aren't cached yet are downloaded from USGS 3DEP (with py3dep) in one request and cached (unless
+# they have gaps, e.g. at the edge of the 3DEP coverage)
+# or, with dem_file set, from a local DEM file instead (see readElevationFile)
+# returns None if the data is unavailable
+
+def getElevationData(latmin, lonmin, latmax, lonmax, resolution=1, cache_dir=DEM_CACHE_DIR, cache_max_mb=DEM_CACHE_MAX_MB, dem_file=None):
+
+    if dem_file is not None:
+        return readElevationFile(dem_file, latmin, lonmin, latmax, lonmax)
+
+    lat_indices = range(int(math.floor(latmin / DEM_TILE_DEGREES)), int(math.floor(latmax / DEM_TILE_DEGREES)) + 1)
+    lon_indices = range(int(math.floor(lonmin / DEM_TILE_DEGREES)), int(math.floor(lonmax / DEM_TILE_DEGREES)) + 1)
+
+    tiles = {}
+    missing = []
+
+    for i in lat_indices:
+        for j in lon_indices:
+            path = lookupCacheEntry(cache_dir, _demTileName(i, j, resolution)) if cache_dir is not None else None
+            if path is not None:
+                try:
+                    tile = np.load(path, mmap_mode="r")
+                except (OSError, ValueError):
+                    tile = None
+                # (a tile that won't load is downloaded again - a cached tile is used as is, without
+                # reading it through, since tiles with gaps are never cached)
+                if tile is not None:
+                    tiles[i, j] = tile
+                    continue
+                dropCacheEntry(cache_dir, _demTileName(i, j, resolution))
+            missing.append((i, j))
+
+    if missing:
+        downloaded = downloadElevationTiles(missing, resolution)
+
+        if downloaded is None:
+            return None
+
+        tiles.update(downloaded)
+
+        if cache_dir is not None:
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                for (i, j), values in downloaded.items():
+                    # tiles at the edge of the 3DEP coverage have gaps (NaN) - those aren't cached,
+                    # so they're downloaded again next time rather than kept with holes forever
+                    if np.isnan(values).any():
+                        continue
+                    name = _demTileName(i, j, resolution)
+                    with open(os.path.join(cache_dir, name + ".tmp"), "wb") as f:
+                        np.save(f, values)
+                    os.replace(os.path.join(cache_dir, name + ".tmp"), os.path.join(cache_dir, name))
+                    registerCacheEntry(cache_dir, name, cache_max_mb)
+            except OSError as e:
+                print("Warning: could not write elevation cache:", e)
+
+    # stitch together the part of each tile the bounding box needs (plus a sample on each side)
+    lat_parts = _demTileWindows(lat_indices, latmin, latmax, resolution)
+    lon_parts = _demTileWindows(lon_indices, lonmin, lonmax, resolution)
+
+    values = np.vstack([np.hstack([tiles[i, j][a:b, c:d] for j, _, c, d in lon_parts]) for i, _, a, b in lat_parts])
+
+    return ElevationGrid(np.concatenate([axis[a:b] for _, axis, a, b in lat_parts]),
+                         np.concatenate([axis[c:d] for _, axis, c, d in lon_parts]), values)
+
+
+# for each tile along one axis, the range of its samples (index, axis, start, end) that covers lo to hi
+
+def _demTileWindows(indices, lo, hi, resolution):
+
+    windows = []
+
+    for index in indices:
+        axis = demTileAxis(index, resolution)
+        windows.append((index, axis, max(np.searchsorted(axis, lo, side="right") - 1, 0), np.searchsorted(axis, hi, side="left") + 1))
+
+    return windows
+
+
+# download elevation tiles (a list of (lat index, lon index) pairs) from USGS 3DEP with py3dep, in
+# one request covering all of them, and sample each one onto its grid
+# returns a dict of (lat index, lon index) -> (n, n) float32 array, or None if unavailable
+
+def downloadElevationTiles(tiles, resolution=1):
+
+    lat_indices = [i for i, _ in tiles]
+    lon_indices = [j for _, j in tiles]
+
+    # (with a few samples of margin, so every tile sample has data on both sides)
+    margin = 3 * resolution / 111320
+    latmin, latmax = min(lat_indices) * DEM_TILE_DEGREES - margin, (max(lat_indices) + 1) * DEM_TILE_DEGREES + margin
+    lonmin, lonmax = min(lon_indices) * DEM_TILE_DEGREES - margin, (max(lon_indices) + 1) * DEM_TILE_DEGREES + margin
+
+    try:
+        import py3dep
+        # bounding box format for py3dep is (west, south, east, north)
+        # crs=4326 tells py3dep our input bbox is in lat/lon; output is EPSG:5070 by default
+        dem = py3dep.get_dem((lonmin, latmin, lonmax, latmax), resolution=resolution, crs=4326)
+        # reproject to EPSG:4326 so dem.x/dem.y are lon/lat
+        dem = dem.rio.reproject("EPSG:4326")
+        grid = dataArrayToElevationGrid(dem)
+
+    except Exception as e:
+        print(f"Elevation data unavailable (topography lines will be skipped): {e}")
+        return None
+
+    return {(i, j): resampleElevation(grid, demTileAxis(i, resolution), demTileAxis(j, resolution), extrapolate=False)
+            for i, j in tiles}
+
+
+# turn a DEM as an xarray DataArray in EPSG:4326 (e.g. from py3dep, reprojected) into an ElevationGrid
+
+def dataArrayToElevationGrid(dem):
+
+    # remove band dimension if present
+    dem = dem.squeeze()
+
+    lon_vals = np.asarray(dem.x.values, dtype=np.float64)
+    lat_vals = np.asarray(dem.y.values, dtype=np.float64)
+    elev_vals = np.asarray(dem.values, dtype=np.float32)
+
+    # handle 3D arrays (e.g. remaining band dim)
+    if elev_vals.ndim == 3:
+        elev_vals = elev_vals[0]
+
+    return _ascendingElevationGrid(lat_vals, lon_vals, elev_vals)
+
+
+# an ElevationGrid from sample axes that may run either way (e.g. north to south)
+
+def _ascendingElevationGrid(lat_vals, lon_vals, elev_vals):
+
+    if lat_vals[0] > lat_vals[-1]:
+        lat_vals = lat_vals[::-1]
+        elev_vals = elev_vals[::-1, :]
+
+    if lon_vals[0] > lon_vals[-1]:
+        lon_vals = lon_vals[::-1]
+        elev_vals = elev_vals[:, ::-1]
+
+    return ElevationGrid(np.ascontiguousarray(lat_vals), np.ascontiguousarray(lon_vals), np.ascontiguousarray(elev_vals, dtype=np.float32))
+
+
+# read elevation data for a bounding box from a local DEM file instead of downloading it (e.g. a
+# national LiDAR DEM, for courses outside the US 3DEP coverage), as an ElevationGrid
+# only the part of the file around the bounding box is read
+# the file can be:
+#   a GeoTIFF (.tif / .tiff) in any projection - read with rioxarray and reprojected to EPSG:4326
+#   a raw grid (.npy) of elevations in meters on a regular lat/lon grid, with a .json sidecar of the
+#   same name giving "origin": [lat, lon] of the first sample, "step": [lat step, lon step] in degrees
+#   (negative for a grid stored north to south) and optionally "nodata"
+# returns None (and says why) if the file can't be read or doesn't reach the bounding box
+
+DEM_FILE_MARGIN_DEGREES = 0.0005
+
+def readElevationFile(dem_file, latmin, lonmin, latmax, lonmax):
+
+    try:
+        if dem_file.lower().endswith(".npy"):
+            grid = _readElevationGridFile(dem_file, latmin, lonmin, latmax, lonmax)
+        else:
+            import rioxarray
+
+            # (opened lazily, so the clip only reads the window - with a margin so the reprojected
+            # grid still covers the whole bounding box)
+            dem = rioxarray.open_rasterio(dem_file, masked=True)
+            dem = dem.rio.clip_box(lonmin - DEM_FILE_MARGIN_DEGREES, latmin - DEM_FILE_MARGIN_DEGREES,
+                                   lonmax + DEM_FILE_MARGIN_DEGREES, latmax + DEM_FILE_MARGIN_DEGREES, crs="EPSG:4326")
+            grid = dataArrayToElevationGrid(dem.rio.reproject("EPSG:4326"))
+
+    except Exception as e:
+        print(f"Could not read elevation data from {dem_file} (topography lines will be skipped): {e}")
+        return None
+
+    if grid is None or min(grid.shape) < 2:
+        print(f"{dem_file} has no elevation data for this area (topography lines will be skipped)")
+        return None
+
+    return grid
+
+
+def _readElevationGridFile(dem_file, latmin, lonmin, latmax, lonmax):
+
+    with open(os.path.splitext(dem_file)[0] + ".json") as f:
+        meta = json.load(f)
+
+    values = np.load(dem_file, mmap_mode="r")
+
+    (lat0, lon0), (lat_step, lon_step) = meta["origin"], meta["step"]
+
+    lat_vals = lat0 + np.arange(values.shape[0]) * lat_step
+    lon_vals = lon0 + np.arange(values.shape[1]) * lon_step
+
+    # the samples inside the bounding box, plus one on each side
+    rows = np.nonzero((lat_vals >= latmin - abs(lat_step)) & (lat_vals <= latmax + abs(lat_step)))[0]
+    cols = np.nonzero((lon_vals >= lonmin - abs(lon_step)) & (lon_vals <= lonmax + abs(lon_step)))[0]
+
+    if len(rows) == 0 or len(cols) == 0:
+        return None
+
+    rows = slice(rows[0], rows[-1] + 1)
+    cols = slice(cols[0], cols[-1] + 1)
+
+    elev_vals = np.array(values[rows, cols], dtype=np.float32)
 
-    xmin = int(x - (30/ypp))
-    xmax = int(x + (30/ypp))
-    ymin = int(y - (30/ypp))
-    ymax = int(y + (39/ypp))
+    if meta.get("nodata") is not None:
+        elev_vals[elev_vals == meta["nodata"]] = np.nan
 
+    return _ascendingElevationGrid(lat_vals[rows], lon_vals[cols], elev_vals)
 
-    start = (x - int(0.5/ypp),y + int(0.5/ypp))
-    end = (x + int(0.5/ypp),y - int(0.5/ypp))
 
-    cv2.rectangle(b_w_image, start, end, (0,0,0), -1)
+# download one DEM covering a whole course (every hole's frame - see getHoleFrame), so each hole's
+# elevation image can be cut out of it instead of downloading and reprojecting its own
+# returns None if there are no holes or the download fails
 
+def getCourseElevationData(projection, ways, ypp=None, resolution=1, cache_max_mb=DEM_CACHE_MAX_MB, dem_file=None):
 
-    cropped_image = b_w_image[ymin:ymax, xmin:xmax]
+    if not ways:
+        return None
 
-    # upsample the green crop to a minimum resolution so elevation arrows and grid
-    # are readable regardless of how large the hole bounding box is
-    target_green_px = 1200
-    ch_orig, cw_orig = cropped_image.shape[:2]
-    max_dim = max(ch_orig, cw_orig)
-    if max_dim > 0 and max_dim < target_green_px:
-        green_scale = target_green_px / max_dim
-        new_ch = int(round(ch_orig * green_scale))
-        new_cw = int(round(cw_orig * green_scale))
-        cropped_image = cv2.resize(cropped_image, (new_cw, new_ch), interpolation=cv2.INTER_LINEAR)
-    else:
-        green_scale = 1.0
-    # yards-per-pixel in the (possibly upsampled) green image
-    ypp_green = ypp / green_scale
+    bounds = np.array([getHoleFrame(projection, wayLatLons(way), ypp=ypp).latLonBounds() for way in ways])
 
-    # --- green topography visualization ---
-    if elev_img is not None:
-        img_h, img_w = b_w_image.shape[:2]
-        cy1 = max(0, ymin)
-        cy2 = min(img_h, ymax)
-        cx1 = max(0, xmin)
-        cx2 = min(img_w, xmax)
-        if cy2 > cy1 and cx2 > cx1:
-            elev_crop = elev_img[cy1:cy2, cx1:cx2].copy()
-            ch, cw = cropped_image.shape[:2]
-            if elev_crop.shape[:2] != (ch, cw):
-                elev_crop = cv2.resize(elev_crop, (cw, ch), interpolation=cv2.INTER_LINEAR)
-
-            # build a mask so visualizations are confined to the green polygon surface
-            green_mask = np.zeros((ch, cw), dtype=np.uint8)
-            if green_poly is not None:
-                # offset polygon from full-image coords to crop coords, then scale to upsampled size
-                pts = ((green_poly - np.array([xmin, ymin], dtype=float)) * green_scale).astype(np.int32)
-                pts = pts.reshape(-1, 1, 2)
-                cv2.fillPoly(green_mask, [pts], 255)
-            else:
-                green_mask[:] = 255  # no polygon: apply to whole crop
+    return getElevationData(bounds[:, 0].min(), bounds[:, 1].min(), bounds[:, 2].max(), bounds[:, 3].max(), resolution=resolution, cache_max_mb=cache_max_mb, dem_file=dem_file)
 
-            # snapshot before drawing so we can restore pixels outside the green
-            before = cropped_image.copy()
 
-            if green_topo_style in ('gradient', 'both'):
-                drawGreenElevationGradient(cropped_image, elev_crop,
-                                           scale_m=green_topo_scale_m, green_mask=green_mask)
+# does an ElevationGrid cover a bounding box?
+# (to within one sample spacing - the samples are cell centers, so they can stop half a cell inside
+# the area that was asked for, and demToElevationImage extrapolates that last bit)
 
-            if green_topo_style in ('arrows', 'both'):
-                arrow_color = green_arrow_color if green_arrow_color is not None else green_topo_color
-                drawGreenSlopeArrows(cropped_image, elev_crop, ypp_green, color=arrow_color,
-                                     green_mask=green_mask)
+def demCovers(dem, latmin, lonmin, latmax, lonmax):
 
-            if green_topo_style == 'contours':
-                green_contours = getContourArrays(elev_crop, interval_m=green_topo_interval)
-                if green_contours:
-                    drawContourLines(cropped_image, green_contours, green_topo_color, thickness=1)
+    lat_vals, lon_vals = dem.lats, dem.lons
 
-            # restore pixels that fall outside the green polygon
-            outside = green_mask == 0
-            cropped_image[outside] = before[outside]
+    if len(lat_vals) < 2 or len(lon_vals) < 2:
+        return False
 
-    (h, w) = cropped_image.shape[:2]
+    lat_step = lat_vals[1] - lat_vals[0]
+    lon_step = lon_vals[1] - lon_vals[0]
 
-    if w > 850:
-        line_thickness = 2
-    else:
-        line_thickness = 1
+    return (lat_vals[0] - lat_step <= latmin and lat_vals[-1] + lat_step >= latmax and
+            lon_vals[0] - lon_step <= lonmin and lon_vals[-1] + lon_step >= lonmax)
 
-    grid_x = (x - xmin) * green_scale
 
-    while grid_x < w:
-        x1, y1 = int(grid_x), 0
-        x2, y2 = int(grid_x), h
+# sample an ElevationGrid at every (out_lats[i], out_lons[j]) by linear interpolation
+# returns a (len(out_lats), len(out_lons)) float32 array
+# points outside the grid are extrapolated from its edge, or come out as NaN with extrapolate off
+# the output grid is axis-aligned, so this is done one axis at a time: first the grid's rows are
+# blended onto out_lats (a small array), then its columns onto out_lons - in float32, without
+# building a full grid of points
 
-        cv2.line(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), thickness=line_thickness)
+def resampleElevation(grid, out_lats, out_lons, extrapolate=True):
 
-        grid_x += 3/ypp_green
+    lat_index, lat_weight, lat_outside = _interpolationAxis(grid.lats, out_lats)
+    lon_index, lon_weight, lon_outside = _interpolationAxis(grid.lons, out_lons)
 
-    grid_x = (x - xmin) * green_scale - 3/ypp_green
+    values = np.asarray(grid.values, dtype=np.float32)
 
-    while grid_x > 0:
-        x1, y1 = int(grid_x), 0
-        x2, y2 = int(grid_x), h
+    rows = _blendAlong(values, lat_index, lat_weight[:, None], axis=0)
 
-        cv2.line(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), thickness=line_thickness)
+    elev_vals = _blendAlong(rows, lon_index, lon_weight, axis=1)
 
-        grid_x -= 3/ypp_green
+    if not extrapolate:
+        elev_vals[lat_outside, :] = np.nan
+        elev_vals[:, lon_outside] = np.nan
 
-    grid_y = (y - ymin) * green_scale
+    return elev_vals
 
-    while grid_y < h:
-        x1, y1 = 0, int(grid_y)
-        x2, y2 = w, int(grid_y)
 
-        cv2.line(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), thickness=line_thickness)
+# for each output coordinate, the index of the grid sample below it (so it lies between samples i
+# and i + 1, or beyond the first/last pair), its fractional position from that sample, and whether
+# it's outside the grid
 
-        grid_y += 3/ypp_green
+def _interpolationAxis(axis, out):
 
-    grid_y = (y - ymin) * green_scale - 3/ypp_green
+    axis = np.asarray(axis, dtype=np.float64)
+    out = np.asarray(out, dtype=np.float64)
 
-    while grid_y > 0:
-        x1, y1 = 0, int(grid_y)
-        x2, y2 = w, int(grid_y)
+    if len(axis) < 2:
+        return np.zeros(len(out), dtype=np.intp), np.zeros(len(out), dtype=np.float32), out != axis[0]
 
-        cv2.line(cropped_image, (x1, y1), (x2, y2), (140, 140, 140), thickness=line_thickness)
+    index = np.clip(np.searchsorted(axis, out, side="right") - 1, 0, len(axis) - 2)
+    weight = (out - axis[index]) / (axis[index + 1] - axis[index])
 
-        grid_y -= 3/ypp_green
+    return index, weight.astype(np.float32), (out < axis[0]) | (out > axis[-1])
 
-    padded_image = cv2.copyMakeBorder(cropped_image,line_thickness,line_thickness,line_thickness,line_thickness, cv2.BORDER_CONSTANT, value=(140, 140, 140))
 
-    return padded_image
+# linear interpolation of values along one axis at (index, weight) from _interpolationAxis
 
+def _blendAlong(values, index, weight, axis):
 
-# download elevation data from USGS 3DEP for a bounding box using py3dep
-# returns an xarray DataArray in EPSG:4326 (lat/lon), or None if unavailable
+    if values.shape[axis] < 2:
+        return np.take(values, index, axis=axis)
 
-def getElevationData(latmin, lonmin, latmax, lonmax, resolution=1):
+    step = np.diff(values, axis=axis)
 
-    try:
-        import py3dep
-        # bounding box format for py3dep is (west, south, east, north)
-        # crs=4326 tells py3dep our input bbox is in lat/lon; output is EPSG:5070 by default
-        dem = py3dep.get_dem((lonmin, latmin, lonmax, latmax), resolution=resolution, crs=4326)
-        # reproject to EPSG:4326 so dem.x/dem.y are lon/lat and demToElevationImage can use them
-        dem = dem.rio.reproject("EPSG:4326")
-        return dem
+    blended = np.take(values, index, axis=axis)
+    blended += np.take(step, index, axis=axis) * weight
 
-    except Exception as e:
-        print(f"Elevation data unavailable (topography lines will be skipped): {e}")
-        return None
+    return blended
 
 
-# resample a py3dep DEM (xarray DataArray in EPSG:4326) onto our image pixel grid
+# resample an ElevationGrid onto our image pixel grid
 # returns a (x_dim, y_dim) float32 numpy array where elev_img[r, c] = elevation in meters
-# image row r maps to longitude, column c maps to latitude (matching translateWaytoNP convention)
-
-def demToElevationImage(dem, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim):
+# image row r maps to longitude, column c maps to latitude (matching ImageFrame.latLonToPixels)
+# the grid can cover more than the frame (e.g. a whole course): only the window of it under the
+# frame (plus one sample on each side, for the interpolation) is copied and used
 
-    # remove band dimension if present
-    dem = dem.squeeze()
+def demToElevationImage(dem, frame):
 
-    lon_vals = dem.x.values.copy()
-    lat_vals = dem.y.values.copy()
-    elev_vals = dem.values.copy().astype(np.float32)
+    x_dim, y_dim = frame.x_dim, frame.y_dim
 
-    # handle 3D arrays (e.g. remaining band dim)
-    if elev_vals.ndim == 3:
-        elev_vals = elev_vals[0]
+    # row r → longitude, col c → latitude (see ImageFrame.latLonToPixels)
+    lon_for_row, lat_for_col = frame.pixelLatLonAxes()
 
-    # ensure ascending order for RegularGridInterpolator
-    if lat_vals[0] > lat_vals[-1]:
-        lat_vals = lat_vals[::-1]
-        elev_vals = elev_vals[::-1, :]
+    # cut out the frame's window
+    lat0 = max(np.searchsorted(dem.lats, lat_for_col.min(), side="right") - 2, 0)
+    lat1 = np.searchsorted(dem.lats, lat_for_col.max(), side="left") + 2
+    lon0 = max(np.searchsorted(dem.lons, lon_for_row.min(), side="right") - 2, 0)
+    lon1 = np.searchsorted(dem.lons, lon_for_row.max(), side="left") + 2
 
-    if lon_vals[0] > lon_vals[-1]:
-        lon_vals = lon_vals[::-1]
-        elev_vals = elev_vals[:, ::-1]
+    window = ElevationGrid(dem.lats[lat0:lat1], dem.lons[lon0:lon1], np.array(dem.values[lat0:lat1, lon0:lon1], dtype=np.float32))
 
     # fill NaN values with mean elevation so interpolation doesn't break
-    nan_mask = np.isnan(elev_vals)
+    nan_mask = np.isnan(window.values)
     if nan_mask.all():
         return np.zeros((x_dim, y_dim), dtype=np.float32)
     if nan_mask.any():
-        elev_vals[nan_mask] = np.nanmean(elev_vals)
-
-    # build interpolator: query (lat, lon) → elevation
-    interpolator = RegularGridInterpolator(
-        (lat_vals, lon_vals), elev_vals,
-        method='linear', bounds_error=False, fill_value=None
-    )
+        window.values[nan_mask] = np.nanmean(window.values)
 
-    # build target grid: for each image pixel (r, c), compute its (lat, lon)
-    # row r → longitude, col c → latitude (see translateWaytoNP)
-    lon_for_row = hole_minlon + (np.arange(x_dim) / x_dim) * (hole_maxlon - hole_minlon)
-    lat_for_col = hole_minlat + (np.arange(y_dim) / y_dim) * (hole_maxlat - hole_minlat)
-
-    lon_grid, lat_grid = np.meshgrid(lon_for_row, lat_for_col, indexing='ij')
-    # shape: (x_dim, y_dim) — lon_grid[r, c] = lon, lat_grid[r, c] = lat
-
-    points = np.stack([lat_grid.ravel(), lon_grid.ravel()], axis=-1)
-    elev_flat = interpolator(points)
-    elev_img = elev_flat.reshape(x_dim, y_dim).astype(np.float32)
+    # sample at each pixel's (lat, lon), then lay it out as (row = lon, col = lat)
+    elev_img = np.ascontiguousarray(resampleElevation(window, lat_for_col, lon_for_row).T)
 
     return elev_img
 
@@ -2192,6 +4312,20 @@ def demToElevationImage(dem, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon,
 
 def getContourArrays(elev_img, interval_m=2.0):
 
+    return [pts for pts, level in getContourLevels(elev_img, interval_m=interval_m)]
+
+
+# the contour engine behind getContourArrays and getIndexContourArrays
+# returns a list of (array, elevation_meters) tuples, one per contour line, for every level
+# the elevation is smoothed once and sorted into bands between levels (one pass over the image),
+# then each level's outline is traced from the bands on a pool of threads (cv2 runs without the GIL)
+# each level is still its own compare + findContours (cv2 can't trace several levels in one pass) -
+# what's saved is the repeated blur and float thresholding, and the work outside each level's crop:
+# about 0.14-0.17 s against 0.22 s for the old loop on a 1160 x 3000 hole with 20 levels, on one core
+# (where the pool costs nothing measurable); with more cores the levels are traced side by side
+
+def getContourLevels(elev_img, interval_m=2.0):
+
     # smooth the elevation to reduce jagged/noisy contours
     smoothed = cv2.GaussianBlur(elev_img, (0, 0), sigmaX=3.0, sigmaY=3.0)
 
@@ -2208,13 +4342,35 @@ def getContourArrays(elev_img, interval_m=2.0):
     levels = np.arange(first_level, max_elev + interval_m, interval_m)
     print(f"  Topo: {len(levels)} contour levels from {first_level:.1f}m to {levels[-1]:.1f}m at {interval_m}m interval")
 
-    contour_arrays = []
+    # band i + 1 is everything at or above level i (and below level i + 1), so each level's mask
+    # is a cheap comparison against the bands instead of another pass over the elevations
+    # (NaNs go in band 0, below every level)
+    # the bands are filled TILE_ROWS rows at a time, so searchsorted's int64 result and the NaN-free
+    # copy are only ever one strip of rows, not two more images
+    bands = np.empty(smoothed.shape, dtype=np.uint16)
+    for top in range(0, smoothed.shape[0], TILE_ROWS):
+        bands[top:top + TILE_ROWS] = np.searchsorted(levels, np.nan_to_num(smoothed[top:top + TILE_ROWS], nan=-np.inf), side="right")
+
+    # each level only needs tracing over the rows and columns that reach above it
+    row_top = bands.max(axis=1)
+    col_top = bands.max(axis=0)
+
+    def traceLevel(i):
+        rows = np.flatnonzero(row_top > i)
+        cols = np.flatnonzero(col_top > i)
+        if len(rows) == 0:
+            return []
+        above = cv2.compare(bands[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1], i, cv2.CMP_GT)
+        contours, _ = cv2.findContours(above, cv2.RETR_LIST, cv2.CHAIN_APPROX_TC89_L1, offset=(int(cols[0]), int(rows[0])))
+        return contours
+
+    with ThreadPoolExecutor(max_workers=min(len(levels), os.cpu_count() or 1)) as pool:
+        level_contours = list(pool.map(traceLevel, range(len(levels))))
+
+    contour_levels = []
     total_found = 0
 
-    for level in levels:
-        mask = (smoothed >= level).astype(np.uint8) * 255
-        contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_TC89_L1)
-
+    for level, contours in zip(levels, level_contours):
         for contour in contours:
             total_found += 1
             # cv2 returns (N, 1, 2) with (x, y) = (col, row)
@@ -2225,21 +4381,77 @@ def getContourArrays(elev_img, interval_m=2.0):
                 continue
             if cv2.contourArea(contour) < 100:
                 continue
-            contour_arrays.append(pts)
+            contour_levels.append((pts, float(level)))
 
-    print(f"  Topo: {len(contour_arrays)} contour lines kept (of {total_found} total found, filtered by size)")
-    return contour_arrays
+    print(f"  Topo: {len(contour_levels)} contour lines kept (of {total_found} total found, filtered by size)")
+    return contour_levels
 
 
 # draw contour lines on an image as open polylines
+# (with alpha at 1 the lines are drawn straight onto the image, skipping the blend)
+# with mask set (an 8-bit array the size of the image), only pixels inside the mask are drawn
 
-def drawContourLines(image, contour_list, color, thickness=2, alpha=0.5):
+def drawContourLines(image, contour_list, color, thickness=2, alpha=0.5, mask=None):
 
-    overlay = image.copy()
-    for contour in contour_list:
-        pts = np.int32(contour).reshape((-1, 1, 2))
-        cv2.polylines(overlay, [pts], isClosed=False, color=color, thickness=thickness)
-    cv2.addWeighted(overlay, alpha, image, 1 - alpha, 0, image)
+    # on a vector canvas, the lines are simply drawn translucent
+    if isinstance(image, VectorCanvas):
+        image.record("polylines", [image.shift(np.int32(np.floor(contour)).reshape(-1, 2)) for contour in contour_list], False, color, thickness, cv2.LINE_8, alpha)
+        return
+
+    pts = [np.int32(np.floor(contour)).reshape((-1, 1, 2)) for contour in contour_list]
+
+    if alpha >= 1 and mask is None:
+        for contour in pts:
+            cv2.polylines(image, [contour], isClosed=False, color=color, thickness=thickness)
+        return
+
+    blendPolylines(image, pts, False, color, thickness, alpha, mask=mask)
+
+
+# draw polylines blended into an image at alpha, the way drawing them on a copy of the image and
+# cv2.addWeighted-ing the copy back would - but without the copy: the lines are drawn into a coverage
+# mask over their bounding box, and the box is blended a strip of BLEND_ROWS rows at a time, skipping
+# strips the lines don't reach and copying back only the covered pixels
+
+BLEND_ROWS = 64
+
+def blendPolylines(image, pts, closed, color, thickness, alpha, line_type=cv2.LINE_8, mask=None):
+
+    pts = [np.asarray(poly).reshape(-1, 2) for poly in pts if len(poly) > 0]
+
+    if not pts:
+        return
+
+    h, w = image.shape[:2]
+    points = np.concatenate(pts)
+
+    x0, y0 = np.maximum(points.min(axis=0) - thickness - 1, 0)
+    x1, y1 = np.minimum(points.max(axis=0) + thickness + 2, (w, h))
+
+    if x0 >= x1 or y0 >= y1:
+        return
+
+    coverage = np.zeros((y1 - y0, x1 - x0), np.uint8)
+    cv2.polylines(coverage, [np.int32(poly - (x0, y0)).reshape(-1, 1, 2) for poly in pts], closed, 255, thickness, lineType=line_type)
+
+    if mask is not None:
+        coverage &= mask[y0:y1, x0:x1]
+
+    region = image[y0:y1, x0:x1]
+
+    color_rows = np.empty((BLEND_ROWS,) + region.shape[1:], np.uint8)
+    color_rows[:] = color
+
+    for top in range(0, y1 - y0, BLEND_ROWS):
+
+        covered = coverage[top:top + BLEND_ROWS]
+
+        if not cv2.countNonZero(covered):
+            continue
+
+        strip = region[top:top + BLEND_ROWS]
+        blended = cv2.addWeighted(color_rows[:len(strip)], alpha, strip, 1 - alpha, 0)
+        cv2.copyTo(blended, covered, strip)
 
 
 # for each contour, compute tick positions (every tick_spacing points along the line) and
@@ -2288,47 +4500,14 @@ def getContourTicks(contour_arrays, elev_img, tick_spacing=50):
     return np.array(all_positions, dtype=float), np.array(all_directions, dtype=float)
 
 
-# rotate tick positions (about image center) and direction vectors (pure rotation, no translation)
-
-def rotateTickData(image, positions, directions, angle):
-
-    if len(positions) == 0:
-        return positions, directions
-    theta = np.radians(-angle)
-    (height, width) = image.shape[:2]
-    center = np.array([width // 2, height // 2], dtype=float)
-    R = np.array([[math.cos(theta), math.sin(theta)],
-                  [-math.sin(theta), math.cos(theta)]])
-    rot_positions = np.dot(positions - center, R) + center
-    rot_directions = np.dot(directions, R)
-    return rot_positions, rot_directions
-
+# move tick positions with a view's 3x3 matrix, and turn their direction vectors with its rotation part
 
-# apply the same (xmin, ymin) offset used by adjustRotatedFeatures to tick positions
-
-def adjustTickData(positions, directions, xmin, ymin):
+def transformTickData(positions, directions, matrix):
 
     if len(positions) == 0:
         return positions, directions
-    return positions - np.array([xmin, ymin], dtype=float), directions
-
-
-# rotate an elevation image (float32) to match the rotated hole/green image.
-# uses the same rotation center and angle convention as rotateArray / getNewImage.
-# ymin, xmin, ymax, xmax are the offsets returned by getNewImage for this rotation.
-
-def rotateElevationImage(elev_img, image, angle, ymin, xmin, ymax, xmax):
 
-    (h, w) = image.shape[:2]
-    # cv2.getRotationMatrix2D with -angle matches the Rotate2D convention used throughout
-    M = cv2.getRotationMatrix2D((w / 2.0, h / 2.0), angle, 1.0)
-    # shift so that the top-left of the rotated bounding box is at (0, 0)
-    M[0, 2] -= xmin
-    M[1, 2] -= ymin
-    new_w = int(round(xmax - xmin))
-    new_h = int(round(ymax - ymin))
-    return cv2.warpAffine(elev_img, M, (new_w, new_h),
-                          flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return np.dot(positions, matrix[:2, :2].T) + matrix[:2, 2], np.dot(directions, matrix[:2, :2].T)
 
 
 # draw a colour-gradient elevation heatmap on the green close-up image.
@@ -2336,7 +4515,8 @@ def rotateElevationImage(elev_img, image, angle, ymin, xmin, ymax, xmax):
 # low elevation → cool blue, high elevation → warm red (COLORMAP_JET convention).
 # scale_m is the total elevation range that maps to the full spectrum; the scale is centred on
 # the mean elevation of the green polygon (not the whole crop) so the stats only reflect the
-# putting surface itself.  green_mask is an 8-bit mask (255 = inside green polygon).
+# putting surface itself.  green_mask is an 8-bit mask (255 = inside green polygon), and only the
+# pixels inside it are coloured.
 
 def drawGreenElevationGradient(image, elev_crop, alpha=0.4, scale_m=5.0, green_mask=None):
 
@@ -2358,17 +4538,37 @@ def drawGreenElevationGradient(image, elev_crop, alpha=0.4, scale_m=5.0, green_m
     if e_range < 0.005:
         return  # essentially flat — nothing useful to show
 
+    # only the green is coloured: everything below works inside the mask's bounding box
+    x0, y0, bw, bh = 0, 0, w, h
+    if green_mask is not None and green_mask.shape == (h, w):
+        x0, y0, bw, bh = cv2.boundingRect(green_mask)
+    ec = ec[y0:y0 + bh, x0:x0 + bw]
+
     # diverging scale centred on the green mean; scale_m is the full span
     e_lo = e_center - scale_m / 2.0
     norm = np.clip((ec - e_lo) / scale_m * 255, 0, 255).astype(np.uint8)
     colored = cv2.applyColorMap(norm, cv2.COLORMAP_JET)
-    cv2.addWeighted(colored, alpha, image, 1.0 - alpha, 0, image)
+
+    # (a vector canvas gets the colors as a translucent image on top)
+    if isinstance(image, VectorCanvas):
+        image.record("image", colored, image.shift((x0, y0)), alpha)
+        return
+
+    # the box is blended, and the blend copied back over the green
+    region = image[y0:y0 + bh, x0:x0 + bw]
+    blended = cv2.addWeighted(colored, alpha, region, 1.0 - alpha, 0)
+
+    if green_mask is not None and green_mask.shape == (h, w):
+        cv2.copyTo(blended, green_mask[y0:y0 + bh, x0:x0 + bw], region)
+    else:
+        region[:] = blended
 
 
 # draw a grid of arrows on the green close-up image, each pointing downhill.
 # arrow length is proportional to physical slope, normalised to ref_slope_pct so the same
 # real-world grade always produces the same visual arrow length across different greens.
-# elev_crop is a float32 array the same size as image.
+# elev_crop is a float32 array the same size as image.  with green_mask, arrows start only inside
+# the mask, and only the parts of them inside it are drawn.
 
 def drawGreenSlopeArrows(image, elev_crop, ypp, color=(60, 60, 60), grid_yards=1.5,
                          ref_slope_pct=5.0, green_mask=None):
@@ -2395,6 +4595,8 @@ def drawGreenSlopeArrows(image, elev_crop, ypp, color=(60, 60, 60), grid_yards=1
     max_arrow = step_px * 0.55
     thickness = max(1, step_px // 12)
 
+    arrows = []
+
     for row in range(step_px // 2, h, step_px):
         for col in range(step_px // 2, w, step_px):
             # skip grid cells whose centre falls outside the green polygon
@@ -2411,19 +4613,40 @@ def drawGreenSlopeArrows(image, elev_crop, ypp, color=(60, 60, 60), grid_yards=1
                 continue
             ndx = -dx / magnitude * scale
             ndy = -dy / magnitude * scale
-            pt1 = (col, row)
-            pt2 = (int(col + ndx), int(row + ndy))
-            cv2.arrowedLine(image, pt1, pt2, color, thickness=thickness,
-                            tipLength=0.3, line_type=cv2.LINE_8)
+            arrows.append(((col, row), (int(col + ndx), int(row + ndy))))
+
+    if not arrows:
+        return
+
+    if green_mask is None or isinstance(image, VectorCanvas):
+        for pt1, pt2 in arrows:
+            canvasArrowedLine(image, pt1, pt2, color, thickness, 0.3)
+        return
+
+    # on a numpy image, the arrows are drawn into a coverage mask over just their bounding box (with
+    # room for the heads), and only the covered pixels inside the green are painted
+    ends = np.array(arrows).reshape(-1, 2)
+    pad = thickness + int(max_arrow * 0.3) + 2
+
+    x0, y0 = np.maximum(ends.min(axis=0) - pad, 0)
+    x1, y1 = np.minimum(ends.max(axis=0) + pad + 1, (w, h))
+
+    coverage = np.zeros((y1 - y0, x1 - x0), np.uint8)
+    for (c1, r1), (c2, r2) in arrows:
+        cv2.arrowedLine(coverage, (int(c1 - x0), int(r1 - y0)), (int(c2 - x0), int(r2 - y0)), 255, thickness=thickness, tipLength=0.3, line_type=cv2.LINE_8)
+
+    image[y0:y1, x0:x1][(coverage > 0) & (green_mask[y0:y1, x0:x1] > 0)] = color
 
 
 # draw small filled triangles pointing uphill on contour lines
 
-def drawContourTicks(image, positions, directions, color, tick_length=12):
+def drawContourTicks(image, positions, directions, color, tick_length=12, bounds=None):
 
     if len(positions) == 0:
         return
     h, w = image.shape[:2]
+    # bounds (x0, y0, x1, y1) limits where ticks may go, when image is a window onto a larger picture
+    x0, y0, x1, y1 = bounds if bounds is not None else (0, 0, w, h)
     base_half = tick_length * 0.4
 
     for i in range(len(positions)):
@@ -2437,47 +4660,26 @@ def drawContourTicks(image, positions, directions, color, tick_length=12):
 
         # skip triangles that fall outside the image
         pts_check = [tip, base1, base2]
-        if any(p[0] < 0 or p[0] >= w or p[1] < 0 or p[1] >= h for p in pts_check):
+        if any(p[0] < x0 or p[0] >= x1 or p[1] < y0 or p[1] >= y1 for p in pts_check):
             continue
 
         triangle = np.int32([[[int(tip[0]), int(tip[1])]],
                               [[int(base1[0]), int(base1[1])]],
                               [[int(base2[0]), int(base2[1])]]])
-        cv2.fillPoly(image, [triangle], color)
+        canvasFillPoly(image, [triangle], color)
 
 
 # generate index contour arrays (every index_every_n-th contour level) with their elevation values
 # returns a list of (array, elevation_meters) tuples in the same pixel convention as other features
+# pass contour_levels (from getContourLevels at the same interval) to pick them out of contours
+# that have already been traced instead of tracing them again
 
-def getIndexContourArrays(elev_img, interval_m=2.0, index_every_n=5):
-
-    smoothed = cv2.GaussianBlur(elev_img, (0, 0), sigmaX=3.0, sigmaY=3.0)
-
-    min_elev = float(np.nanmin(smoothed))
-    max_elev = float(np.nanmax(smoothed))
-
-    if np.isnan(min_elev) or np.isnan(max_elev) or (max_elev - min_elev) < interval_m:
-        return []
-
-    index_interval = interval_m * index_every_n
-    first_index = math.ceil(min_elev / index_interval) * index_interval
-    index_levels = np.arange(first_index, max_elev + index_interval, index_interval)
-
-    result = []
-
-    for level in index_levels:
-        mask = (smoothed >= level).astype(np.uint8) * 255
-        contours, _ = cv2.findContours(mask, cv2.RETR_LIST, cv2.CHAIN_APPROX_TC89_L1)
+def getIndexContourArrays(elev_img, interval_m=2.0, index_every_n=5, contour_levels=None):
 
-        for contour in contours:
-            pts = contour.reshape(-1, 2).astype(float)
-            if len(pts) < 10:
-                continue
-            if cv2.contourArea(contour) < 100:
-                continue
-            result.append((pts, float(level)))
+    if contour_levels is None:
+        contour_levels = getContourLevels(elev_img, interval_m=interval_m)
 
-    return result
+    return [(pts, level) for pts, level in contour_levels if round(level / interval_m) % index_every_n == 0]
 
 
 # draw index contour lines (thicker) and place one elevation label per level
@@ -2492,7 +4694,7 @@ def drawIndexContours(image, index_contour_list, color, text_size):
     # draw all index contours thick
     for contour, elevation in index_contour_list:
         pts = np.int32(contour).reshape((-1, 1, 2))
-        cv2.polylines(image, [pts], isClosed=False, color=color, thickness=4)
+        canvasPolylines(image, [pts], False, color, 4)
 
     # group contours by elevation level, pick the largest at each level for labeling
     by_level = {}
@@ -2528,47 +4730,68 @@ def drawIndexContours(image, index_contour_list, color, text_size):
             continue
 
         # small white background rectangle so the label is readable over terrain colors
-        cv2.rectangle(image, (x - 2, y - lh - 2), (x + lw + 2, y + 2), (255, 255, 255), -1)
-        cv2.putText(image, label, (x, y), cv2.FONT_HERSHEY_SIMPLEX, text_size, color, text_weight)
+        canvasRectangle(image, (x - 2, y - lh - 2), (x + lw + 2, y + 2), (255, 255, 255), -1)
+        canvasPutText(image, label, (x, y), text_size, color, text_weight)
         labeled_positions.append((x, y))
 
 
-def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filter_width=50,short_factor=1,med_factor=1,include_trees=True,in_meters=False,include_topo=False,topo_interval=2.0,include_topo_labels=True,topo_index_every=5,green_topo_interval=0.5,green_topo_style='gradient',green_topo_scale_m=5.0,draw_all_fairways=False):
-
-    # print('Getting core distances: ', datetime.now().time())
-    
-    # calculate distance in yards of one degree of latitude and one degree of longitude
-    lat_degree_distance = getLatDegreeDistance(latmin,latmax)
-    lon_degree_distance = getLonDegreeDistance(latmin,latmax)
-
-    # convert to meters if needed
-    if in_meters:
-        lat_degree_distance = lat_degree_distance * 0.9144
-        lon_degree_distance = lon_degree_distance * 0.9144
+def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filter_width=50,short_factor=1,med_factor=1,include_trees=True,in_meters=False,include_topo=False,topo_interval=2.0,include_topo_labels=True,topo_index_every=5,green_topo_interval=0.5,green_topo_style='gradient',green_topo_scale_m=5.0,draw_all_fairways=False,tree_canopy=False,preview=False,yards_per_pixel=None,output_format="png",tiled=False,refresh_osm_cache=False,osm_cache_ttl_hours=OSM_CACHE_TTL_HOURS,osm_cache_max_mb=OSM_CACHE_MAX_MB,osm_file=None,overpass_format="xml",dem_cache_max_mb=DEM_CACHE_MAX_MB,dem_file=None):
 
-    # download golf hole info from OSM
-    result = getOSMGolfWays(latmin,lonmin,latmax,lonmax)
-    if result is None:
-        print("Error: could not download golf hole data. Check your coordinates or try again later.")
-        return False
-    ways = result.ways
-
-    # download all course feature data once (fairways, greens, bunkers, etc.)
-    # this avoids a separate API call per hole, which causes timeouts on larger courses
-    print("Downloading course feature data...")
-    course_result = getOSMGolfData(latmin, lonmin, latmax, lonmax)
-    if course_result is None:
-        print("Error: could not download course feature data. Check your coordinates or try again later.")
+    # holes are drawn as PNG images by default, or recorded on a VectorCanvas and written as SVG or PDF
+    if output_format not in ("png", "svg", "pdf"):
+        print("Error: unknown output format", output_format, "(use png, svg or pdf)")
         return False
 
+    vector = output_format != "png"
+
+    # with tiled set, PNG holes are recorded on a VectorCanvas too, then rasterized and written out a
+    # band at a time (for very large images, where the whole image would take too much memory)
+    # (this doesn't cover topo - the elevation and contours are still computed for the whole hole at
+    # once, see TILE_ROWS)
+    record = vector or tiled
+
+    # every hole is drawn on one flat plane centered on the course, measured in yards (or meters)
+    projection = LocalProjection((latmin + latmax) / 2, (lonmin + lonmax) / 2, in_meters)
+
+    # download the golf holes and all course feature data (fairways, greens, bunkers, etc.) in one query
+    # (this goes through the local OSM cache, so re-renders can skip the network)
+    # or, if we were given a local OSM extract, read the same data from that file instead
+    if osm_file is not None:
+        print("Reading course data from", osm_file, "...")
+        course_result = readOSMExtract(osm_file, latmin, lonmin, latmax, lonmax)
+        if course_result is None:
+            return False
+        ways, course_result = splitCourseResult(course_result)
+    else:
+        print("Downloading course data...")
+        ways, course_result = getOSMCourseData(latmin, lonmin, latmax, lonmax, refresh=refresh_osm_cache, cache_ttl_hours=osm_cache_ttl_hours, cache_max_mb=osm_cache_max_mb, overpass_format=overpass_format)
+        if course_result is None:
+            print("Error: could not download course data. Check your coordinates or try again later.")
+            return False
+
+    # sort and project every course feature once - each hole then just picks out its share
+    course_features = CourseFeatures(course_result, projection)
+
+    # get the elevation data once for the whole course (from the DEM tile cache, downloading whatever
+    # isn't cached) - each hole's elevation image is then cut out of it (a preview uses a coarser DEM)
+    dem_resolution = PREVIEW_DEM_RESOLUTION if preview else 1
+    course_dem = None
+    if include_topo:
+        print("Getting elevation data...")
+        course_dem = getCourseElevationData(projection, ways, ypp=yards_per_pixel, resolution=dem_resolution, cache_max_mb=dem_cache_max_mb, dem_file=dem_file)
+        if course_dem is not None:
+            print(f"  Topo: DEM ready — shape {course_dem.shape}")
 
     # find or create output directory
     # and get a list of existing files so we don't overwrite unintentionally
+    # (previews go in their own folder, so they never replace a full render)
+
+    output_dir = "preview" if preview else "output"
 
     try:
-        file_list = os.listdir("output")
+        file_list = os.listdir(output_dir)
     except:
-        os.mkdir("output")
+        os.mkdir(output_dir)
         file_list = []
 
     # track the holes we are doing today
@@ -2603,7 +4826,7 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
 
         # check if we are going to overwrite an existing image
 
-        file_name = "hole_" + str(hole_num) + ".png"
+        file_name = "hole_" + str(hole_num) + "." + output_format
 
         if not replace_existing and file_name in file_list:
             print("Output file exists: skipping hole")
@@ -2615,7 +4838,7 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
             counter = 2
 
             while file_name in new_file_list:
-                file_name = "hole_" + str(hole_num) + "_" + str(counter) + ".png"
+                file_name = "hole_" + str(hole_num) + "_" + str(counter) + "." + output_format
                 print(file_name)
                 counter += 1
         # else:
@@ -2626,119 +4849,102 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
 
 
         # get the bounding box for this hole and reuse the already-downloaded course data
-        hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, hole_way_nodes = getHoleBoundingBox(way, lat_degree_distance, lon_degree_distance)
-        hole_result = course_result
-
-        # create a base image to use for this hole (and calculate yards per pixel)
-        image, x_dim, y_dim, ypp = generateImage(hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, lat_degree_distance, lon_degree_distance,colors["rough"])
-
-        # download elevation data and generate contour arrays (if enabled)
+        hole_way_nodes = way.get_nodes(resolve_missing=True)
+        hole_local = projection.project(wayLatLons(way))
+        # (normally the longest side is 3000 pixels; with yards_per_pixel set, the image is sized to the hole)
+        frame = getHoleFrame(projection, wayLatLons(way), ypp=yards_per_pixel)
+
+        # the size of the (unrotated) image for this hole, and yards per pixel
+        # (the image itself is never drawn on, so we don't need to allocate it)
+        image_shape = (frame.x_dim, frame.y_dim)
+        ypp = frame.ypp
+
+        # cut this hole's elevation out of the course DEM and generate contour arrays (if enabled)
+        # (a hole the course DEM doesn't cover gets its own download)
+        # a preview uses a coarser DEM on a coarser grid; elev_matrix takes its pixels onto the frame's
         raw_contours = []
         raw_tick_positions = np.zeros((0, 2), dtype=float)
         raw_tick_directions = np.zeros((0, 2), dtype=float)
         elev_img = None
+        elev_matrix = np.identity(3)
         if include_topo:
-            dem = getElevationData(hole_minlat, hole_minlon, hole_maxlat, hole_maxlon)
+            if preview:
+                elev_frame = getHoleFrame(projection, wayLatLons(way), ypp=ypp / PREVIEW_SCALE)
+                elev_matrix = np.diag([elev_frame.ypp / ypp, elev_frame.ypp / ypp, 1.0])
+            else:
+                elev_frame = frame
+            if course_dem is not None and demCovers(course_dem, *elev_frame.latLonBounds()):
+                dem = course_dem
+            else:
+                dem = getElevationData(*elev_frame.latLonBounds(), resolution=dem_resolution, cache_max_mb=dem_cache_max_mb, dem_file=dem_file)
+                if dem is not None:
+                    print(f"  Topo: DEM ready — shape {dem.shape}")
             if dem is not None:
-                print(f"  Topo: DEM downloaded — shape {dem.shape}, CRS {dem.rio.crs}")
-                elev_img = demToElevationImage(dem, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim)
+                elev_img = demToElevationImage(dem, elev_frame)
                 print(f"  Topo: elevation image {elev_img.shape}, values {elev_img.min():.1f}m – {elev_img.max():.1f}m")
                 raw_contours = getContourArrays(elev_img, interval_m=topo_interval)
 
                 if include_topo_labels and raw_contours:
-                    raw_tick_positions, raw_tick_directions = getContourTicks(raw_contours, elev_img)
+                    raw_tick_positions, raw_tick_directions = getContourTicks(raw_contours, elev_img, tick_spacing=max(1, int(round(50 * ypp / elev_frame.ypp))))
 
 
         # find this hole's green
-        green_nodes = identifyGreen(hole_way_nodes, hole_result)
+        green_local = course_features.findGreen(hole_way_nodes[-1])
 
-        green_array = translateNodestoNP(green_nodes, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim)
+        # pick out this hole's share of each feature type (we do different things with each of them)
+        sand_traps, tee_boxes, fairways, water_hazards, woods, trees = course_features.selectLocal(frame)
 
-        # categorize all of the feature types (we do different things with each of them)
-        sand_traps, tee_boxes, fairways, water_hazards, woods, trees = categorizeWays(hole_result, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim)
+        # put all of it (plus the green and the hole waypoints) into one vertex buffer on the course plane
+        # both the hole view and the green view are drawn from this same buffer
+        source = FeatureBuffer([fairways, tee_boxes, water_hazards, sand_traps, woods, trees, [green_local], [hole_local]])
+        contour_source = FeatureBuffer([raw_contours])
 
         # by default, everything will be drawn as it is oriented in real life
         # but, for a yardage book, we want the hole drawn from the bottom to the top of the image
         # so, we need to figure out how much to rotate everythiung for this hole
-        angle = getRotateAngle(translateNodestoNP(hole_way_nodes,hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
+        way_node_array = frame.localToPixels(hole_local)
+        angle = getRotateAngle(way_node_array)
 
-        # convert the hole waypoints to an array for rotation
-        way_node_array = translateNodestoNP(hole_way_nodes, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim)
 
+        # work out where the rotated image would sit (we don't allocate anything until we know
+        # which part of it ends up in the final image)
+        ymin, xmin, ymax, xmax = getRotatedBounds(image_shape, angle)
 
-        # rotate all of our features, including the green and the hole waypoints
-        rotated_fairways = rotateArrayList(image,fairways,angle)
-        rotated_tee_boxes = rotateArrayList(image,tee_boxes,angle)
-        rotated_water_hazards = rotateArrayList(image,water_hazards,angle)
-        rotated_sand_traps = rotateArrayList(image,sand_traps,angle)
-        rotated_woods = rotateArrayList(image,woods,angle)
-        rotated_trees = rotateArrayList(image,trees,angle)
-        rotated_contours = rotateArrayList(image,raw_contours,angle)
-        rot_tick_positions, rot_tick_directions = rotateTickData(image, raw_tick_positions, raw_tick_directions, angle)
+        # one matrix takes the elevation image's pixels onto the rotated image, and one more step
+        # in front of it takes the course plane there too - so everything is transformed in one pass
+        view = np.dot(getTranslationMatrix(-xmin, -ymin), getRotationMatrix(image_shape, angle))
 
-        rotated_green = rotateArray(image,green_array,angle)
-        rotated_green_array = [rotated_green]
+        (final_fairways, final_tee_boxes, final_water_hazards, final_sand_traps, final_woods, final_trees,
+            final_green_array, adjusted_hole_array) = source.transform(np.dot(view, frame.pixelMatrix()))
+        final_contours = contour_source.transform(np.dot(view, elev_matrix))[0]
+        final_tick_positions, final_tick_directions = transformTickData(raw_tick_positions, raw_tick_directions, np.dot(view, elev_matrix))
 
-        rotated_waypoints = rotateArray(image,way_node_array,angle)
+        adjusted_waypoints = adjusted_hole_array[0]
 
 
         # we need to filter out any features that don't belong to this hole
         # (example - another hole's fairway that might be close by)
-        filtered_fairways = filterArrayList(rotated_waypoints, rotated_fairways, ypp, hole_par, fairway=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor, draw_all_fairways=draw_all_fairways)
-        filtered_tee_boxes = filterArrayList(rotated_waypoints, rotated_tee_boxes, ypp, hole_par, tee_box=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
-        filtered_water_hazards = filterArrayList(rotated_waypoints, rotated_water_hazards, ypp, hole_par, filter_yards=None)
-        filtered_sand_traps = filterArrayList(rotated_waypoints, rotated_sand_traps, ypp, hole_par, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
-        filtered_woods = filterArrayList(rotated_waypoints, rotated_woods, ypp, hole_par, filter_yards=None)
-        filtered_trees = filterArrayList(rotated_waypoints, rotated_trees, ypp, hole_par, filter_yards=25)
-
-
-        # create a new, rotated base image to work with
-        rotated_image, ymin, xmin, ymax, xmax = getNewImage(image,angle,colors["rough"])
-
-
-        # we need to adjust all our rotated features
-        final_fairways, fw_minx, fw_miny, fw_maxx, fw_maxy = adjustRotatedFeatures(filtered_fairways, ymin, xmin)
-        final_tee_boxes, tb_minx, tb_miny, tb_maxx, tb_maxy = adjustRotatedFeatures(filtered_tee_boxes, ymin, xmin)
-        final_water_hazards, n1, n2, n3, n4 = adjustRotatedFeatures(filtered_water_hazards, ymin, xmin)
-        final_woods, n1, n2, n3, n4 = adjustRotatedFeatures(filtered_woods, ymin, xmin)
-        final_trees, n1, n2, n3, n4 = adjustRotatedFeatures(filtered_trees, ymin, xmin)
-        final_contours, n1, n2, n3, n4 = adjustRotatedFeatures(rotated_contours, ymin, xmin)
-        final_tick_positions, final_tick_directions = adjustTickData(rot_tick_positions, rot_tick_directions, xmin, ymin)
-
-
-        final_green_array, g_minx, g_miny, g_maxx, g_maxy = adjustRotatedFeatures(rotated_green_array, ymin, xmin)
-
-        final_sand_traps, st_minx, st_miny, st_maxx, st_maxy = adjustRotatedFeatures(filtered_sand_traps, ymin, xmin)
-
-        adjusted_hole_array, n1, n2, n3, n4 = adjustRotatedFeatures([rotated_waypoints], ymin, xmin)
-
-        # finally, we can draw all of the features on our image (with specific colors for each)
+        final_fairways = filterArrayList(adjusted_waypoints, final_fairways, ypp, hole_par, fairway=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor, draw_all_fairways=draw_all_fairways)
+        final_tee_boxes = filterArrayList(adjusted_waypoints, final_tee_boxes, ypp, hole_par, tee_box=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
+        final_water_hazards = filterArrayList(adjusted_waypoints, final_water_hazards, ypp, hole_par, filter_yards=None)
+        final_sand_traps = filterArrayList(adjusted_waypoints, final_sand_traps, ypp, hole_par, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
+        final_woods = filterArrayList(adjusted_waypoints, final_woods, ypp, hole_par, filter_yards=None)
+        final_trees = filterArrayList(adjusted_waypoints, final_trees, ypp, hole_par, filter_yards=25)
 
-        drawFeatures(rotated_image, final_fairways, colors["fairways"])
-        drawFeatures(rotated_image, final_tee_boxes, colors["tee boxes"])
-        drawFeatures(rotated_image, final_water_hazards, colors["water"])
-        drawFeatures(rotated_image, final_woods, colors["woods"])
-        drawFeatures(rotated_image, final_green_array, colors["greens"])
-
-        # drawing the sand traps and trees last so they aren't overlapped by fairways, etc.
-        drawFeatures(rotated_image, final_sand_traps, colors["sand"])
-
-        if include_trees:
-            drawTrees(rotated_image, final_trees, colors["trees"])
-
-        # draw topography contour lines over terrain features, under distance text
-        if include_topo and final_contours:
-            drawContourLines(rotated_image, final_contours, colors.get("topo", (0, 100, 180)))
-            if include_topo_labels and len(final_tick_positions) > 0:
-                drawContourTicks(rotated_image, final_tick_positions, final_tick_directions, colors.get("topo", (0, 100, 180)))
 
+        # the extents of the features we frame the hole around
+        fw_minx, fw_miny, fw_maxx, fw_maxy = getFeatureBounds(final_fairways)
+        tb_minx, tb_miny, tb_maxx, tb_maxy = getFeatureBounds(final_tee_boxes)
+        g_minx, g_miny, g_maxx, g_maxy = getFeatureBounds(final_green_array)
+        st_minx, st_miny, st_maxx, st_maxy = getFeatureBounds(final_sand_traps)
 
         # now we need to pad or crop the image to get a consistent aspect ratio
         # future TODO: clean this all up into functions, see about making aspect ratio adjustable
-        lower_bound_x = min(fw_minx, tb_minx, g_minx, st_minx) - (20/ypp) - xmin
-        lower_bound_y = min(fw_miny, tb_miny, g_miny, st_miny) - (5/ypp) - ymin - 100
-        upper_bound_x = max(fw_maxx, tb_maxx, g_maxx, st_maxx) + (20/ypp) - xmin + 100
-        upper_bound_y = tb_maxy + (10/ypp) - ymin + 100
+        # (the feature extents are already on the rotated image, so they don't need the xmin/ymin shift)
+        lower_bound_x = min(fw_minx, tb_minx, g_minx, st_minx) - (20/ypp)
+        lower_bound_y = min(fw_miny, tb_miny, g_miny, st_miny) - (5/ypp) - 100
+        upper_bound_x = max(fw_maxx, tb_maxx, g_maxx, st_maxx) + (20/ypp) + 100
+        upper_bound_y = tb_maxy + (10/ypp) + 100
 
         lower_bound_x = int(max(lower_bound_x, 0))
         upper_bound_x = int(min(upper_bound_x, xmax - xmin))
@@ -2782,6 +4988,102 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
 
 
 
+        # now, we need to do a second round of padding to make the aspect ratio work
+        # in case we ran out of room with our earlier efforts
+        # (this only depends on the size of the crop, so we can work it out before drawing anything)
+
+        height = upper_bound_y - lower_bound_y
+        width = upper_bound_x - lower_bound_x
+
+        if height/width > 2.83:
+            new_width = math.ceil(1/2.83 * height)
+
+            right_x_pad = int(min((new_width - width), 130))
+            left_x_pad = int(max(0,(new_width - width - right_x_pad)))
+
+            top_y_pad = 0
+            bottom_y_pad = 0
+
+        else:
+            new_height = math.ceil(2.83 * width)
+
+            right_x_pad = 0
+            left_x_pad = 0
+
+            top_y_pad = int((new_height - height) / 2)
+            bottom_y_pad = int((new_height - height) / 2)
+
+        # everything up to here (filtering and framing) is worked out at full resolution, so a preview
+        # makes the same layout decisions - it only draws the result at PREVIEW_SCALE, measuring
+        # distances with draw_ypp so the yardages don't change
+        draw_scale = PREVIEW_SCALE if preview else 1.0
+        draw_ypp = ypp / draw_scale
+
+        # (and symbol_scale sizes the text, tree symbols and lines)
+        symbol_scale = draw_scale * (FIXED_SCALE_REFERENCE_YPP / ypp if yards_per_pixel is not None else 1.0)
+
+        # now we can make the final image (with the padding already in place), and draw straight into
+        # the part of it that the crop of the rotated image would have covered
+        padded_height = int(round((height + top_y_pad + bottom_y_pad) * draw_scale))
+        padded_width = int(round((width + left_x_pad + right_x_pad) * draw_scale))
+
+        top, left = int(round(top_y_pad * draw_scale)), int(round(left_x_pad * draw_scale))
+
+        if record:
+            padded_image = VectorCanvas(padded_width, padded_height, colors["rough"])
+            rotated_image = padded_image.region(left, top, int(round(width * draw_scale)), int(round(height * draw_scale)))
+        else:
+            padded_image = np.zeros((padded_height, padded_width, 3), np.uint8)
+            padded_image[:] = colors["rough"]
+
+            rotated_image = padded_image[top:top + int(round(height * draw_scale)), left:left + int(round(width * draw_scale))]
+
+        # shift everything so the top left of the crop is (0, 0) (and scale it down for a preview)
+        draw_matrix = np.dot(np.diag([draw_scale, draw_scale, 1.0]), getTranslationMatrix(-lower_bound_x, -lower_bound_y))
+
+        final_fairways = transformFeatures(final_fairways, draw_matrix)
+        final_tee_boxes = transformFeatures(final_tee_boxes, draw_matrix)
+        final_water_hazards = transformFeatures(final_water_hazards, draw_matrix)
+        final_sand_traps = transformFeatures(final_sand_traps, draw_matrix)
+        final_woods = transformFeatures(final_woods, draw_matrix)
+        final_trees = transformFeatures(final_trees, draw_matrix)
+        final_green_array = transformFeatures(final_green_array, draw_matrix)
+        adjusted_hole_array = transformFeatures(adjusted_hole_array, draw_matrix)
+        final_contours = transformFeatures(final_contours, draw_matrix)
+        final_tick_positions, final_tick_directions = transformTickData(final_tick_positions, final_tick_directions, draw_matrix)
+
+        # (contour ticks are only skipped if they'd have fallen off the whole rotated image)
+        tick_bounds = ((-lower_bound_x) * draw_scale, (-lower_bound_y) * draw_scale,
+                       (xmax - xmin - lower_bound_x) * draw_scale, (ymax - ymin - lower_bound_y) * draw_scale)
+
+
+
+        # finally, we can draw all of the features on our image (with specific colors for each)
+        # (each layer is cast to int32 and batched once, then filled in as few fillPoly calls as possible)
+
+        drawFeatures(rotated_image, PolygonLayer(final_fairways), colors["fairways"])
+        drawFeatures(rotated_image, PolygonLayer(final_tee_boxes), colors["tee boxes"])
+        drawFeatures(rotated_image, PolygonLayer(final_water_hazards), colors["water"])
+        drawFeatures(rotated_image, PolygonLayer(final_woods), colors["woods"])
+        drawFeatures(rotated_image, PolygonLayer(final_green_array), colors["greens"])
+
+        # drawing the sand traps and trees last so they aren't overlapped by fairways, etc.
+        drawFeatures(rotated_image, PolygonLayer(final_sand_traps), colors["sand"])
+
+        if include_trees:
+            drawTrees(rotated_image, final_trees, colors["trees"], canopy=tree_canopy,
+                      radius=int(round(TREE_RADIUS * symbol_scale)), thickness=max(1, int(round(TREE_THICKNESS * symbol_scale))))
+
+        # draw topography contour lines over terrain features, under distance text
+        # (a preview draws them straight on, without the translucent blend)
+        if include_topo and final_contours:
+            drawContourLines(rotated_image, final_contours, colors.get("topo", (0, 100, 180)),
+                             thickness=max(1, int(round(2 * symbol_scale))), alpha=1.0 if preview else 0.5)
+            if include_topo_labels and len(final_tick_positions) > 0:
+                drawContourTicks(rotated_image, final_tick_positions, final_tick_directions, colors.get("topo", (0, 100, 180)),
+                                 tick_length=12 * symbol_scale / draw_scale, bounds=tick_bounds)
+
+
         # using eventual height to get the text size and draw everything accordingly
 
 
@@ -2791,75 +5093,54 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
         # adjusting the font size to vary based on how tall the image is in pixels
         # this way, the lettering will look consistent across holes, even if one is
         # 500 yards and one is 100 yards (this used to be a problem)
+        # (at a fixed yards per pixel, every hole is already drawn to the same scale)
 
-        text_size = 1.5/3000*eventual_height
+        if yards_per_pixel is not None:
+            text_size = 1.5*symbol_scale
+        else:
+            text_size = 1.5/3000*eventual_height*draw_scale
         text_size = round(text_size,2)
 
 
         # for a par 3, all we need to do is give distances to the center of the green from the tee box
         if hole_par == 3:
 
-            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_tee_boxes, ypp, text_size, colors["text"], par_3_tees=1)
+            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_tee_boxes, draw_ypp, text_size, colors["text"], par_3_tees=1)
 
         # for longer holes, there's more to do:
         else:
 
             # draw the carry distance to all the sand traps and water hazards
-            right_carries, left_carries = drawCarryDistances(rotated_image, adjusted_hole_array, final_tee_boxes, final_sand_traps, ypp, text_size, colors["text"])
-            add_r, add_l = drawCarryDistances(rotated_image, adjusted_hole_array, final_tee_boxes, final_water_hazards, ypp, text_size, colors["text"])
+            right_carries, left_carries = drawCarryDistances(rotated_image, adjusted_hole_array, final_tee_boxes, final_sand_traps, draw_ypp, text_size, colors["text"])
+            add_r, add_l = drawCarryDistances(rotated_image, adjusted_hole_array, final_tee_boxes, final_water_hazards, draw_ypp, text_size, colors["text"])
 
             right_carries += add_r
             left_carries += add_l
 
             # if there aren't any sand traps or water hazards, draw something anyway to give the hole some scale
-            drawExtraCarries(rotated_image, adjusted_hole_array, final_tee_boxes, right_carries, left_carries, ypp, text_size, colors["text"])
+            drawExtraCarries(rotated_image, adjusted_hole_array, final_tee_boxes, right_carries, left_carries, draw_ypp, text_size, colors["text"])
 
             # now, draw distances to the center of the green from any notable features (like traps or hazards)
-            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_sand_traps, ypp, text_size, colors["text"])
-            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_water_hazards, ypp, text_size, colors["text"])
-            drawGreenDistancesMax(rotated_image, adjusted_hole_array, final_fairways, ypp, text_size, colors["text"])
+            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_sand_traps, draw_ypp, text_size, colors["text"])
+            drawGreenDistancesMin(rotated_image, adjusted_hole_array, final_water_hazards, draw_ypp, text_size, colors["text"])
+            drawGreenDistancesMax(rotated_image, adjusted_hole_array, final_fairways, draw_ypp, text_size, colors["text"])
             if include_trees:
-                drawGreenDistancesTree(rotated_image, adjusted_hole_array, final_trees, ypp, text_size, colors["text"])
+                drawGreenDistancesTree(rotated_image, adjusted_hole_array, final_trees, draw_ypp, text_size, colors["text"])
 
             # finally, draw arcs on the fairway every 50 yards from the center of the green
-            drawGreenDistancesAnyWaypoint(rotated_image, adjusted_hole_array, ypp, 50, text_size, colors["text"])
-
-
-
-
-        # now, we need to do a second round of padding to make the aspect ratio work
-        # in case we ran out of room with our earlier efforts
-
-        cropped_image = rotated_image[lower_bound_y:upper_bound_y, lower_bound_x:upper_bound_x]
+            drawGreenDistancesAnyWaypoint(rotated_image, adjusted_hole_array, draw_ypp, 50, text_size, colors["text"])
 
-        height = upper_bound_y - lower_bound_y
-        width = upper_bound_x - lower_bound_x
-
-        if height/width > 2.83:
-            new_width = math.ceil(1/2.83 * height)
-
-            right_x_pad = int(min((new_width - width), 130))
-            left_x_pad = int(max(0,(new_width - width - right_x_pad)))
-
-            top_y_pad = 0
-            bottom_y_pad = 0
-
-        else:
-            new_height = math.ceil(2.83 * width)
-
-            right_x_pad = 0
-            left_x_pad = 0
-
-            top_y_pad = int((new_height - height) / 2)
-            bottom_y_pad = int((new_height - height) / 2)
 
-        padded_image = cv2.copyMakeBorder(cropped_image,top_y_pad,bottom_y_pad,left_x_pad,right_x_pad, cv2.BORDER_CONSTANT, value=colors["rough"])
 
 
         # save the image file to the output folder
-        cv2.imwrite(("output/" + file_name), padded_image)
+        saveImage(padded_image, output_dir + "/" + file_name)
         print("Yardage book created for hole",hole_num)
 
+        # previews skip the green close-ups
+        if preview:
+            continue
+
 
 
 
@@ -2874,81 +5155,48 @@ def generateYardageBook(latmin,lonmin,latmax,lonmax,replace_existing,colors,filt
 
 
         # this time, we want to rotate the green (and everythign else) to be aligned front to back
-        angle = getMidpointAngle(translateNodestoNP(hole_way_nodes,hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim))
-
-
-        # again, we need to rotate everything, including the green and hole waypoints
-        rotated_fairways = rotateArrayList(image,fairways,angle)
-        rotated_tee_boxes = rotateArrayList(image,tee_boxes,angle)
-        rotated_water_hazards = rotateArrayList(image,water_hazards,angle)
-        rotated_sand_traps = rotateArrayList(image,sand_traps,angle)
-        rotated_woods = rotateArrayList(image,woods,angle)
-        rotated_contours = rotateArrayList(image,raw_contours,angle)
-        rot_tick_pos_green, rot_tick_dir_green = rotateTickData(image, raw_tick_positions, raw_tick_directions, angle)
+        angle = getMidpointAngle(way_node_array)
 
-        rotated_green = rotateArray(image,green_array,angle)
-        rotated_green_array = [rotated_green]
 
-        way_node_array = translateNodestoNP(hole_way_nodes, hole_minlat, hole_minlon, hole_maxlat, hole_maxlon, x_dim, y_dim)
-        rotated_waypoints = rotateArray(image,way_node_array,angle)
+        # work out where the rotated image would sit (only the window around the green gets drawn)
+        ymin, xmin, ymax, xmax = getRotatedBounds(image_shape, angle)
 
+        # again, we need to transform everything, including the green and hole waypoints (from the same buffer)
+        view = np.dot(getTranslationMatrix(-xmin, -ymin), getRotationMatrix(image_shape, angle))
 
-        # and again, we want to filter out anything that isn't close by and relevant
-        filtered_fairways = filterArrayList(rotated_waypoints, rotated_fairways, ypp, hole_par, fairway=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor, draw_all_fairways=draw_all_fairways)
-        filtered_tee_boxes = filterArrayList(rotated_waypoints, rotated_tee_boxes, ypp, hole_par, tee_box=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
-        filtered_water_hazards = filterArrayList(rotated_waypoints, rotated_water_hazards, ypp, hole_par, filter_yards=None)
-        filtered_sand_traps = filterArrayList(rotated_waypoints, rotated_sand_traps, ypp, hole_par, filter_yards=None)
-        filtered_woods = filterArrayList(rotated_waypoints, rotated_woods, ypp, hole_par, filter_yards=None)
-
-
-        # time to make a new image
-        rotated_image, ymin, xmin, ymax, xmax = getNewImage(image,angle,colors["rough"])
-
-        # rotate the elevation image to match the green image orientation (if available)
-        rotated_elev_green = None
-        if include_topo and elev_img is not None:
-            rotated_elev_green = rotateElevationImage(elev_img, image, angle, ymin, xmin, ymax, xmax)
+        (final_fairways, final_tee_boxes, final_water_hazards, final_sand_traps, final_woods, n1,
+            final_green_array, adjusted_hole_array) = source.transform(np.dot(view, frame.pixelMatrix()))
 
-        final_fairways, fw_minx, fw_miny, fw_maxx, fw_maxy = adjustRotatedFeatures(filtered_fairways, ymin, xmin)
-        final_tee_boxes, tb_minx, tb_miny, tb_maxx, tb_maxy = adjustRotatedFeatures(filtered_tee_boxes, ymin, xmin)
-        final_water_hazards, n1, n2, n3, n4 = adjustRotatedFeatures(filtered_water_hazards, ymin, xmin)
-        final_woods, n1, n2, n3, n4 = adjustRotatedFeatures(filtered_woods, ymin, xmin)
-        final_contours_green, n1, n2, n3, n4 = adjustRotatedFeatures(rotated_contours, ymin, xmin)
-        final_tick_pos_green, final_tick_dir_green = adjustTickData(rot_tick_pos_green, rot_tick_dir_green, xmin, ymin)
+        adjusted_waypoints = adjusted_hole_array[0]
 
 
-        final_green_array, g_minx, g_miny, g_maxx, g_maxy = adjustRotatedFeatures(rotated_green_array, ymin, xmin)
-        # green_nds = np.int32([rotated_green_array]) # bug in fillPoly - needs explicit cast to 32bit
-        # cv2.fillPoly(image, green_nds, (155,242,161))
-
-        final_sand_traps, st_minx, st_miny, st_maxx, st_maxy = adjustRotatedFeatures(filtered_sand_traps, ymin, xmin)
-
-        adjusted_hole_array, n1, n2, n3, n4 = adjustRotatedFeatures([rotated_waypoints], ymin, xmin)
+        # and again, we want to filter out anything that isn't close by and relevant
+        final_fairways = filterArrayList(adjusted_waypoints, final_fairways, ypp, hole_par, fairway=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor, draw_all_fairways=draw_all_fairways)
+        final_tee_boxes = filterArrayList(adjusted_waypoints, final_tee_boxes, ypp, hole_par, tee_box=1, filter_yards=filter_width, small_filter=short_factor, med_filter=med_factor)
 
 
         # we're going to draw everything in black and white this time for a different style
-        bw_green_image = rotated_image
-        bw_green_image[:] = (255,255,255)
-
-        drawFeatures(bw_green_image, final_fairways, (235, 235, 235))
-        drawFeatures(bw_green_image, final_tee_boxes, (195, 195, 195))
-        drawFeatures(bw_green_image, final_water_hazards, (180,180,180))
-        drawFeatures(bw_green_image, final_woods, (180,180,180))
-        drawFeatures(bw_green_image, final_green_array, (255, 255, 255), line=2)
-        drawFeatures(bw_green_image, final_sand_traps, (210,210,210))
+        green_layers = [(final_fairways, (235, 235, 235), -1),
+                        (final_tee_boxes, (195, 195, 195), -1),
+                        (final_water_hazards, (180,180,180), -1),
+                        (final_woods, (180,180,180), -1),
+                        (final_green_array, (255, 255, 255), 2),
+                        (final_sand_traps, (210,210,210), -1)]
 
         # we also want to overlay a 3-yard grid to show how large the green is
         # and to make it easier to figure out carry distances to greenside bunkers
-        green_grid = getGreenGrid(bw_green_image, adjusted_hole_array, ypp,
-                                  elev_img=rotated_elev_green,
-                                  green_topo_style=green_topo_style,
-                                  green_topo_color=colors.get("topo", (80, 80, 80)),
-                                  green_arrow_color=colors.get("green_arrow"),
-                                  green_topo_interval=green_topo_interval,
-                                  green_topo_scale_m=green_topo_scale_m,
-                                  green_poly=final_green_array[0] if final_green_array else None)
-
-        cv2.imwrite(("greens/" + file_name), green_grid)
+        green_grid = renderGreenView(green_layers, adjusted_hole_array, ypp,
+                                     elev_img=elev_img if include_topo else None,
+                                     elev_matrix=np.dot(view, elev_matrix),
+                                     green_topo_style=green_topo_style,
+                                     green_topo_color=colors.get("topo", (80, 80, 80)),
+                                     green_arrow_color=colors.get("green_arrow"),
+                                     green_topo_interval=green_topo_interval,
+                                     green_topo_scale_m=green_topo_scale_m,
+                                     green_poly=final_green_array[0] if final_green_array else None,
+                                     vector=vector)
+
+        saveImage(green_grid, "greens/" + file_name)
         print("Green image created for hole",hole_num)
 
     # print('Complete: ', datetime.now().time())